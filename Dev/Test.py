@@ -1,16 +1,17 @@
 import requests
 import time
 import schedule
-import socket
-import ssl
 import hashlib
 import os
-from urllib.parse import urlparse
-from bs4 import BeautifulSoup
-from datetime import datetime
-from PIL import Image
-import imagehash
-from io import BytesIO
+import sys
+import asyncio
+
+# the probes are shared with the Dev_Fabric service; put it on the path so this
+# script runs straight from a checkout (or run it with PYTHONPATH=Dev_Fabric)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dev_Fabric"))
+from modules.http_prober import probe_sync
+from modules.content_scanner import ContentScanner, probe_paths
+from modules.screenshots import perceptual_hash, hamming
 
 # === CONFIGURATION ===
 WEBSITE_URL = "https://notionhive.com"
@@ -45,67 +46,22 @@ def load_or_create_baseline(html):
     with open(BASELINE_HASH_FILE, "r") as f:
         return f.read().strip()
 
-def scan_for_threats(html):
-    red_flags = [
-        "hacked by", "defaced", "shell", "rooted",
-        "<iframe", "eval(", "atob(", "Base64", "bitcoin",
-        "document.write(unescape", "onerror=", "malware", "phish"
-    ]
-    found = False
-    for flag in red_flags:
-        if flag.lower() in html.lower():
-            print(f"❗ Suspicious content detected: '{flag}'")
-            found = True
-    return found
-
-def find_unexpected_links(html, allowed_domains):
-    soup = BeautifulSoup(html, "html.parser")
-    links = soup.find_all("a", href=True)
-    for link in links:
-        href = link["href"]
-        domain = urlparse(href).netloc
-        if domain and all(allowed not in domain for allowed in allowed_domains):
-            print(f"⚠️ Unexpected external link: {href}")
-
-def check_dns():
-    try:
-        host = urlparse(WEBSITE_URL).netloc
-        ip = socket.gethostbyname(host)
-        print(f"🌐 DNS resolved: {host} → {ip}")
-        return True
-    except Exception as e:
-        print(f"❌ DNS resolution failed: {e}")
-        return False
+def scan_for_threats(scanner):
+    hits = scanner.indicators.hits
+    for flag, hit in hits.items():
+        print(f"❗ Suspicious content detected: '{flag}' x{hit['count']} near: {hit['sample']!r}")
+    return bool(hits)
 
-def check_ssl():
-    try:
-        host = urlparse(WEBSITE_URL).netloc
-        context = ssl.create_default_context()
-        with socket.create_connection((host, 443), timeout=5) as sock:
-            with context.wrap_socket(sock, server_hostname=host) as ssock:
-                cert = ssock.getpeercert()
-                expire_date = datetime.strptime(cert['notAfter'], "%b %d %H:%M:%S %Y %Z")
-                days_left = (expire_date - datetime.utcnow()).days
-                print(f"🔒 SSL valid, expires in {days_left} days")
-                if days_left < 15:
-                    print("⚠️ SSL certificate expiring soon!")
-        return True
-    except Exception as e:
-        print(f"❌ SSL check failed: {e}")
-        return False
+def find_unexpected_links(scanner):
+    for href in scanner.links.external():
+        print(f"⚠️ Unexpected external link: {href}")
 
 def check_suspicious_endpoints():
     suspicious_paths = [
         "/shell.php", "/adminer.php", "/phpinfo.php", "/wp-content/uploads/malicious.js"
     ]
-    for path in suspicious_paths:
-        try:
-            url = WEBSITE_URL.rstrip("/") + path
-            res = requests.get(url, headers=DEFAULT_HEADERS, timeout=5)
-            if res.status_code == 200:
-                print(f"❗ Suspicious file accessible: {url}")
-        except:
-            continue
+    for res in asyncio.run(probe_paths(WEBSITE_URL, suspicious_paths, headers=DEFAULT_HEADERS)):
+        print(f"❗ Suspicious file accessible: {res['url']}")
 
 def download_screenshot_phantomjscloud(url, output_path):
     api_url = (
@@ -139,37 +95,51 @@ def compare_screenshots():
         os.rename(SCREENSHOT_CURRENT, SCREENSHOT_BASELINE)
         print("📷 Baseline screenshot saved.")
         return False
-    hash1 = imagehash.average_hash(Image.open(SCREENSHOT_BASELINE))
-    hash2 = imagehash.average_hash(Image.open(SCREENSHOT_CURRENT))
-    diff = hash1 - hash2
-    print(f"🖼️ Screenshot difference hash: {diff}")
-    return diff > 10
+    dist = hamming(perceptual_hash(SCREENSHOT_BASELINE), perceptual_hash(SCREENSHOT_CURRENT))
+    print(f"🖼️ Screenshot difference hash: {dist[0]} (worst region: {dist[1:].max()})")
+    return dist[0] > 10
 
 # === MAIN CHECK ===
 def check_website():
     print(f"\n[{time.ctime()}] Checking {WEBSITE_URL}")
-    dns_ok = check_dns()
-    ssl_ok = check_ssl()
+
+    # one connection gives DNS, TLS expiry, timings and the streamed body
+    chunks = []
+    scanner = ContentScanner(WEBSITE_URL, ALLOWED_DOMAINS)
+
+    def on_chunk(chunk):
+        chunks.append(chunk)
+        scanner.feed(chunk)
+
+    res = probe_sync(WEBSITE_URL, keyword=EXPECTED_KEYWORD, ignore_case=True, timeout=10, follow_redirects=5,
+                     headers=DEFAULT_HEADERS, on_chunk=on_chunk)
+    t = res["timings_ms"]
+    if res.get("error"):
+        print(f"❌ Website check failed: {res['error']}")
+        return
+    print(f"🌐 DNS resolved → {res.get('ip')} ({t['dns']} ms)")
+    if res.get("tls"):
+        days_left = res["tls"]["days_left"]
+        print(f"🔒 SSL valid, expires in {days_left} days (handshake {t['tls']} ms)")
+        if days_left < 15:
+            print("⚠️ SSL certificate expiring soon!")
 
     try:
-        start = time.time()
-        response = requests.get(WEBSITE_URL, headers=DEFAULT_HEADERS, timeout=10)
-        duration = round(time.time() - start, 2)
-
-        if response.status_code == 200:
-            print(f"✅ Site is UP. Response time: {duration}s")
-            html = response.text
-        elif response.status_code == 403:
+        duration = round(t["total"] / 1000, 2)
+        html = b"".join(chunks).decode("utf-8", errors="ignore")
+
+        if res["status"] == 200:
+            print(f"✅ Site is UP. Response time: {duration}s (TTFB {t['ttfb']} ms)")
+        elif res["status"] == 403:
             print("🚫 Site is UP but access is restricted (403 Forbidden) — skipping content checks.")
-            html = response.text
         else:
-            print(f"❌ Unexpected HTTP status: {response.status_code}")
+            print(f"❌ Unexpected HTTP status: {res['status']}")
             return
 
         if duration > RESPONSE_TIME_THRESHOLD:
             print(f"⚠️ Site is slow (> {RESPONSE_TIME_THRESHOLD}s)")
 
-        if EXPECTED_KEYWORD.lower() in html.lower():
+        if res.get("keyword_present"):
             print(f"🧠 Keyword '{EXPECTED_KEYWORD}' found.")
         else:
             print("❗ Expected keyword missing — page might have changed.")
@@ -179,8 +149,8 @@ def check_website():
         if current_hash != baseline_hash:
             print("⚠️ Page hash mismatch — possible defacement!")
 
-        scan_for_threats(html)
-        find_unexpected_links(html, ALLOWED_DOMAINS)
+        scan_for_threats(scanner)
+        find_unexpected_links(scanner)
         check_suspicious_endpoints()
 
         if download_screenshot_phantomjscloud(WEBSITE_URL, SCREENSHOT_CURRENT):
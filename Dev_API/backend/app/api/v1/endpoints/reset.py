@@ -1,10 +1,15 @@
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, HTTPException
+from sqlalchemy import update
 from app.schemas.reset import ResetRequest, ResetResponse
-from app.workers.tasks import reset_droplet_task
+from app.workers.tasks import reset_droplet_task, celery_app
 import os
 import time
 from app.core.config import settings
-from app.services.reset_service import ResetService
+from app.db.log_writer import TaskLogWriter
+from app.db.models.task_log import TaskStatus
+from app.db.session import SessionLocal
+from app.services.reset_service import ResetService, schedule_inline, cancel_inline
 from uuid import uuid4
 
 SECRET_APPROVAL_TOKEN = os.getenv("APPROVAL_TOKEN", "dev-token")
@@ -16,6 +21,13 @@ def _verify_token(token: str) -> bool:
     expected = settings.approval_token or "dev-token"
     return token == expected
 
+def _scheduled(task_id: str, req: dict, grace: int):
+    eta = datetime.now(timezone.utc) + timedelta(seconds=grace)
+    with TaskLogWriter() as logs:
+        logs.log(task_id, "SCHEDULED", f"Kill-switch window: destructive phase starts at {eta.isoformat()}",
+                 {"eta": eta.isoformat(), "host": req.get("host")})
+    return eta
+
 @router.post("/", response_model=ResetResponse)
 def reset_droplet(req: ResetRequest):
     if req.confirm_text != "RESET":
@@ -24,13 +36,58 @@ def reset_droplet(req: ResetRequest):
         raise HTTPException(status_code=403, detail="Invalid or expired approval token")
 
     use_celery = str(os.getenv("USE_CELERY", "true")).strip().lower() == "true"
+    # force skips the kill-switch window
+    grace = 0 if req.force else max(0, settings.reset_grace_seconds)
 
     if not use_celery:
-        task_id = f"inline-{int(time.time())}"
-        svc = ResetService()
-        svc.execute(task_id, req.model_dump())
-        return ResetResponse(task_id=task_id, message="Executed inline")
+        task_id = f"inline-{int(time.time())}-{uuid4().hex[:8]}"
+        if not grace:
+            svc = ResetService()
+            svc.execute(task_id, req.model_dump())
+            return ResetResponse(task_id=task_id, message="Executed inline")
+        eta = _scheduled(task_id, req.model_dump(), grace)
+        schedule_inline(task_id, req.model_dump(), grace)
+        return ResetResponse(task_id=task_id,
+                             message=f"Reset scheduled for {eta.isoformat()}; POST /reset/{task_id}/cancel to abort")
 
     # Only runs if USE_CELERY=true
-    task = reset_droplet_task.apply_async(args=[req.model_dump()])
-    return ResetResponse(task_id=task.id, message="Reset task queued")
\ No newline at end of file
+    if not grace:
+        task = reset_droplet_task.apply_async(args=[req.model_dump()])
+        return ResetResponse(task_id=task.id, message="Reset task queued")
+
+    # the worker holds the message until the countdown expires; no slot is used meanwhile
+    task_id = str(uuid4())
+    eta = _scheduled(task_id, req.model_dump(), grace)
+    reset_droplet_task.apply_async(args=[req.model_dump()], task_id=task_id, countdown=grace)
+    return ResetResponse(task_id=task_id,
+                         message=f"Reset scheduled for {eta.isoformat()}; POST /reset/{task_id}/cancel to abort")
+
+@router.post("/{task_id}/cancel", response_model=ResetResponse)
+def cancel_reset(task_id: str):
+    # SCHEDULED -> CANCELLED only if the worker has not claimed it (-> RUNNING) yet;
+    # both sides use a conditional UPDATE, so exactly one of them wins
+    db = SessionLocal()
+    try:
+        res = db.execute(update(TaskStatus)
+                         .where(TaskStatus.task_id == task_id, TaskStatus.status == "SCHEDULED")
+                         .values(status="CANCELLED", message="Cancelled during kill-switch window",
+                                 updated_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+        db.commit()
+        row = None if res.rowcount else db.get(TaskStatus, task_id)
+    finally:
+        db.close()
+    if not res.rowcount:
+        if row is None:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if row.status == "CANCELLED":
+            return ResetResponse(task_id=task_id, message="Already cancelled")
+        raise HTTPException(status_code=409, detail=f"Too late to cancel: task is {row.status}")
+
+    # log line for the history; the status row is already CANCELLED
+    with TaskLogWriter() as logs:
+        logs.log(task_id, "CANCELLED", "Cancelled during kill-switch window")
+    if task_id.startswith("inline-"):
+        cancel_inline(task_id)
+    else:
+        celery_app.control.revoke(task_id)
+    return ResetResponse(task_id=task_id, message="Reset cancelled")
@@ -1,19 +1,32 @@
+from typing import Any
+from datetime import datetime
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from app.db.models.task_log import TaskLog
-from app.db.session import get_session
+from app.db.models.task_log import TaskLog, TaskStatus
+from app.db.session import get_async_session
 
 router = APIRouter()
 
 class TaskStatusResponse(BaseModel):
     task_id: str
     status: str
-    output: str | None
+    output: Any = None
+    message: str | None = None
+    updated_at: datetime | None = None
 
 @router.get("/status/{task_id}", response_model=TaskStatusResponse, tags=["Status"])
-def get_task_status(task_id: str, db: Session = Depends(get_session)):
-    task = db.query(TaskLog).filter(TaskLog.task_id == task_id).first()
+async def get_task_status(task_id: str, db: AsyncSession = Depends(get_async_session)):
+    # O(1): primary-key lookup in the materialized latest-status table
+    task = await db.get(TaskStatus, task_id)
+    if task is None:
+        # rows written before task_status existed: newest log row via (task_id, created_at)
+        task = (await db.execute(
+            select(TaskLog).where(TaskLog.task_id == task_id)
+            .order_by(TaskLog.created_at.desc(), TaskLog.id.desc()).limit(1)
+        )).scalar_one_or_none()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return TaskStatusResponse(task_id=task.task_id, status=task.status, output=task.output)
\ No newline at end of file
+    return TaskStatusResponse(task_id=task.task_id, status=task.status, output=task.output,
+                              message=task.message, updated_at=task.updated_at)
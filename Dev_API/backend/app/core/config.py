@@ -31,6 +31,8 @@ class Settings(BaseSettings):
 
     # ---------- Reset ----------
     approval_token: str | None = Field(default=None, alias="APPROVAL_TOKEN")
+    # seconds a non-forced reset waits (cancellable) before the destructive phase
+    reset_grace_seconds: int = Field(default=30, alias="RESET_GRACE_SECONDS")
 
     model_config = SettingsConfigDict(
         env_file=(".env",),
@@ -0,0 +1,158 @@
+# app/db/log_writer.py
+import logging
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.db.models.task_log import TaskLog, TaskStatus
+from app.db.session import SessionLocal
+
+# Statuses that end a task: flushed immediately so pollers see them at once.
+TERMINAL_STATUSES = {"SUCCESS", "ERROR", "CANCELLED", "completed", "failed"}
+
+log = logging.getLogger(__name__)
+
+
+def _upsert_status(dialect: str):
+    """INSERT ... ON CONFLICT (task_id) DO UPDATE for Postgres/SQLite."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(TaskStatus)
+
+
+class TaskLogWriter:
+    """
+    Buffers TaskLog rows and writes them in one transaction per batch:
+    a bulk INSERT into task_logs plus one upsert per task into task_status.
+    Flushes when `batch_size` rows are pending, on a task's first line and
+    terminal statuses, on close(), and at most `flush_interval` seconds after a
+    line was buffered: a timer thread flushes while the caller is blocked
+    (e.g. in a long SSH command) and not calling log().
+
+        with TaskLogWriter() as logs:
+            logs.log(task_id, "START", "Reset requested", req)
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = 50, flush_interval: float = 2.0):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rows: List[Dict[str, Any]] = []
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._counts: Dict[str, int] = {}
+        self._seen: set = set()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # held for a whole flush: a timer flush and a flush from log() must not
+        # commit out of order (an older RUNNING upsert landing after SUCCESS)
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def log(self, task_id: str, status: str, message: Optional[str] = None,
+            meta: Optional[Dict[str, Any]] = None, output: Any = None):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        row = {"task_id": task_id, "status": status, "message": message, "meta": meta or {},
+               "output": output, "created_at": now, "updated_at": now}
+        with self._lock:
+            self._rows.append(row)
+            self._counts[task_id] = self._counts.get(task_id, 0) + 1
+            first = task_id not in self._seen
+            self._seen.add(task_id)
+            prev = self._latest.get(task_id)
+            self._latest[task_id] = {"task_id": task_id, "status": status, "message": message,
+                                     # keep the last non-empty output for the task
+                                     "output": output if output is not None else (prev or {}).get("output"),
+                                     "updated_at": now}
+            due = (len(self._rows) >= self.batch_size
+                   or first                              # task shows up in /status at once
+                   or status in TERMINAL_STATUSES
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            if not due and self._timer is None and self.flush_interval > 0:
+                self._timer = threading.Timer(self.flush_interval, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            log.exception("task log flush failed")
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            rows, latest, counts = self._rows, self._latest, self._counts
+            self._rows, self._latest, self._counts = [], {}, {}
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not rows:
+            return
+        db = None
+        try:
+            db = self._session_factory()
+            db.execute(insert(TaskLog), rows)
+            stmt = _upsert_status(db.get_bind().dialect.name)
+            for task_id, st in latest.items():
+                if stmt is not None:
+                    values = {**st, "log_count": counts[task_id], "created_at": st["updated_at"]}
+                    update = {"status": st["status"], "message": st["message"], "updated_at": st["updated_at"],
+                              "log_count": TaskStatus.log_count + counts[task_id]}
+                    if st["output"] is not None:
+                        update["output"] = st["output"]
+                    db.execute(stmt.values(**values).on_conflict_do_update(index_elements=["task_id"], set_=update))
+                else:
+                    obj = db.get(TaskStatus, task_id) or TaskStatus(task_id=task_id, log_count=0,
+                                                                    created_at=st["updated_at"])
+                    obj.status, obj.message = st["status"], st["message"]
+                    obj.updated_at = st["updated_at"]
+                    if st["output"] is not None:
+                        obj.output = st["output"]
+                    obj.log_count = (obj.log_count or 0) + counts[task_id]
+                    db.add(obj)
+            db.commit()
+        except Exception:
+            if db is not None:
+                db.rollback()
+            self._requeue(rows, latest, counts)
+            raise
+        finally:
+            if db is not None:
+                db.close()
+
+    def _requeue(self, rows, latest, counts):
+        """Put a batch that failed to commit back in front of what was logged since."""
+        with self._lock:
+            self._rows = rows + self._rows
+            for task_id, n in counts.items():
+                self._counts[task_id] = self._counts.get(task_id, 0) + n
+            for task_id, st in latest.items():
+                newer = self._latest.get(task_id)
+                if newer is None:
+                    self._latest[task_id] = st
+                elif newer["output"] is None and st["output"] is not None:
+                    newer["output"] = st["output"]
+        log.warning("task log flush failed; %d rows kept for the next flush", len(rows))
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
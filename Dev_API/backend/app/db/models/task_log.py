@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, func
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 
@@ -6,6 +6,10 @@ Base = declarative_base()
 
 class TaskLog(Base):
     __tablename__ = "task_logs"
+    __table_args__ = (
+        # "latest row for a task" = one backwards index scan
+        Index("ix_task_logs_task_id_created_at", "task_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)   # New PK
     task_id = Column(String, index=True, nullable=False) # No longer PK
@@ -14,4 +18,17 @@ class TaskLog(Base):
     meta = Column(JSONB, default=dict, nullable=False)   # JSONB for Postgres
     output = Column(JSONB)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
-    updated_at = Column(DateTime, onupdate=func.now(), server_default=func.now(), nullable=False)
\ No newline at end of file
+    updated_at = Column(DateTime, onupdate=func.now(), server_default=func.now(), nullable=False)
+
+
+class TaskStatus(Base):
+    """Latest status per task (upserted by TaskLogWriter) so polling is a PK lookup."""
+    __tablename__ = "task_status"
+
+    task_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    message = Column(Text)
+    output = Column(JSONB)
+    log_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, onupdate=func.now(), server_default=func.now(), nullable=False)
@@ -1,8 +1,12 @@
-from typing import Iterator
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from app.core.config import settings
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
 # Engine & factory
 engine = create_engine(settings.database_url, future=True)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
@@ -13,4 +17,32 @@ def get_session() -> Iterator[Session]:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# ---------- Async path (status polling etc.) ----------
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+", 1)[0]
+    if base == "postgresql":
+        # asyncpg takes ssl=..., not libpq's sslmode/channel_binding
+        rest = rest.replace("sslmode=require", "ssl=require").replace("&channel_binding=require", "")
+    return f"{_ASYNC_DRIVERS.get(base, scheme)}{sep}{rest}"
+
+
+@lru_cache(maxsize=1)
+def get_async_sessionmaker():
+    """Created on first use so the sync-only worker never needs asyncpg/aiosqlite."""
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(_async_url(settings.database_url), pool_pre_ping=True)
+    return async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+# ➜ Use this in async endpoints via Depends(get_async_session)
+async def get_async_session() -> AsyncIterator["AsyncSession"]:
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -18,7 +18,10 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     from app.db.session import engine
-    from app.db.models.task_log import Base  # the Base defined in your model file
+    from app.db.models.task_log import Base, TaskLog  # the Base defined in your model file
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes added to tables that already exist
+    for index in TaskLog.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
\ No newline at end of file
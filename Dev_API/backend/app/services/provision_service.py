@@ -1,5 +1,5 @@
 import os
-from app.utils.ssh_utils import ssh_connect, ssh_run_command, ssh_upload_file
+from app.utils.ssh_utils import ssh_connect, ssh_run_command, ssh_stream_command, ssh_upload_file
 from app.core.logger import setup_logger
 
 logger = setup_logger("provision_service")
@@ -33,8 +33,14 @@ def run_provision_script(
         if domain:
             command += f" {domain}"
 
-        output = ssh_run_command(client, command)
-        logger.info("Provisioning complete.")
-        return output
+        # stream the (long, chatty) script output instead of buffering it all
+        result = ssh_stream_command(
+            client, command,
+            on_stdout=lambda line: logger.debug(f"[{ssh_host}] {line}"),
+            on_stderr=lambda line: logger.warning(f"[{ssh_host}] {line}"),
+        )
+        logger.info(f"Provisioning complete (exit={result.exit_code}, {result.duration_s}s, "
+                    f"{result.stdout_bytes} bytes of output).")
+        return result.output
     finally:
         client.close()
\ No newline at end of file
@@ -1,22 +1,32 @@
 import os
 import time
 import tempfile
-from typing import Dict, Any
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
 
+from sqlalchemy import update
+
+from app.db.log_writer import TaskLogWriter
+from app.db.models.task_log import TaskStatus
 from app.db.session import SessionLocal
-from app.db.models.task_log import TaskLog
-from app.utils.ssh_utils import ssh_connect, ssh_run_command, ssh_upload_file
+from app.utils.ssh_utils import ssh_connect, ssh_run_command, ssh_stream_command, ssh_upload_file
 
 
 class ResetService:
     def execute(self, task_id: str, req: Dict[str, Any]):
-        db = SessionLocal()
+        db = TaskLogWriter()
         try:
-            self._log(db, task_id, "START", "Reset requested", req)
+            # the kill-switch window is the countdown this task was scheduled with;
+            # revoke() is best-effort, so the worker and /cancel race for the
+            # SCHEDULED row with conditional UPDATEs and exactly one of them wins
+            state = self.claim(task_id)
+            if state == "CANCELLED":
+                return {"mode": req.get("mode", "cleanup"), "cancelled": True}
+            if state is not None:
+                return {"mode": req.get("mode", "cleanup"), "skipped": True, "status": state}
 
-            if not req.get("force", False):
-                self._log(db, task_id, "INFO", "Kill-switch wait 30s before destructive phase")
-                time.sleep(30)
+            self._log(db, task_id, "START", "Reset requested", req)
 
             # Locate the .sh file in the backend root
             project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -46,10 +56,16 @@ class ResetService:
                 ssh_run_command(client, f"chmod +x {remote_script}")
 
                 dry_run_env = "true" if req.get("dry_run", True) else "false"
-                output = ssh_run_command(client, f"DRY_RUN={dry_run_env} sudo {remote_script}")
+                result = ssh_stream_command(client, f"DRY_RUN={dry_run_env} sudo {remote_script}")
+                output = result.output
+                meta = {"output": output, "exit_code": result.exit_code,
+                        "duration_s": result.duration_s, "truncated": result.truncated}
 
-                self._log(db, task_id, "SUCCESS", "Cleanup completed", {"output": output})
-                return {"mode": "cleanup", "output": output}
+                if not result.ok:
+                    self._log(db, task_id, "ERROR", f"Cleanup script exited with {result.exit_code}", meta)
+                    return {"mode": "cleanup", "output": output, "exit_code": result.exit_code}
+                self._log(db, task_id, "SUCCESS", "Cleanup completed", meta)
+                return {"mode": "cleanup", "output": output, "exit_code": result.exit_code}
 
             finally:
                 try:
@@ -64,9 +80,59 @@ class ResetService:
         except Exception as e:
             self._log(db, task_id, "ERROR", str(e))
             raise
+        finally:
+            db.close()  # flushes anything still buffered
+
+    @staticmethod
+    def claim(task_id: str) -> Optional[str]:
+        """
+        SCHEDULED -> RUNNING in one conditional UPDATE. None when the reset may
+        run (claimed, or never had a kill-switch window); otherwise the status
+        that stops it (CANCELLED, or a duplicate delivery of a started task).
+        """
+        db = SessionLocal()
+        try:
+            res = db.execute(update(TaskStatus)
+                             .where(TaskStatus.task_id == task_id, TaskStatus.status == "SCHEDULED")
+                             .values(status="RUNNING",
+                                     updated_at=datetime.now(timezone.utc).replace(tzinfo=None)))
+            db.commit()
+            if res.rowcount:
+                return None
+            row = db.get(TaskStatus, task_id)
+            return None if row is None else row.status
         finally:
             db.close()
 
     def _log(self, db, task_id, status, message, meta=None):
-        db.add(TaskLog(task_id=task_id, status=status, message=message, meta=meta or {}))
-        db.commit()
\ No newline at end of file
+        db.log(task_id, status, message, meta)
+
+# ---------- Inline (USE_CELERY=false) kill-switch window ----------
+_pending_lock = threading.Lock()
+_pending: Dict[str, threading.Timer] = {}
+
+
+def schedule_inline(task_id: str, req: Dict[str, Any], delay: float) -> None:
+    """Run ResetService.execute after `delay` seconds on a timer thread (cancellable)."""
+    def _run():
+        with _pending_lock:
+            _pending.pop(task_id, None)
+        try:
+            ResetService().execute(task_id, req)
+        except Exception:
+            pass  # already recorded as an ERROR log by execute()
+
+    timer = threading.Timer(delay, _run)
+    timer.daemon = True
+    with _pending_lock:
+        _pending[task_id] = timer
+    timer.start()
+
+
+def cancel_inline(task_id: str) -> bool:
+    with _pending_lock:
+        timer = _pending.pop(task_id, None)
+    if timer is None:
+        return False
+    timer.cancel()
+    return True
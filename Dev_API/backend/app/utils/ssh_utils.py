@@ -1,5 +1,9 @@
 import paramiko
+import select
 import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
 
 
 def ssh_connect(host: str, username: str, password: str) -> paramiko.SSHClient:
@@ -19,24 +23,157 @@ def ssh_connect(host: str, username: str, password: str) -> paramiko.SSHClient:
     return client
 
 
+@dataclass
+class CommandResult:
+    command: str
+    exit_code: int | None                 # None if the command timed out / channel died
+    stdout: str                           # retained output (head + tail when truncated)
+    stderr: str
+    stdout_bytes: int = 0                 # total bytes seen, retained or not
+    stderr_bytes: int = 0
+    truncated: bool = False
+    timed_out: bool = False
+    started_at: float = 0.0
+    duration_s: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+    @property
+    def output(self) -> str:
+        """Legacy ssh_run_command() shape: stdout, then stderr on a new line."""
+        out, err = self.stdout.strip(), self.stderr.strip()
+        return out + ("\n" + err if err else "")
+
+
+class _LineBuffer:
+    """Splits a byte stream into lines; keeps the first `head` and last `tail` lines."""
+
+    def __init__(self, head: int, tail: int, callback: Callable[[str], None] | None):
+        self.head: list[str] = []
+        self.tail: deque[str] = deque(maxlen=tail)
+        self.head_max = head
+        self.dropped = 0
+        self.nbytes = 0
+        self.partial = b""
+        self.callback = callback
+
+    def feed(self, data: bytes):
+        self.nbytes += len(data)
+        self.partial += data
+        *lines, self.partial = self.partial.split(b"\n")
+        for raw in lines:
+            self._line(raw.decode("utf-8", errors="replace").rstrip("\r"))
+
+    def close(self):
+        if self.partial:
+            self._line(self.partial.decode("utf-8", errors="replace").rstrip("\r"))
+            self.partial = b""
+
+    def _line(self, line: str):
+        if self.callback:
+            try:
+                self.callback(line)
+            except Exception:
+                pass  # a broken callback must not kill the command
+        if len(self.head) < self.head_max:
+            self.head.append(line)
+            return
+        if len(self.tail) == self.tail.maxlen:
+            self.dropped += 1
+        self.tail.append(line)
+
+    def text(self) -> str:
+        lines = list(self.head)
+        if self.dropped:
+            lines.append(f"... [{self.dropped} lines omitted] ...")
+        lines.extend(self.tail)
+        return "\n".join(lines)
+
+
+def ssh_stream_command(
+    client: paramiko.SSHClient,
+    command: str,
+    on_stdout: Callable[[str], None] | None = None,
+    on_stderr: Callable[[str], None] | None = None,
+    timeout: float | None = None,
+    head_lines: int = 200,
+    tail_lines: int = 800,
+) -> CommandResult:
+    """
+    Run a command and drain stdout and stderr concurrently as data arrives,
+    so a chatty command can never fill the channel window and stall.
+    Line callbacks fire as lines complete; only head/tail lines are retained.
+    """
+    started = time.time()
+    chan = client.get_transport().open_session()
+    chan.exec_command(command)
+    out = _LineBuffer(head_lines, tail_lines, on_stdout)
+    err = _LineBuffer(head_lines, tail_lines, on_stderr)
+    timed_out = False
+
+    while True:
+        drained = False
+        while chan.recv_ready():
+            out.feed(chan.recv(32768))
+            drained = True
+        while chan.recv_stderr_ready():
+            err.feed(chan.recv_stderr(32768))
+            drained = True
+        if chan.exit_status_ready() and not chan.recv_ready() and not chan.recv_stderr_ready():
+            break
+        if timeout is not None and time.time() - started > timeout:
+            timed_out = True
+            break
+        if not drained:
+            # the channel is selectable: wake up as soon as either stream has data
+            select.select([chan], [], [], 1.0)
+
+    exit_code = None if timed_out else chan.recv_exit_status()
+    chan.close()
+    out.close()
+    err.close()
+    return CommandResult(
+        command=command, exit_code=exit_code,
+        stdout=out.text(), stderr=err.text(),
+        stdout_bytes=out.nbytes, stderr_bytes=err.nbytes,
+        truncated=bool(out.dropped or err.dropped), timed_out=timed_out,
+        started_at=started, duration_s=round(time.time() - started, 3),
+    )
+
+
 def ssh_run_command(client: paramiko.SSHClient, command: str) -> str:
     """
     Run a command on the remote server and return output.
     """
-    stdin, stdout, stderr = client.exec_command(command)
-    stdout.channel.recv_exit_status()  # Wait for command to complete
-    output = stdout.read().decode().strip()
-    errors = stderr.read().decode().strip()
-    return output + ("\n" + errors if errors else "")
+    return ssh_stream_command(client, command).output
+
+
+SFTP_WINDOW_SIZE = 64 * 1024 * 1024
+SFTP_MAX_PACKET_SIZE = 256 * 1024
+
+
+def ssh_sftp(client: paramiko.SSHClient) -> paramiko.SFTPClient:
+    """
+    One SFTP session per SSH connection, opened with a large window so
+    pipelined writes are not throttled; reused by every upload on that client.
+    """
+    sftp = getattr(client, "_nh_sftp", None)
+    if sftp is None or sftp.get_channel().closed:
+        sftp = paramiko.SFTPClient.from_transport(
+            client.get_transport(), window_size=SFTP_WINDOW_SIZE, max_packet_size=SFTP_MAX_PACKET_SIZE
+        )
+        client._nh_sftp = sftp
+    return sftp
 
 
 def ssh_upload_file(client: paramiko.SSHClient, local_path: str, remote_path: str):
     """
-    Upload a local file to the remote server.
+    Upload a local file to the remote server (pipelined writes; the SFTP
+    session stays open for the next upload and closes with the client).
     """
-    ftp_client = client.open_sftp()
-    ftp_client.put(local_path, remote_path)
-    ftp_client.close()
+    ssh_sftp(client).put(local_path, remote_path)
 
 # app/utils/ssh_utils.py
 def put_text(self, content: str, remote_path: str):
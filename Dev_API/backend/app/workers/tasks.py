@@ -1,9 +1,7 @@
 from celery import Celery
-from sqlalchemy.orm import Session
 from app.services.provision_service import run_provision_script
 from app.services.email_service import send_provisioning_report
-from app.db.models.task_log import TaskLog
-from app.db.session import SessionLocal  # <-- use SessionLocal here
+from app.db.log_writer import TaskLogWriter
 
 celery_app = Celery(
     "tasks",
@@ -13,11 +11,9 @@ celery_app = Celery(
 
 @celery_app.task(name="provision_wordpress_task")
 def provision_wordpress_task(task_id: str, payload: dict):
-    db: Session = SessionLocal()
-    task_log = TaskLog(task_id=task_id, status="in_progress")
+    logs = TaskLogWriter()
     try:
-        db.add(task_log)
-        db.commit()
+        logs.log(task_id, "in_progress")
 
         ssh_host = payload["ssh_host"]
         ssh_user = payload["ssh_user"]
@@ -46,19 +42,13 @@ def provision_wordpress_task(task_id: str, payload: dict):
             output=output
         )
 
-        task_log.status = "completed"
-        task_log.output = output
-        db.add(task_log)
-        db.commit()
+        logs.log(task_id, "completed", output=output)
 
     except Exception as e:
-        task_log.status = "failed"
-        task_log.output = str(e)
-        db.add(task_log)
-        db.commit()
+        logs.log(task_id, "failed", output=str(e))
         raise
     finally:
-        db.close()
+        logs.close()
         
 from celery import shared_task
 from app.services.reset_service import ResetService
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+import pytest
+
+# never let the suite reach the database from .env; must be set before app.* is imported
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="devapi-tests-"), "test.db")
+
+
+@pytest.fixture
+def db_tables():
+    from app.db.models.task_log import Base
+    from app.db.session import engine
+
+    Base.metadata.create_all(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
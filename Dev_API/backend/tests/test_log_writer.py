@@ -0,0 +1,28 @@
+import pytest
+
+from app.db.log_writer import TaskLogWriter
+from app.db.models.task_log import TaskLog, TaskStatus
+from app.db.session import SessionLocal
+
+
+def test_failed_flush_keeps_rows_for_the_next_one(db_tables):
+    broken = [True]
+
+    def factory():
+        if broken[0]:
+            raise ConnectionError("db down")
+        return SessionLocal()
+
+    logs = TaskLogWriter(session_factory=factory, flush_interval=0)
+    with pytest.raises(ConnectionError):
+        logs.log("t1", "START", "starting")
+    broken[0] = False
+    logs.log("t1", "SUCCESS", "done")
+
+    db = SessionLocal()
+    try:
+        assert [r.status for r in db.query(TaskLog).order_by(TaskLog.id)] == ["START", "SUCCESS"]
+        st = db.get(TaskStatus, "t1")
+        assert (st.status, st.log_count) == ("SUCCESS", 2)
+    finally:
+        db.close()
@@ -0,0 +1,69 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import reset as reset_api
+from app.db.models.task_log import TaskStatus
+from app.db.session import SessionLocal
+from app.services.reset_service import ResetService
+
+
+@pytest.fixture
+def scheduled(db_tables, monkeypatch):
+    revoked = []
+    monkeypatch.setattr(reset_api.celery_app.control, "revoke", revoked.append)
+    db = SessionLocal()
+    db.add(TaskStatus(task_id="t1", status="SCHEDULED", log_count=1))
+    db.commit()
+    db.close()
+    return revoked
+
+
+def _status(task_id):
+    db = SessionLocal()
+    try:
+        return db.get(TaskStatus, task_id).status
+    finally:
+        db.close()
+
+
+def test_cancel_before_claim_stops_the_worker(scheduled):
+    assert reset_api.cancel_reset("t1").message == "Reset cancelled"
+    assert scheduled == ["t1"]
+    assert _status("t1") == "CANCELLED"
+
+    assert ResetService.claim("t1") == "CANCELLED"
+    assert ResetService().execute("t1", {"host": "h"}) == {"mode": "cleanup", "cancelled": True}
+    assert _status("t1") == "CANCELLED"
+
+
+def test_cancel_after_claim_is_refused(scheduled):
+    assert ResetService.claim("t1") is None
+    assert _status("t1") == "RUNNING"
+
+    with pytest.raises(HTTPException) as exc:
+        reset_api.cancel_reset("t1")
+    assert exc.value.status_code == 409
+    assert scheduled == []
+    assert _status("t1") == "RUNNING"
+
+
+def test_second_claim_is_a_duplicate_delivery(scheduled):
+    assert ResetService.claim("t1") is None
+    assert ResetService.claim("t1") == "RUNNING"
+
+
+def test_cancel_twice(scheduled):
+    reset_api.cancel_reset("t1")
+    assert reset_api.cancel_reset("t1").message == "Already cancelled"
+    assert scheduled == ["t1"]
+
+
+def test_cancel_unknown_task(scheduled):
+    with pytest.raises(HTTPException) as exc:
+        reset_api.cancel_reset("nope")
+    assert exc.value.status_code == 404
+
+
+def test_claim_without_kill_switch_window(db_tables):
+    # forced resets are never SCHEDULED: nothing to claim, run straight away
+    assert ResetService.claim("forced") is None
@@ -1,10 +1,12 @@
 from celery import Celery
+from celery.signals import worker_ready, before_task_publish, task_prerun, task_postrun
 from config import settings
 from task_runner import run_fabric_task
-from emailer import send_report_email
-from logger import get_logger
+from emailer import send_report_email, send_digest_email, outbox_push, outbox_drain, outbox_requeue
+from logger import get_logger, log_json, bind, unbind, current_context
+import logging
 from datetime import datetime, timezone
-import json
+import contextvars, functools, inspect, os, smtplib, time
 from typing import Any, Dict, List, Optional
 
 _broker  = settings.BROKER_URL or settings.REDIS_URL
@@ -15,76 +17,263 @@ log = get_logger("worker")
 
 
 # -----------------------------------------------------------------------------
-# Helpers for schema-agnostic handling of WP status payloads
+# Priority lanes: one broker queue per lane, workers read them in this order
 # -----------------------------------------------------------------------------
-def _coerce_status_dict(status_like: Any) -> Dict[str, Any]:
+# Redis transport priority: 0 is served first. Beat-driven work is
+# "scheduled", fleet sweeps / waves / email are "background", everything an
+# operator submits is "interactive" unless the API call asks otherwise.
+LANES = {"interactive": 0, "scheduled": 3, "background": 6}
+_TASK_LANES = {
+    "monitor.tick": "scheduled", "monitor.check": "scheduled", "backup.repo.prune": "scheduled",
+    "email.outbox.send": "background", "email.outbox.flush": "background",
+    "wp.update.wave.start": "background", "wp.update.wave.step": "background",
+    "wp.update.wave.error": "background", "screenshot.visual_regression": "background",
+    "content.scan.sweep": "background",
+}
+_lane: contextvars.ContextVar = contextvars.ContextVar("submission_lane", default=None)
+
+
+def lane_options(lane: str) -> Dict[str, Any]:
+    if lane not in LANES:
+        raise ValueError(f"unknown lane {lane!r}; expected one of {', '.join(LANES)}")
+    return {"queue": lane, "routing_key": lane, "priority": LANES[lane]}
+
+
+def set_lane(lane: str | None) -> contextvars.Token:
+    """Lane for tasks published from the current request (None = per-task default)."""
+    if lane is not None:
+        lane_options(lane)
+    return _lane.set(lane)
+
+
+def _route(name, args, kwargs, options, task=None, **kw):
+    if options.get("queue") or options.get("routing_key"):
+        return None         # explicit lane_options(), or a retry keeping its original lane
+    return lane_options(_lane.get() or _TASK_LANES.get(name, "interactive"))
+
+
+from kombu import Queue
+celery.conf.task_queues = [Queue(name, routing_key=name) for name in LANES]
+celery.conf.task_default_queue = "interactive"
+celery.conf.task_routes = (_route,)
+celery.conf.broker_transport_options = {
+    "priority_steps": list(range(10)), "sep": ":",
+    "queue_order_strategy": "priority",     # -Q order is strict: interactive drains first
+}
+celery.conf.worker_prefetch_multiplier = 1  # a busy worker does not sit on reserved background work
+
+
+@worker_ready.connect
+def _log_worker_ready(**_):
+    # fabric/paramiko load on the first SSH task, not at boot (see task_runner)
+    from modules.startup import process_age_ms
+    log.info("[startup] worker ready %s ms after process start", process_age_ms())
+
+
+# Correlation ids: the API request id (or the publishing task's id) travels
+# as a message header; every record a task logs carries corr_id + task_id.
+_log_tokens: Dict[str, Any] = {}
+
+
+@before_task_publish.connect
+def _propagate_corr_id(headers=None, **_):
+    corr = current_context().get("corr_id")
+    if corr and headers is not None and "corr_id" not in headers:
+        headers["corr_id"] = corr
+
+
+@task_prerun.connect
+def _bind_task_context(task_id=None, task=None, **_):
+    req = getattr(task, "request", None)
+    corr = getattr(req, "corr_id", None) or getattr(req, "root_id", None) or task_id
+    _log_tokens[task_id] = bind(corr_id=corr, task_id=task_id, task=getattr(task, "name", None))
+
+
+@task_postrun.connect
+def _unbind_task_context(task_id=None, **_):
+    token = _log_tokens.pop(task_id, None)
+    if token is not None:
+        try:
+            unbind(token)
+        except ValueError:      # bound in another context (should not happen with prefork/solo)
+            pass
+
+
+@task_postrun.connect
+def _finish_single_flight(task_id=None, task=None, retval=None, state=None, **_):
+    # coalesced read-only tasks (see modules/singleflight): keep a good result
+    # reusable for the freshness window, forget a failed one right away
+    key = getattr(getattr(task, "request", None), "singleflight", None)
+    if not key:
+        return
+    ok = state == "SUCCESS" and not (isinstance(retval, dict) and retval.get("ok") is False)
+    try:
+        from modules.singleflight import SingleFlight
+        SingleFlight().finish(key, task_id, ok, settings.SINGLEFLIGHT_FRESH_SECONDS)
+    except Exception as e:
+        log.warning("[single-flight] could not release %s: %s", key, e)
+
+
+celery.conf.beat_schedule = {}
+if settings.MONITOR_ENABLED:
+    celery.conf.beat_schedule["monitor-tick"] = {"task": "monitor.tick", "schedule": float(settings.MONITOR_TICK_SECONDS)}
+if settings.BACKUP_PRUNE_PERIOD > 0:
+    celery.conf.beat_schedule["backup-repo-prune"] = {"task": "backup.repo.prune", "schedule": float(settings.BACKUP_PRUNE_PERIOD)}
+
+
+# -----------------------------------------------------------------------------
+# Report email outbox: tasks only enqueue, delivery happens in email.* tasks
+# -----------------------------------------------------------------------------
+_SMTP_RETRYABLE = (smtplib.SMTPException, ConnectionError, TimeoutError)
+
+
+@celery.task(bind=True, name="email.outbox.send",
+             autoretry_for=_SMTP_RETRYABLE, retry_backoff=True, retry_backoff_max=600,
+             retry_jitter=True, max_retries=settings.EMAIL_MAX_RETRIES)
+def email_send_task(self, to_email: str, subject: str, report: dict):
+    send_report_email(to_email, subject, report or {})
+    return {"ok": True, "to": to_email, "subject": subject}
+
+
+@celery.task(bind=True, name="email.outbox.flush", max_retries=settings.EMAIL_MAX_RETRIES)
+def email_flush_task(self, to_email: str):
+    items = outbox_drain(to_email)
+    if not items:
+        return {"ok": True, "to": to_email, "sent": 0}
+    try:
+        send_digest_email(to_email, items)
+    except _SMTP_RETRYABLE as e:
+        outbox_requeue(to_email, items)
+        raise self.retry(exc=e, countdown=min(600, 30 * 2 ** self.request.retries))
+    return {"ok": True, "to": to_email, "sent": len(items)}
+
+
+def _queue_report(report_email: str | None, subject: str, result: Any) -> Any:
     """
-    Accept anything and return a dict that looks like the /status JSON body.
-    Handles:
-      - dict already at status shape
-      - dicts wrapped like {"result": {...}} or {"raw": {...}}
-      - string JSON bodies
-    Falls back to {}.
+    Hand a task report to the outbox instead of talking SMTP inline.
+    Digest mode (EMAIL_DIGEST_WINDOW > 0) merges all reports for a recipient
+    that arrive within the window into one message.
+    Returns `result` untouched, or the usual `_email_error` envelope if even
+    enqueueing failed (broker down).
     """
-    # 1) Fast path
-    if isinstance(status_like, dict):
-        # unwrap common wrappers
-        if "plugins" in status_like and "themes" in status_like:
-            return status_like
-        if "raw" in status_like and isinstance(status_like["raw"], dict):
-            return status_like["raw"]
-        if "result" in status_like and isinstance(status_like["result"], dict):
-            inner = status_like["result"]
-            if "raw" in inner and isinstance(inner["raw"], dict):
-                return inner["raw"]
-            if "plugins" in inner and "themes" in inner:
-                return inner
-        return status_like
-
-    # 2) JSON string?
-    if isinstance(status_like, str):
-        try:
-            parsed = json.loads(status_like.strip())
-            return _coerce_status_dict(parsed)
-        except Exception:
-            return {}
+    if not report_email:
+        return result
+    try:
+        if settings.EMAIL_DIGEST_WINDOW > 0:
+            if outbox_push(report_email, subject, result or {}):
+                email_flush_task.apply_async(args=[report_email], countdown=settings.EMAIL_DIGEST_WINDOW)
+        else:
+            email_send_task.delay(report_email, subject, result or {})
+    except Exception as e:
+        # Don’t fail the task because of email
+        return {"_original": result, "_email_error": str(e)}
+    return result
 
-    # 3) Unsupported type
-    return {}
 
+def _record_snapshot(url: str, status_like: Any):
+    """
+    Feed a /status snapshot into the history store and the fleet index.
+    Best-effort: both are observers and must never fail the task that
+    produced the snapshot. Parsed once here and shared by both.
+    """
+    if not status_like:
+        return
+    from modules.status_history import site_key
+    from modules.wp_status import WPStatus
+    site = site_key(url)
+    status_like = WPStatus.of(status_like)
+    if settings.HISTORY_ENABLED:
+        try:
+            from modules.status_history import StatusHistory
+            StatusHistory().ingest(site, status_like)
+        except Exception as e:
+            log.warning("history ingest failed for %s: %s", url, e)
+    if settings.FLEET_INDEX_ENABLED:
+        try:
+            from modules.fleet_index import FleetIndex
+            FleetIndex().update_site(site, status_like)
+        except Exception as e:
+            log.warning("fleet index update failed for %s: %s", url, e)
 
-def _plugins_rows(status_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+
+# -----------------------------------------------------------------------------
+# One mutating task per site at a time (FIFO; waiters retry, not block a slot)
+# -----------------------------------------------------------------------------
+MUTATING_FABRIC_TASKS = {
+    "update_with_rollback", "backup_site", "backup_db", "backup_wp_content", "backup_db_incremental",
+    "restore_db_pitr", "repo_backup", "wp_reset_sh", "provision_wp_sh",
+}
+
+
+def _fabric_site(a: dict) -> str | None:
+    """Lock key of a Fabric task: site_id, else domain, else the SSH host (see site_lock.site_key)."""
+    if a["task_name"] not in MUTATING_FABRIC_TASKS:
+        return None
+    from modules.site_lock import site_key
+    sc = a["site_config"]
+    return site_key(sc.get("site_id"), sc.get("domain"), sc.get("host"))
+
+
+def _rest_site(a: dict) -> str | None:
+    """Lock key of a wp.update.* task: site_id, else the base_url hostname."""
+    from modules.site_lock import site_key
+    return site_key(a.get("site_id"), a.get("base_url"))
+
+
+def _take_site_or_retry(task, site: str | None):
+    """SiteLock held by this task, None if not applicable; raises Retry while others go first."""
+    if not site or not settings.SITE_LOCK_ENABLED or task.request.called_directly:
+        return None
+    from modules.site_lock import SiteLock
+    lock = SiteLock(site, task.request.id, lease=settings.SITE_LOCK_LEASE,
+                    stale=settings.SITE_LOCK_RETRY_MAX * 3 + 60)
+    try:
+        ok, ahead = lock.acquire()
+    except Exception as e:          # Redis down: the broker most likely is too; do not block the work
+        log.warning("[site-lock] %s: %s; running unlocked", site, e)
+        return None
+    if not ok:
+        countdown = min(settings.SITE_LOCK_RETRY_MAX, settings.SITE_LOCK_RETRY * (1 + ahead))
+        log_json(log, "site_lock.wait", site=site, ahead=ahead, owner=lock.owner(), countdown=countdown)
+        raise task.retry(countdown=countdown, max_retries=None)
+    lock.start_renewal()
+    return lock
+
+
+def _one_per_site(site_of):
     """
-    Return list[dict] of plugins for both schemas.
-      - legacy: status["plugins"] is list[dict]
-      - new:    status["plugins"] is dict with key "list" -> list[dict]
-    Filters out non-dict items.
+    Task decorator (below @celery.task): run the body while holding the lock of
+    site_of(<bound arguments>); if another mutating task holds it, queue up.
     """
-    plugins_obj = (status_json or {}).get("plugins")
-    if isinstance(plugins_obj, dict):
-        rows = plugins_obj.get("list") or []
-    elif isinstance(plugins_obj, list):
-        rows = plugins_obj
-    else:
-        rows = []
-    return [r for r in rows if isinstance(r, dict)]
+    def deco(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            site = site_of(sig.bind(self, *args, **kwargs).arguments)
+            lock = _take_site_or_retry(self, site)
+            if lock is None:
+                return fn(self, *args, **kwargs)
+            with lock:
+                result = fn(self, *args, **kwargs)
+            if lock.lost:
+                log_json(log, "site_lock.lost", level=logging.ERROR, site=site)
+            return result
+        return wrapper
+    return deco
 
 
 # -----------------------------------------------------------------------------
 # Generic Fabric runner passthrough
 # -----------------------------------------------------------------------------
 @celery.task(bind=True)
+@_one_per_site(_fabric_site)
 def run_site_task(self, site_config: dict, task_name: str, report_email: str | None = None, **kwargs):
-    safe_site = {k: v for k, v in site_config.items() if k not in {"password","sudo_password","private_key_pem","db_pass","key_filename"}}
-    log.info(f"[task {self.request.id}] start {task_name} site={safe_site} args={kwargs}")
+    # secrets in site_config/kwargs are redacted by the logging pipeline
+    log_json(log, "task.start", fabric_task=task_name, site=site_config, args=kwargs)
     result = run_fabric_task(site_config, task_name, **kwargs)
-    log.info(f"[task {self.request.id}] done {task_name} -> {('ok' if result else 'empty')}")
-    if report_email:
-        try:
-            send_report_email(report_email, f"[{settings.APP_NAME}] Task {task_name} completed", result or {})
-        except Exception as e:
-            # Don’t fail the task because of email
-            result = {"_original": result, "_email_error": str(e)}
+    log_json(log, "task.done", fabric_task=task_name, ok=bool(result))
+    result = _queue_report(report_email, f"[{settings.APP_NAME}] Task {task_name} completed", result)
     return result
 
 
@@ -93,7 +282,7 @@ def run_site_task(self, site_config: dict, task_name: str, report_email: str | N
 # -----------------------------------------------------------------------------
 @celery.task(bind=True, name="domain_ssl_checker.collect")
 def domain_ssl_collect_task(self, domain: str, report_email: str | None = None):
-    log.info(f"[task {self.request.id}] domain_ssl_collect domain={domain}")
+    log_json(log, "domain_ssl.collect", domain=domain)
     try:
         from modules.domain_ssl_checker import get_domain_expiry, get_ssl_expiry
     except Exception as e:
@@ -136,11 +325,7 @@ def domain_ssl_collect_task(self, domain: str, report_email: str | None = None):
               "ok": bool(whois.get("ok") and sslb.get("ok")),
               "checked_at": datetime.now(timezone.utc).isoformat()}
 
-    if report_email:
-        try:
-            send_report_email(report_email, f"[{settings.APP_NAME}] Domain/SSL check for {domain}", result or {})
-        except Exception as e:
-            result = {"_original": result, "_email_error": str(e)}
+    result = _queue_report(report_email, f"[{settings.APP_NAME}] Domain/SSL check for {domain}", result)
     return result
 
 
@@ -158,20 +343,17 @@ def wp_outdated_fetch_task(self,
     Fetch WP status JSON and detect outdated core/plugins/themes.
     Supports basic_auth="user:pass" (works with WP Application Passwords).
     """
-    log.info(f"[task {self.request.id}] wp_outdated_fetch url={url} auth={bool(basic_auth)} headers={bool(headers)}")
+    log_json(log, "wp_outdated.fetch", url=url, has_auth=bool(basic_auth), has_headers=bool(headers))
     try:
         from modules.outdated_fetcher import fetch_outdated
         result = fetch_outdated(url, headers=headers, timeout=timeout, basic_auth=basic_auth)
     except Exception as e:
         result = {"ok": False, "url": url, "error": str(e)}
 
-    if report_email:
-        try:
-            send_report_email(report_email,
-                              f"[{settings.APP_NAME}] Outdated check for {url}",
-                              result or {})
-        except Exception as e:
-            result = {"_original": result, "_email_error": str(e)}
+    if result.get("ok"):
+        _record_snapshot(url, result.get("raw"))
+
+    result = _queue_report(report_email, f"[{settings.APP_NAME}] Outdated check for {url}", result)
 
     return result
 
@@ -180,6 +362,7 @@ def wp_outdated_fetch_task(self,
 # WP: Plugins update task (schema-agnostic + robust normalization)
 # -----------------------------------------------------------------------------
 @celery.task(bind=True, name="wp.update.plugins")
+@_one_per_site(_rest_site)
 def wp_update_plugins_task(self,
                            base_url: str,
                            plugins: list[str] | None = None,
@@ -187,77 +370,20 @@ def wp_update_plugins_task(self,
                            blocklist: list[str] | None = None,
                            auth: dict | None = None,
                            headers: dict | None = None,
-                           report_email: str | None = None):
-    log.info(f"[task {self.request.id}] wp_update_plugins url={base_url} plugins={plugins} auto={auto_select_outdated} headers={bool(headers)} auth={bool(auth)}")
+                           report_email: str | None = None,
+                           site_id: str | None = None):
+    log_json(log, "wp_update.plugins", url=base_url, plugins=plugins, auto=auto_select_outdated,
+             has_headers=bool(headers), has_auth=bool(auth))
 
     try:
-        from modules.wp_updater import fetch_status, select_outdated_plugins, update_plugins
+        from modules.wp_updater import fetch_status, update_plugins
+        from modules.wp_status import WPStatus
     except Exception as e:
         return {"ok": False, "error": f"Import error: {e}"}
 
     auth_tuple: Optional[tuple[str, str]] = (auth["username"], auth["password"]) if auth else None
     status: Any = None
 
-    # Helper: map human plugin names -> plugin_file slugs using status
-    def _normalize_plugin_list(sel: List[str], status_like: Any) -> List[str]:
-        """
-        Accept selection as human names, slugs, or plugin_file; return plugin_file list.
-        Safe with any status shape (string, dict, wrapped dict).
-        """
-        if not sel:
-            return []
-
-        status_loc = _coerce_status_dict(status_like)
-        rows = _plugins_rows(status_loc)
-
-        by_slug: Dict[str, str] = {}
-        by_name: Dict[str, str] = {}
-        plugin_files: List[str]  = []
-
-        for p in rows:
-            plugin_file = (p.get("plugin_file") or p.get("file") or "").strip()
-            if plugin_file:
-                plugin_files.append(plugin_file)
-            slug = (p.get("slug") or (plugin_file.split("/", 1)[0] if plugin_file else "")).strip().lower()
-            name = (p.get("name") or "").strip().lower()
-            if slug and plugin_file:
-                by_slug[slug] = plugin_file
-            if name and plugin_file:
-                by_name[name] = plugin_file
-
-        out: List[str] = []
-        for s in sel:
-            token = (str(s or "").strip())
-            if not token:
-                continue
-
-            # Already a plugin file?
-            if token.endswith(".php") and "/" in token:
-                out.append(token)
-                continue
-
-            key = token.lower()
-
-            # Try exact slug, then exact name
-            pf = by_slug.get(key) or by_name.get(key)
-            if pf:
-                out.append(pf)
-                continue
-
-            # Try prefix match on plugin files using slug-ish token
-            if "/" not in key:
-                for pf2 in plugin_files:
-                    if pf2.startswith(key + "/"):
-                        out.append(pf2)
-                        break
-
-            # If still nothing, keep raw token; caller may decide to drop/err later
-            if not out or out[-1] != token:
-                out.append(token)
-
-        # Only keep truthy strings
-        return [x for x in out if isinstance(x, str) and x.strip()]
-
     # 1) Decide selection
     selected = list(plugins or [])
     selected_before = list(selected)
@@ -272,30 +398,12 @@ def wp_update_plugins_task(self,
         except Exception as e:
             return {"ok": False, "error": f"Status fetch failed: {e}", "url": base_url}
 
-    # 2) Build final selection
+    # 2) Build final selection (status parsed once; names/slugs resolve via its indexes)
+    snap = WPStatus.of(status)
     if auto_select_outdated and not selected:
-        # Make sure we pass a dict in the shape the selector understands
-        status_for_selector = _coerce_status_dict(status)
-        try:
-            selected = select_outdated_plugins(status_for_selector, blocklist)
-        except Exception as e:
-            # Fallback: derive outdated by ourselves from plugins list if selector isn't schema-agnostic
-            log.warning(f"[task {self.request.id}] select_outdated_plugins failed ({e}); using fallback selector")
-            rows = _plugins_rows(status_for_selector)
-            bl = set(x.strip().lower() for x in (blocklist or []) if x)
-            tmp: List[str] = []
-            for p in rows:
-                file = (p.get("plugin_file") or p.get("file") or "").strip()
-                installed = p.get("version") or p.get("installed")
-                available = p.get("latest_version") or p.get("available")
-                has_update = p.get("update_available")
-                if has_update is None and installed and available:
-                    has_update = str(installed) != str(available)
-                if file and bool(has_update) and file.lower() not in bl:
-                    tmp.append(file)
-            selected = tmp
+        selected = snap.outdated_plugins(blocklist)
     else:
-        selected = _normalize_plugin_list(selected, status)
+        selected = snap.resolve(selected)
 
     # Apply blocklist if caller provided explicit selection
     if blocklist:
@@ -310,6 +418,7 @@ def wp_update_plugins_task(self,
     }
     if status is not None:
         out["status_snapshot"] = status
+        _record_snapshot(base_url, snap)
 
     # 4) Execute or skip
     if not selected:
@@ -318,8 +427,9 @@ def wp_update_plugins_task(self,
         upd = update_plugins(base_url, selected, auth_tuple, headers)
         out["plugins"]["result"] = upd
         out["ok"] = bool((upd or {}).get("ok"))
+        _record_snapshot(base_url, (upd or {}).get("post_status"))
 
-    log.info(f"[task {self.request.id}] normalize: {selected_before} -> {selected}")
+    log_json(log, "wp_update.normalize", before=selected_before, selected=selected)
 
     # 5) Summarize per-plugin results if present
     try:
@@ -333,18 +443,14 @@ def wp_update_plugins_task(self,
         failures  = [x["plugin_file"] for x in per_plugin if isinstance(x, dict) and x.get("updated") is False]
 
         if successes:
-            log.info(f"[task {self.request.id}] ✅ Plugin(s) updated: {successes}")
+            log_json(log, "wp_update.plugins_updated", plugins=successes)
         if failures:
-            log.warning(f"[task {self.request.id}] ❌ Plugin(s) still stale after update: {failures}")
+            log_json(log, "wp_update.plugins_stale", level=logging.WARNING, plugins=failures)
     except Exception as e:
-        log.warning(f"[task {self.request.id}] ⚠️ Failed to parse plugin result details: {e}")
+        log.warning("failed to parse plugin result details: %s", e)
 
     # 6) Optional email
-    if report_email:
-        try:
-            send_report_email(report_email, f"[{settings.APP_NAME}] WP plugin updates for {base_url}", out or {})
-        except Exception as e:
-            out = {"_original": out, "_email_error": str(e)}
+    out = _queue_report(report_email, f"[{settings.APP_NAME}] WP plugin updates for {base_url}", out)
     return out
 
 
@@ -352,16 +458,19 @@ def wp_update_plugins_task(self,
 # WP: Core update task
 # -----------------------------------------------------------------------------
 @celery.task(bind=True, name="wp.update.core")
+@_one_per_site(_rest_site)
 def wp_update_core_task(self,
                         base_url: str,
                         precheck: bool = True,
                         auth: dict | None = None,
                         headers: dict | None = None,
-                        report_email: str | None = None):
-    log.info(f"[task {self.request.id}] wp_update_core url={base_url} precheck={precheck} headers={bool(headers)} auth={bool(auth)}")
+                        report_email: str | None = None,
+                        site_id: str | None = None):
+    log_json(log, "wp_update.core", url=base_url, precheck=precheck, has_headers=bool(headers), has_auth=bool(auth))
 
     try:
         from modules.wp_updater import fetch_status, update_core
+        from modules.wp_status import WPStatus
     except Exception as e:
         return {"ok": False, "error": f"Import error: {e}"}
 
@@ -371,31 +480,20 @@ def wp_update_core_task(self,
     if precheck:
         try:
             status = fetch_status(base_url, auth_tuple, headers)
-            core = (_coerce_status_dict(status).get("core") or {})
-            # In your new status, core might be {"installed": "...", "updates": [...]}
-            # Provide a compatible view:
-            current = core.get("current_version") or core.get("installed")
-            latest = core.get("latest_version")
-            if not latest and isinstance(core.get("updates"), list) and core["updates"]:
-                latest = core["updates"][0].get("version")
-            update_available = core.get("update_available")
-            if update_available is None and current and latest:
-                update_available = str(current) != str(latest)
-
-            if not update_available:
+            snap = WPStatus.of(status)
+            _record_snapshot(base_url, snap)
+            core = snap.core_view()
+
+            if not core["update_available"]:
                 res = {
                     "ok": True,
                     "skipped": True,
                     "reason": "core is already up-to-date",
-                    "current": current,
-                    "latest": latest or current,
+                    "current": core["current"],
+                    "latest": core["latest"],
                     "status_snapshot": status,
                 }
-                if report_email:
-                    try:
-                        send_report_email(report_email, f"[{settings.APP_NAME}] WP core update skipped ({base_url})", res or {})
-                    except Exception as e:
-                        res = {"_original": res, "_email_error": str(e)}
+                res = _queue_report(report_email, f"[{settings.APP_NAME}] WP core update skipped ({base_url})", res)
                 return res
         except Exception as e:
             return {"ok": False, "error": f"Status fetch failed: {e}", "url": base_url}
@@ -404,11 +502,7 @@ def wp_update_core_task(self,
     if status is not None:
         result["status_snapshot"] = status
 
-    if report_email:
-        try:
-            send_report_email(report_email, f"[{settings.APP_NAME}] WP core update for {base_url}", result or {})
-        except Exception as e:
-            result = {"_original": result, "_email_error": str(e)}
+    result = _queue_report(report_email, f"[{settings.APP_NAME}] WP core update for {base_url}", result)
     return result
 
 
@@ -416,6 +510,7 @@ def wp_update_core_task(self,
 # WP: Update-all task (plugins + core)
 # -----------------------------------------------------------------------------
 @celery.task(bind=True, name="wp.update.all")
+@_one_per_site(_rest_site)
 def wp_update_all_task(
     self,
     base_url: str,
@@ -426,10 +521,12 @@ def wp_update_all_task(
     include_core: bool = True,
     precheck_core: bool = True,         # skip core if already up to date
     report_email: str | None = None,
+    site_id: str | None = None,         # lock key shared with Fabric tasks on the same site
 ):
-    log.info(f"[task {self.request.id}] wp_update_all url={base_url} include_plugins={include_plugins} include_core={include_core}")
+    log_json(log, "wp_update.all", url=base_url, include_plugins=include_plugins, include_core=include_core)
     try:
-        from modules.wp_updater import fetch_status, select_outdated_plugins, update_plugins, update_core
+        from modules.wp_updater import fetch_status, update_plugins, update_core
+        from modules.wp_status import WPStatus
     except Exception as e:
         return {"ok": False, "url": base_url, "error": f"Import error: {e}"}
 
@@ -448,54 +545,33 @@ def wp_update_all_task(
     except Exception as e:
         return {"ok": False, "url": base_url, "error": f"Status fetch failed: {e}"}
     result["status_snapshot"] = status
+    snap = WPStatus.of(status)
+    _record_snapshot(base_url, snap)
 
     # 2) plugins
     plugins_ok = True
     if include_plugins:
-        status_dict = _coerce_status_dict(status)
-        try:
-            selected = select_outdated_plugins(status_dict, blocklist)
-        except Exception as e:
-            log.warning(f"[task {self.request.id}] select_outdated_plugins failed in update_all ({e}); using fallback selector")
-            rows = _plugins_rows(status_dict)
-            bl = set(x.strip().lower() for x in (blocklist or []) if x)
-            selected = []
-            for p in rows:
-                file = (p.get("plugin_file") or p.get("file") or "").strip()
-                installed = p.get("version") or p.get("installed")
-                available = p.get("latest_version") or p.get("available")
-                has_update = p.get("update_available")
-                if has_update is None and installed and available:
-                    has_update = str(installed) != str(available)
-                if file and bool(has_update) and file.lower() not in bl:
-                    selected.append(file)
-
+        selected = snap.outdated_plugins(blocklist)
         result["plugins"]["selected"] = selected
         if selected:
             upd = update_plugins(base_url, selected, auth_tuple, headers)
             result["plugins"]["result"] = upd
             plugins_ok = bool((upd or {}).get("ok"))
+            _record_snapshot(base_url, (upd or {}).get("post_status"))
         else:
             result["plugins"]["skipped"] = True
 
     # 3) core
     core_ok = True
     if include_core:
-        core = _coerce_status_dict(status).get("core") or {}
-        current = core.get("current_version") or core.get("installed")
-        latest = core.get("latest_version")
-        if not latest and isinstance(core.get("updates"), list) and core["updates"]:
-            latest = core["updates"][0].get("version")
-        update_available = core.get("update_available")
-        if update_available is None and current and latest:
-            update_available = str(current) != str(latest)
-
-        if precheck_core and not update_available:
+        core = snap.core_view()
+
+        if precheck_core and not core["update_available"]:
             result["core"].update({
                 "skipped": True,
                 "reason": "core already up to date",
-                "current": current,
-                "latest": latest or current,
+                "current": core["current"],
+                "latest": core["latest"],
             })
         else:
             upd = update_core(base_url, auth_tuple, headers)
@@ -504,12 +580,280 @@ def wp_update_all_task(
 
     result["ok"] = bool(plugins_ok and core_ok)
 
-    if report_email:
+    result = _queue_report(report_email, f"[{settings.APP_NAME}] WP all-updates for {base_url}", result)
+    return result
+
+# -----------------------------------------------------------------------------
+# WP: Fleet update waves (per-host concurrency caps, canaries, auto-pause)
+# -----------------------------------------------------------------------------
+def _wave_pump(wave_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Start as many targets as the wave's caps allow. Runs under the wave lock;
+    task ids are saved before the lock is released so callbacks always find them.
+    If publishing fails part-way, the targets not sent go back to pending and
+    the ones that were sent keep their task ids.
+    """
+    from redis_client import get_redis
+    from modules import update_waves as uw
+    from modules.credentials import CredentialStore
+
+    r = get_redis()
+    store = CredentialStore(r)
+    with uw.lock(r, wave_id):
+        state = uw.load(r, wave_id)
+        if not state:
+            return None
+        picked = uw.next_batch(state)
+        sent = 0
+        try:
+            for tid in picked:
+                kwargs = dict(state["targets"][tid]["kwargs"])
+                kwargs.update(store.get(kwargs.pop("credentials_ref", None)))
+                res = wp_update_all_task.apply_async(
+                    kwargs=kwargs,
+                    **lane_options("background"),
+                    link=wave_step_task.s(wave_id, tid),
+                    link_error=wave_error_task.s(wave_id, tid),
+                )
+                state["task_ids"][tid] = res.id
+                sent += 1
+        finally:
+            uw.unpick(state, picked[sent:])
+            uw.save(r, state)
+    return state
+
+
+def _wave_record(wave_id: str, tid: str, ok: bool, error: str | None = None):
+    from redis_client import get_redis
+    from modules import update_waves as uw
+
+    r = get_redis()
+    with uw.lock(r, wave_id):
+        state = uw.load(r, wave_id)
+        if not state:
+            return
+        uw.record_outcome(state, tid, ok, error)
+        uw.save(r, state)
+    log_json(log, "wave.target", wave_id=wave_id, target=tid, ok=ok, status=state["status"], phase=state["phase"])
+    if state["status"] == "done":
+        from modules.credentials import CredentialStore
+        store = CredentialStore(r)
+        for ref in uw.credential_refs(state):
+            store.delete(ref)
+        return
+    _wave_pump(wave_id)
+
+
+@celery.task(bind=True, name="wp.update.wave.start")
+def wave_start_task(self, wave_id: str, targets: list[dict], limits: dict | None = None):
+    from redis_client import get_redis
+    from modules import update_waves as uw
+
+    state = uw.plan_wave(targets, wave_id=wave_id, **(limits or {}))
+    uw.save(get_redis(), state)
+    log.info("[wave %s] planned %d target(s) on %d host(s)", wave_id, len(targets), len(state["pending"]))
+    state = _wave_pump(wave_id)
+    return uw.summary(state) if state else {"wave_id": wave_id, "status": "missing"}
+
+
+@celery.task(name="wp.update.wave.step")
+def wave_step_task(result, wave_id: str, tid: str):
+    res = result or {}
+    if "_original" in res:          # email enqueue failed; judge the update itself
+        res = res.get("_original") or {}
+    _wave_record(wave_id, tid, bool(res.get("ok")), None if res.get("ok") else res.get("error"))
+
+
+@celery.task(name="wp.update.wave.error")
+def wave_error_task(request, exc, traceback, wave_id: str, tid: str):
+    _wave_record(wave_id, tid, False, f"{type(exc).__name__}: {exc}")
+
+
+# -----------------------------------------------------------------------------
+# Monitoring: beat tick -> jittered per-site checks
+# -----------------------------------------------------------------------------
+def _monitor_periods() -> Dict[str, int]:
+    return {
+        "healthcheck": settings.MONITOR_HEALTHCHECK_PERIOD,
+        "outdated": settings.MONITOR_OUTDATED_PERIOD,
+        "domain_ssl": settings.MONITOR_DOMAIN_SSL_PERIOD,
+    }
+
+
+def _http_healthcheck(url: str, keyword: str | None = None, timeout: int = 15) -> Dict[str, Any]:
+    from modules.http_prober import probe_sync
+    return probe_sync(url, keyword=keyword, timeout=timeout, follow_redirects=5)
+
+
+@celery.task(bind=True, name="http.probe.batch")
+def http_probe_batch_task(self, targets: List[Dict[str, Any]], concurrency: int = 100):
+    """
+    Probe many URLs from one worker: [{"url", "keyword"?, "timeout"?}, ...].
+    Returns per-URL results (with phase timings) in input order.
+    """
+    from modules.http_prober import probe_many_sync
+
+    allowed = ("url", "keyword", "method", "timeout", "follow_redirects", "verify_tls")
+    clean = [{k: v for k, v in t.items() if k in allowed and v is not None} for t in targets]
+    results = probe_many_sync(clean, concurrency=concurrency)
+    failed = sum(1 for r in results if not r.get("ok"))
+    log.info("[probe] %d url(s), %d not ok", len(results), failed)
+    return {"ok": failed == 0, "total": len(results), "failed": failed, "results": results}
+
+
+@celery.task(bind=True, name="monitor.tick", ignore_result=True)
+def monitor_tick_task(self):
+    """
+    Dispatch the checks whose slot falls in the *next* tick window, each with
+    a countdown to its own offset, so every start lies in the future and the
+    fleet is spread evenly across the period. Windows missed since the last
+    tick (late beat, beat restart) are dispatched too, their starts spread
+    over the coming tick.
+    """
+    from modules.monitor_scheduler import MonitorRegistry, CHECKS
+
+    reg = MonitorRegistry()
+    tick = int(settings.MONITOR_TICK_SECONDS)
+    now = time.time()
+    upto = int(now // tick + 2) * tick          # end of the next window
+    dispatched = 0
+    for check, period in _monitor_periods().items():
+        if check not in CHECKS or period <= 0:
+            continue
+        start = reg.claim_windows(check, upto, first=upto - tick, oldest=upto - max(period, tick))
+        if start is None:
+            continue
+        missed = max(0.0, now - start)
+        for site_id, start_at in reg.due(check, period, start, upto - start):
+            if start_at >= now:
+                countdown = start_at - now
+            else:                                # missed slot: keep its order, spread over one tick
+                countdown = max(0.0, start_at - start) / max(missed, 1e-6) * tick
+            monitor_check_task.apply_async(args=[site_id, check], countdown=countdown)
+            dispatched += 1
+        if start < upto - tick:
+            log.warning("[monitor] %s: caught up %ds of missed windows", check, int(upto - tick - start))
+    if dispatched:
+        log.info("[monitor] windows up to %d dispatched %d check(s)", upto, dispatched)
+    return dispatched
+
+
+@celery.task(bind=True, name="monitor.check")
+def monitor_check_task(self, site_id: str, check: str):
+    from modules.monitor_scheduler import MonitorRegistry
+
+    reg = MonitorRegistry()
+    cfg = reg.get(site_id)
+    if not cfg or check not in (cfg.get("checks") or []):
+        return {"ok": False, "site_id": site_id, "check": check, "skipped": "site not registered for this check"}
+
+    try:
+        if check == "healthcheck":
+            result = _http_healthcheck(cfg["url"], cfg.get("keyword"))
+        elif check == "outdated":
+            # call the task body in-process: no second queue hop
+            creds = reg.credentials(cfg)
+            result = wp_outdated_fetch_task(url=cfg["url"], headers=creds["headers"],
+                                            basic_auth=creds["basic_auth"])
+            result = {k: v for k, v in (result or {}).items() if k != "raw"}
+        elif check == "domain_ssl":
+            result = domain_ssl_collect_task(domain=cfg["domain"])
+        else:
+            result = {"ok": False, "error": f"unknown check {check}"}
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+
+    reg.store_result(check, site_id, result)
+    ok = bool((result or {}).get("ok"))
+    # one per site per check: sampled when ok, always kept when not
+    log_json(log, "monitor.check", level=logging.INFO if ok else logging.WARNING,
+             site_id=site_id, check=check, ok=ok)
+    return {"site_id": site_id, "check": check, **(result or {})}
+
+
+# -----------------------------------------------------------------------------
+# Visual regression (warm browser pool + fleet-wide perceptual hash diff)
+# -----------------------------------------------------------------------------
+@celery.task(bind=True, name="screenshot.visual_regression")
+def visual_regression_task(self, urls: Optional[List[str]] = None, set_baseline: bool = False,
+                           threshold: Optional[int] = None, region_threshold: Optional[int] = None):
+    """
+    Capture every site (monitored sites when `urls` is empty), hash the
+    screenshots and compare all of them against their baselines at once.
+    """
+    from modules.screenshots import take_screenshots, perceptual_hash, HashStore
+    from modules.status_history import site_key
+
+    if not urls:
+        from modules.monitor_scheduler import MonitorRegistry
+        urls = [cfg["url"] for cfg in MonitorRegistry().all().values()]
+    jobs = [(u, os.path.join(settings.SCREENSHOT_DIR, f"{site_key(u)}.png")) for u in urls]
+
+    current: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for (url, path), shot in zip(jobs, take_screenshots(jobs)):
+        site = site_key(url)
+        if not shot["ok"]:
+            errors[site] = shot["error"]
+            continue
         try:
-            send_report_email(report_email, f"[{settings.APP_NAME}] WP all-updates for {base_url}", result or {})
+            current[site] = perceptual_hash(path)
         except Exception as e:
-            result = {"_original": result, "_email_error": str(e)}
-    return result
+            errors[site] = f"hash failed: {e}"
+
+    store = HashStore()
+    if current:
+        store.update(current, set_baseline=set_baseline)
+    report = store.compare(threshold if threshold is not None else settings.VISUAL_DIFF_THRESHOLD,
+                           region_threshold if region_threshold is not None else settings.VISUAL_REGION_THRESHOLD,
+                           sites=list(current))
+    changed = [r["site"] for r in report if r["changed"]]
+    log.info("[visual] %d captured, %d changed, %d failed", len(current), len(changed), len(errors))
+    return {"ok": not changed and not errors, "captured": len(current), "changed": changed,
+            "errors": errors, "sites": report}
+
+
+# -----------------------------------------------------------------------------
+# Content scanning sweep
+# -----------------------------------------------------------------------------
+@celery.task(bind=True, name="content.scan.sweep")
+def content_scan_sweep_task(self, urls: Optional[List[str]] = None,
+                            allowed_domains: Optional[List[str]] = None, concurrency: int = 20):
+    """Indicator/link/exposed-path scan over many sites (monitored sites when `urls` is empty)."""
+    from modules.content_scanner import scan_many_sync
+
+    if urls:
+        targets = [{"url": u, "allowed_domains": allowed_domains} for u in urls]
+    else:
+        from modules.monitor_scheduler import MonitorRegistry
+        targets = [{"url": cfg["url"], "keyword": cfg.get("keyword"), "allowed_domains": allowed_domains}
+                   for cfg in MonitorRegistry().all().values()]
+    results = scan_many_sync(targets, concurrency=concurrency)
+    flagged = [r["url"] for r in results if not r["scan"]["clean"]]
+    log.info("[scan] %d site(s), %d flagged", len(results), len(flagged))
+    return {"ok": not flagged, "total": len(results), "flagged": flagged, "results": results}
+
+
+# -----------------------------------------------------------------------------
+# Backup repository retention + garbage collection
+# -----------------------------------------------------------------------------
+@celery.task(bind=True, name="backup.repo.prune")
+def backup_repo_prune_task(self, policy: Optional[Dict[str, int]] = None, site: Optional[str] = None,
+                           dry_run: bool = False, full_gc: bool = False):
+    """Forget backups outside the retention policy (settings defaults), then delete unreferenced chunks."""
+    from modules.backup_repo import BackupRepo
+
+    policy = {
+        "keep_last": settings.BACKUP_KEEP_LAST, "keep_daily": settings.BACKUP_KEEP_DAILY,
+        "keep_weekly": settings.BACKUP_KEEP_WEEKLY, "keep_monthly": settings.BACKUP_KEEP_MONTHLY,
+        **(policy or {}),
+    }
+    repo = BackupRepo()
+    retention = repo.apply_retention(site=site, dry_run=dry_run, **policy)
+    gc = None if dry_run else repo.gc(full=full_gc)
+    log.info("[backup-repo] forgot %s backup(s), gc=%s", retention["forgotten"], gc)
+    return {"policy": policy, "retention": retention, "gc": gc, "stats": repo.stats()}
+
 
 # PYTHONPATH=. celery -A celery_app worker -l info
 # PYTHONPATH=. celery -A celery_app worker -l info --pool=solo
@@ -26,9 +26,69 @@ class Settings(BaseSettings):
     SMTP_PASS: str | None = None
     SMTP_FROM: str = "no-reply@example.com"
     SMTP_STARTTLS: bool = False
+    SMTP_IDLE_TIMEOUT: int = 60         # seconds before a pooled SMTP connection is recycled
+    EMAIL_DIGEST_WINDOW: int = 0        # seconds; >0 merges reports per recipient into one digest
+    EMAIL_MAX_RETRIES: int = 5
+
+    # Status history (delta-encoded per-site snapshots in Redis)
+    HISTORY_ENABLED: bool = True
+    FLEET_INDEX_ENABLED: bool = True    # plugin/theme slug -> sites inverted index
+
+    # Periodic monitoring (celery beat; periods in seconds)
+    MONITOR_ENABLED: bool = True
+    MONITOR_TICK_SECONDS: int = 60
+    MONITOR_HEALTHCHECK_PERIOD: int = 300
+    MONITOR_OUTDATED_PERIOD: int = 21600
+    MONITOR_DOMAIN_SSL_PERIOD: int = 86400
+
+    # Screenshots / visual regression
+    SCREENSHOT_DIR: str = "/tmp/screenshots"
+    SCREENSHOT_POOL_SIZE: int = 2       # warm Playwright pages per worker; 0 = always spawn a CLI tool
+    VISUAL_DIFF_THRESHOLD: int = 10     # whole-page dHash bits
+    VISUAL_REGION_THRESHOLD: int = 12   # per-region dHash bits
+
+    # SFTP transfers (backup downloads)
+    TRANSFER_DIR: str = "/tmp/transfers"    # stable per (host, file) so retries resume
+    TRANSFER_PARALLEL: int = 4              # SFTP channels for large files
+
+    # Backup repository (controller side, deduplicated across sites)
+    BACKUP_REPO_DIR: str = "/data/backup-repo"
+    BACKUP_KEEP_LAST: int = 7
+    BACKUP_KEEP_DAILY: int = 14
+    BACKUP_KEEP_WEEKLY: int = 8
+    BACKUP_KEEP_MONTHLY: int = 12
+    BACKUP_PRUNE_PERIOD: int = 86400    # seconds between beat-driven retention + gc runs; 0 = off
+
+    # Admission control on enqueue endpoints (token buckets in Redis; 0 = off)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_CLIENT_RATE: float = 1.0     # tokens/second per client (X-Client-ID or peer IP)
+    RATE_LIMIT_CLIENT_BURST: int = 20
+    RATE_LIMIT_SITE_RATE: float = 0.2       # tokens/second per target site
+    RATE_LIMIT_SITE_BURST: int = 5
+    QUEUE_MAX_DEPTH: int = 5000             # refuse new tasks while the broker backlog is this deep
+    QUEUE_RETRY_AFTER: int = 30             # Retry-After (seconds) sent with a queue-full 429
+
+    # Coalescing of identical read-only tasks (wp-status, outdated fetch, domain/SSL)
+    SINGLEFLIGHT_ENABLED: bool = True
+    SINGLEFLIGHT_FRESH_SECONDS: int = 60     # reuse a successful result this long
+    SINGLEFLIGHT_INFLIGHT_TTL: int = 900     # max time an unfinished task keeps the slot
+
+    # One mutating task per site at a time (updates, backups, reset, provision)
+    SITE_LOCK_ENABLED: bool = True
+    SITE_LOCK_LEASE: int = 60           # seconds; renewed every lease/3 while the task runs
+    SITE_LOCK_RETRY: int = 5            # countdown per task ahead in the site's queue
+    SITE_LOCK_RETRY_MAX: int = 60
+
+    # Logging (queue-backed; see logger.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"            # json | text
+    LOG_QUEUE_SIZE: int = 10000         # records buffered before new ones are dropped (and counted)
+    LOG_SAMPLING: str = "wp_outdated.fetch=0.1,domain_ssl.collect=0.1,monitor.check=0.1"   # event=rate,...
 
     # Security — required by /tasks/wp-reset
     RESET_TOKEN: str | None = None
+    # Fernet key encrypting site credentials kept in Redis (monitor registry, update waves)
+    CREDENTIALS_KEY: str | None = None
 
     # CORS (comma-separated in .env, e.g., "https://a.com,https://b.com" or "*")
     CORS_ALLOW_ORIGINS: List[str] = ["*"]
@@ -1,31 +1,132 @@
-import smtplib, ssl, json
+import smtplib, ssl, json, threading, time
 from email.message import EmailMessage
-from typing import Dict, Any
+from typing import Dict, Any, List
 from config import settings
 
-def send_report_email(to_email: str, subject: str, report: Dict[str, Any]):
-    if not to_email:
-        return
-    msg = EmailMessage()
-    msg["From"] = settings.SMTP_FROM
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    body = [
-        "WordPress Provisioning Report",
-        "",
-        json.dumps(report, indent=2)
-    ]
+OUTBOX_PREFIX = "email:outbox"
+
+# -----------------------------------------------------------------------------
+# Persistent SMTP connection (one per worker process)
+# -----------------------------------------------------------------------------
+_smtp_lock = threading.Lock()
+_smtp: smtplib.SMTP | None = None
+_smtp_last_used = 0.0
+
+def _open_smtp() -> smtplib.SMTP:
+    server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=30)
+    if settings.SMTP_STARTTLS:
+        server.starttls(context=ssl.create_default_context())
+    if settings.SMTP_USER and settings.SMTP_PASS:
+        server.login(settings.SMTP_USER, settings.SMTP_PASS)
+    return server
+
+def _close_smtp():
+    global _smtp
+    if _smtp is not None:
+        try: _smtp.quit()
+        except Exception: pass
+    _smtp = None
+
+def _send(msg: EmailMessage):
+    """
+    Send over the cached connection. Reconnects once if the server dropped us
+    (idle timeout, restart); any further error is raised to the caller.
+    """
+    global _smtp, _smtp_last_used
+    with _smtp_lock:
+        if _smtp is not None and time.monotonic() - _smtp_last_used > settings.SMTP_IDLE_TIMEOUT:
+            _close_smtp()
+        for attempt in (1, 2):
+            if _smtp is None:
+                _smtp = _open_smtp()
+            try:
+                _smtp.send_message(msg)
+                _smtp_last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                _close_smtp()
+                if attempt == 2:
+                    raise
+
+# -----------------------------------------------------------------------------
+# Message builders
+# -----------------------------------------------------------------------------
+def _report_lines(report: Dict[str, Any]) -> List[str]:
+    body = [json.dumps(report, indent=2)]
     # include quick creds if present
     if "admin_user" in report:
         body += ["", f"Admin User: {report['admin_user']}"]
     if "db_user" in report and "db_name" in report:
         body += [f"DB: {report['db_name']} / {report['db_user']}"]
-    msg.set_content("\n".join(body))
-
-    context = ssl.create_default_context()
-    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-        if settings.SMTP_STARTTLS:
-            server.starttls(context=context)
-        if settings.SMTP_USER and settings.SMTP_PASS:
-            server.login(settings.SMTP_USER, settings.SMTP_PASS)
-        server.send_message(msg)
\ No newline at end of file
+    return body
+
+def _message(to_email: str, subject: str, lines: List[str]) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = settings.SMTP_FROM
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content("\n".join(lines))
+    return msg
+
+def send_report_email(to_email: str, subject: str, report: Dict[str, Any]):
+    if not to_email:
+        return
+    lines = ["WordPress Provisioning Report", ""] + _report_lines(report)
+    _send(_message(to_email, subject, lines))
+
+def send_digest_email(to_email: str, items: List[Dict[str, Any]]):
+    """
+    One message for many queued reports: [{"subject": str, "report": dict, "queued_at": float}, ...]
+    """
+    if not to_email or not items:
+        return
+    subject = items[0]["subject"] if len(items) == 1 else f"[{settings.APP_NAME}] Digest: {len(items)} task reports"
+    lines = [f"{settings.APP_NAME} — {len(items)} task report(s)", ""]
+    lines += [f"  {i}. {it['subject']}" for i, it in enumerate(items, 1)]
+    for i, it in enumerate(items, 1):
+        lines += ["", "=" * 72, f"{i}. {it['subject']}", "=" * 72]
+        lines += _report_lines(it.get("report") or {})
+    _send(_message(to_email, subject, lines))
+
+# -----------------------------------------------------------------------------
+# Digest outbox (Redis list per recipient)
+# -----------------------------------------------------------------------------
+def outbox_push(to_email: str, subject: str, report: Dict[str, Any]) -> bool:
+    """
+    Append a report to the recipient's digest outbox.
+    Returns True when this push opened a new digest window, i.e. the caller
+    should schedule a flush for `EMAIL_DIGEST_WINDOW` seconds from now.
+    """
+    from redis_client import get_redis
+    r = get_redis()
+    key = f"{OUTBOX_PREFIX}:{to_email.lower()}"
+    item = json.dumps({"subject": subject, "report": report, "queued_at": time.time()}, default=str)
+    pipe = r.pipeline()
+    pipe.rpush(key, item)
+    pipe.set(f"{key}:window", "1", nx=True, ex=max(int(settings.EMAIL_DIGEST_WINDOW) * 2, 60))
+    _, opened = pipe.execute()
+    return bool(opened)
+
+def outbox_drain(to_email: str) -> List[Dict[str, Any]]:
+    """
+    Atomically take everything queued for a recipient and close the window,
+    so reports arriving after this point open a fresh one.
+    """
+    from redis_client import get_redis
+    r = get_redis()
+    key = f"{OUTBOX_PREFIX}:{to_email.lower()}"
+    pipe = r.pipeline()
+    pipe.lrange(key, 0, -1)
+    pipe.delete(key)
+    pipe.delete(f"{key}:window")
+    raw, _, _ = pipe.execute()
+    return [json.loads(x) for x in raw]
+
+def outbox_requeue(to_email: str, items: List[Dict[str, Any]]):
+    """Put undelivered items back at the head of the outbox (used before a retry)."""
+    if not items:
+        return
+    from redis_client import get_redis
+    r = get_redis()
+    key = f"{OUTBOX_PREFIX}:{to_email.lower()}"
+    r.lpush(key, *[json.dumps(it, default=str) for it in reversed(items)])
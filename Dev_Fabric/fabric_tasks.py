@@ -1,6 +1,7 @@
 from fabric import task
 from invoke.exceptions import UnexpectedExit
 import json, datetime, tempfile, os
+from abc import ABC, abstractmethod
 from task_runner import _take_screenshot, _tool_exists
 from pathlib import Path
 from shlex import quote as Q
@@ -27,6 +28,17 @@ def wp_status(c, wp_path):
     themes = wp(c, wp_path, "theme list --update=available --format=json").stdout or "[]"
     return {"core": json.loads(core), "plugins": json.loads(plugins), "themes": json.loads(themes)}
 
+def _write_checksummed(c, producer, out_path):
+    """
+    `producer | tee out_path | sha256sum` under pipefail: the archive is hashed
+    while it is written (no second read) and "<out_path>.sha256" is left next
+    to it for `sha256sum -c`. Returns the hex digest.
+    """
+    name = os.path.basename(out_path)
+    r = c.run(f"set -o pipefail; {producer} | tee {out_path} | sha256sum "
+              f"| awk '{{print $1\"  {name}\"}}' | tee {out_path}.sha256", hide=True)
+    return r.stdout.split()[0]
+
 @task
 def backup_site(c, wp_path, db_name, db_user, db_pass, out_dir="/tmp/backups"):
     ts = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
@@ -34,9 +46,10 @@ def backup_site(c, wp_path, db_name, db_user, db_pass, out_dir="/tmp/backups"):
     tar = f"{out_dir}/wp-content-{ts}.tar.gz"
     c.run(f"mkdir -p {out_dir}")
     with c.prefix(f"export MYSQL_PWD='{db_pass}'"):
-        c.run(f"mysqldump -u {db_user} {db_name} | gzip > {sql}")
-    c.run(f"tar -C {wp_path} -czf {tar} wp-content")
-    return {"db_dump": sql, "content_tar": tar, "timestamp": ts}
+        sql_sum = _write_checksummed(c, f"mysqldump -u {db_user} {db_name} | gzip", sql)
+    tar_sum = _write_checksummed(c, f"tar -C {wp_path} -czf - wp-content", tar)
+    return {"db_dump": sql, "db_dump_sha256": sql_sum, "content_tar": tar, "content_tar_sha256": tar_sum,
+            "timestamp": ts}
 
 @task
 def backup_db(c, db_name, db_user, db_pass, out_dir="/tmp/backups"):
@@ -44,33 +57,252 @@ def backup_db(c, db_name, db_user, db_pass, out_dir="/tmp/backups"):
     sql = f"{out_dir}/{db_name}-{ts}.sql.gz"
     c.run(f"mkdir -p {out_dir}")
     with c.prefix(f"export MYSQL_PWD='{db_pass}'"):
-        c.run(f"mysqldump -u {db_user} {db_name} | gzip > {sql}")
-    return {"db_dump": sql, "timestamp": ts}
+        sql_sum = _write_checksummed(c, f"mysqldump -u {db_user} {db_name} | gzip", sql)
+    return {"db_dump": sql, "db_dump_sha256": sql_sum, "timestamp": ts}
 
 @task
 def backup_wp_content(c, wp_path, out_dir="/tmp/backups"):
     ts = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
     tar = f"{out_dir}/wp-content-{ts}.tar.gz"
     c.run(f"mkdir -p {out_dir}")
-    c.run(f"tar -C {wp_path} -czf {tar} wp-content")
-    return {"content_tar": tar, "timestamp": ts}
+    tar_sum = _write_checksummed(c, f"tar -C {wp_path} -czf - wp-content", tar)
+    return {"content_tar": tar, "content_tar_sha256": tar_sum, "timestamp": ts}
+
+# ----------------------------
+# Incremental DB backups (binlog) + point-in-time restore
+# ----------------------------
+# <out_dir>/binlog/<db>/state.json lists "chains": a full base dump taken with
+# --flush-logs (so it starts exactly at a binlog boundary; the position is read
+# back from the dump header), plus the closed binlog files shipped after it as
+# gzip "segments". An incremental run is FLUSH BINARY LOGS + copying the binlogs
+# closed since the last run, i.e. only what changed. A new base is taken every
+# `full_every_hours`, or when binlogs the chain needs were purged before shipping.
+# MySQL-level statements run as root over the socket (auth_socket, as in
+# wp_provision.sh): --source-data and FLUSH BINARY LOGS need RELOAD/REPLICATION
+# CLIENT, and binlog files are only readable by mysql/root.
+
+def _mysql_root(c, sql):
+    return c.run(f"mysql -N -B -e {Q(sql)}", hide=True)
+
+def _binlog_index(name):
+    return int(name.rsplit(".", 1)[-1])
+
+def _binary_logs(c):
+    return [line.split("\t")[0] for line in _mysql_root(c, "SHOW BINARY LOGS").stdout.splitlines() if line.strip()]
+
+def _binlog_state(c, state_dir):
+    r = c.run(f"cat {Q(state_dir)}/state.json 2>/dev/null", hide=True, warn=True)
+    try:
+        return json.loads(r.stdout or "")
+    except ValueError:
+        return {"chains": []}
+
+def _save_binlog_state(c, state_dir, state):
+    tmp = f"{state_dir}/state.json.tmp"
+    c.run(f"printf %s {Q(json.dumps(state))} > {Q(tmp)} && mv {Q(tmp)} {Q(state_dir)}/state.json", hide=True)
+
+def _binlog_base(c, db_name, state_dir):
+    ts = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    chain_dir = f"{state_dir}/{ts}"
+    base = f"{chain_dir}/base.sql.gz"
+    c.run(f"mkdir -p {Q(chain_dir)}")
+    opt = "--source-data=2" if c.run("mysqldump --help | grep -q -- --source-data", hide=True, warn=True).ok \
+        else "--master-data=2"
+    # taken before the dump starts: targets from here on are served by this chain
+    server_time = c.run("date '+%Y-%m-%d %H:%M:%S'", hide=True).stdout.strip()
+    c.run(f"set -o pipefail; mysqldump --single-transaction --flush-logs {opt} --quick --routines --triggers "
+          f"{Q(db_name)} | gzip -1 > {Q(base)}", hide=True)
+    head = c.run(f"gunzip -c {Q(base)} | head -n 100 | grep -m1 -oE \"_LOG_FILE='[^']+', *[A-Z]+_LOG_POS=[0-9]+\"",
+                 hide=True, warn=True).stdout.strip()
+    if not head:
+        c.run(f"rm -rf {Q(chain_dir)}", warn=True)
+        raise RuntimeError("binlog position not found in dump header (is log_bin enabled?)")
+    size = int(c.run(f"stat -c %s {Q(base)}", hide=True).stdout.strip())
+    return {"id": ts, "dir": chain_dir, "base": base, "base_bytes": size, "base_time": server_time,
+            "start_file": head.split("'")[1], "start_pos": int(head.rsplit("=", 1)[-1]), "segments": []}
+
+def _last_shipped(chain):
+    return max([_binlog_index(chain["start_file"]) - 1] + [_binlog_index(seg["file"]) for seg in chain["segments"]])
+
+def _ship_binlogs(c, chain, closed, binlog_dir):
+    """gzip the chain's closed, not yet shipped binlogs into its directory."""
+    new_segments = []
+    for name in closed:
+        if _binlog_index(name) <= _last_shipped(chain):
+            continue
+        dest = f"{chain['dir']}/{name}.gz"
+        c.run(f"gzip -1 -c {Q(binlog_dir + '/' + name)} > {Q(dest)}", hide=True)
+        size = int(c.run(f"stat -c %s {Q(dest)}", hide=True).stdout.strip())
+        seg = {"file": name, "path": dest, "bytes": size,
+               "shipped_at": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}
+        chain["segments"].append(seg)
+        new_segments.append(seg)
+    return new_segments
 
 @task
-def healthcheck(c, url, keyword=None, screenshot=False, out_path="/tmp/site.png"):
-    # basic HTTP probe
-    r = c.local(f"curl -s -w '%{{http_code}}' -o /tmp/_hc_body {url}", hide=True, warn=True)
-    code = int((r.stdout or "")[-3:])
-    body = ""
+def backup_db_incremental(c, db_name, db_user, db_pass, out_dir="/tmp/backups", full_every_hours=24,
+                          force_full=False, keep_chains=2):
+    """
+    Point-in-time DB backup: full base dump every `full_every_hours`, binlog
+    segments in between. Requires log_bin (wp_provision.sh enables it).
+    db_user/db_pass are accepted for signature parity; the dump runs as root.
+    """
+    state_dir = f"{out_dir}/binlog/{db_name}"
+    c.run(f"mkdir -p {Q(state_dir)}")
+    if _mysql_root(c, "SELECT @@log_bin").stdout.strip() != "1":
+        return {"ok": False, "error": "binary logging is disabled on this server"}
+    binlog_dir = os.path.dirname(_mysql_root(c, "SELECT @@log_bin_basename").stdout.strip())
+
+    state = _binlog_state(c, state_dir)
+    chain = state["chains"][-1] if state["chains"] else None
+
+    # close the current binlog so everything written so far is in a complete file
+    _mysql_root(c, "FLUSH BINARY LOGS")
+    logs = _binary_logs(c)
+    closed = logs[:-1]
+
+    reason = None
+    new_segments = []
+    continued = None
+    if chain is None:
+        reason = "no base yet"
+    elif _last_shipped(chain) + 1 < _binlog_index(logs[0]):
+        reason = "binlogs purged before they were shipped"
+    else:
+        continued = chain
+        new_segments = _ship_binlogs(c, chain, closed, binlog_dir)
+        age = datetime.datetime.utcnow() - datetime.datetime.strptime(chain["id"], "%Y%m%d%H%M%S")
+        if force_full:
+            reason = "forced"
+        elif age.total_seconds() >= float(full_every_hours) * 3600:
+            reason = "base older than full_every_hours"
+
+    if reason is not None:
+        # the dump flushes the logs itself; its start file is shipped once it is closed
+        chain = _binlog_base(c, db_name, state_dir)
+        state["chains"].append(chain)
+        if continued is not None:
+            # writes between the FLUSH above and the dump's own flush are in the file
+            # just before the new start file: ship it so the old chain ends where this one starts
+            start = _binlog_index(chain["start_file"])
+            tail = [name for name in _binary_logs(c) if _binlog_index(name) < start]
+            new_segments += _ship_binlogs(c, continued, tail, binlog_dir)
+
+    # retention: whole chains only (a chain is useless without its base)
+    keep = max(1, int(keep_chains))
+    dropped, state["chains"] = state["chains"][:-keep], state["chains"][-keep:]
+    for old in dropped:
+        c.run(f"rm -rf {Q(old['dir'])}", warn=True)
+    _save_binlog_state(c, state_dir, state)
+
+    return {
+        "ok": True, "mode": "full" if reason else "incremental", "reason": reason, "chain": chain["id"],
+        "base": chain["base"] if reason else None,
+        "base_bytes": chain["base_bytes"] if reason else 0,
+        "segments": new_segments, "segment_bytes": sum(seg["bytes"] for seg in new_segments),
+        "restorable_from": state["chains"][0]["base_time"], "chains": len(state["chains"]),
+        "dropped_chains": [old["id"] for old in dropped],
+    }
+
+@task
+def restore_db_pitr(c, db_name, db_user, db_pass, target, out_dir="/tmp/backups", dry_run=False):
+    """
+    Restore `db_name` to `target` ("YYYY-MM-DD HH:MM:SS", server local time):
+    newest base taken before the target, then its binlogs (shipped segments, then
+    any still on the server) replayed with mysqlbinlog --stop-datetime.
+    """
+    state_dir = f"{out_dir}/binlog/{db_name}"
+    target_dt = datetime.datetime.strptime(target, "%Y-%m-%d %H:%M:%S")
+    all_chains = _binlog_state(c, state_dir)["chains"]
+    chains = [ch for ch in all_chains
+              if datetime.datetime.strptime(ch["base_time"], "%Y-%m-%d %H:%M:%S") <= target_dt]
+    if not chains:
+        return {"ok": False, "error": f"no base backup taken before {target}"}
+    chain = chains[-1]
+
+    shipped = sorted(chain["segments"], key=lambda seg: _binlog_index(seg["file"]))
+    last = _last_shipped(chain)
+    basename = _mysql_root(c, "SELECT @@log_bin_basename").stdout.strip()
+    live = []
+    if chain is all_chains[-1]:
+        # older chains end where the next base starts; only the newest continues in the live binlogs
+        live = [name for name in _binary_logs(c) if _binlog_index(name) > last]
+        if live and _binlog_index(live[0]) != last + 1:
+            return {"ok": False, "error": f"binlog gap after #{last}: unshipped logs were purged", "chain": chain["id"]}
+    else:
+        following = all_chains[all_chains.index(chain) + 1]
+        if last + 1 < _binlog_index(following["start_file"]):
+            # chains closed before their last file was shipped cannot reach the next base
+            return {"ok": False, "error": f"binlog gap after #{last}: chain ends before {following['start_file']}",
+                    "chain": chain["id"], "next_chain": following["id"]}
+
+    plan = {"chain": chain["id"], "base": chain["base"], "base_time": chain["base_time"],
+            "start": f"{chain['start_file']}:{chain['start_pos']}",
+            "segments": [seg["file"] for seg in shipped], "live_binlogs": live, "target": target}
+    if dry_run:
+        return {"ok": True, "dry_run": True, **plan}
+
+    work = c.run("mktemp -d", hide=True).stdout.strip()
     try:
-        with open("/tmp/_hc_body", "r", encoding="utf-8", errors="ignore") as fh:
-            body = fh.read(2000)
-    except Exception:
-        pass
-    ok = code == 200 and ((keyword in body) if keyword else True)
+        files = []
+        for seg in shipped:
+            c.run(f"gunzip -c {Q(seg['path'])} > {Q(work + '/' + seg['file'])}", hide=True)
+            files.append(f"{work}/{seg['file']}")
+        files += [f"{os.path.dirname(basename)}/{name}" for name in live]
+
+        # base + replay are not written back to the binlog (sql_log_bin=0 / --disable-log-bin)
+        c.run(f"set -o pipefail; {{ echo 'SET sql_log_bin=0;'; gunzip -c {Q(chain['base'])}; }} "
+              f"| mysql {Q(db_name)}", hide=True)
+        replayed = 0
+        if files:
+            # start position only applies to the first file, which is the chain's start file
+            start = f"--start-position={int(chain['start_pos'])} " \
+                if os.path.basename(files[0]) == chain["start_file"] else ""
+            c.run(f"set -o pipefail; mysqlbinlog --skip-gtids --disable-log-bin --database={Q(db_name)} {start}"
+                  f"--stop-datetime={Q(target)} {' '.join(Q(f) for f in files)} | mysql {Q(db_name)}", hide=True)
+            replayed = len(files)
+    finally:
+        c.run(f"rm -rf {Q(work)}", warn=True)
+    return {"ok": True, "restored_to": target, "binlogs_replayed": replayed, **plan}
+
+
+@task
+def repo_backup(c, wp_path, db_name, db_user, db_pass, kind="site", name=None):
+    """
+    Stream a backup straight into the controller's backup repository
+    (nothing is written on the host). kind: "db", "content" or "site" (both).
+    """
+    from modules.backup_repo import BackupRepo, ingest_command
+    repo = BackupRepo()
+    site = name or f"{c.host}:{wp_path}"
+    commands = {
+        "db": f"MYSQL_PWD={Q(db_pass)} mysqldump --single-transaction --quick -u {Q(db_user)} {Q(db_name)} | gzip -1",
+        "content": f"tar -C {Q(wp_path)} -cf - wp-content | gzip -1",
+    }
+    kinds = ["db", "content"] if kind == "site" else [kind]
+    out = {"site": site, "backups": []}
+    for k in kinds:
+        cmd = f"bash -o pipefail -c {Q(commands[k])}"
+        out["backups"].append(ingest_command(c, repo, site, k, cmd, meta={"wp_path": wp_path, "db_name": db_name}))
+    return out
+
+@task
+def healthcheck(c, url, keyword=None, screenshot=False, out_path="/tmp/site.png", scan=False, allowed_domains=None):
+    # basic HTTP probe (in-process; streams the body, no temp file)
+    if scan:
+        # same single fetch, plus indicator/link scan and suspicious-path probes
+        from modules.content_scanner import scan_site_sync
+        r = scan_site_sync(url, keyword=keyword, allowed_domains=allowed_domains)
+    else:
+        from modules.http_prober import probe_sync
+        r = probe_sync(url, keyword=keyword)
 
-    result = {"url": url, "status": code, "ok": ok}
+    result = {"url": url, "status": r["status"], "ok": r["ok"], "timings_ms": r["timings_ms"]}
     if keyword:
-        result["keyword_present"] = (keyword in body)
+        result["keyword_present"] = r.get("keyword_present", False)
+    for k in ("ip", "tls", "error", "scan"):
+        if r.get(k) is not None:
+            result[k] = r[k]
 
     # optional screenshot
     if screenshot:
@@ -122,25 +354,333 @@ def provision_wp_sh(c, domain, wp_path="/var/www/html", site_title="My Site",
     return json.loads(out or "{}")
 
 
+# ----------------------------
+# Pre-update wp-content snapshots
+# ----------------------------
+# Fastest mechanism the host supports, probed once per update:
+#   btrfs    wp-content is a btrfs subvolume -> read-only subvolume snapshot (instant, CoW)
+#   reflink  cp --reflink works between wp-content and the snapshot dir (btrfs/XFS) -> CoW copy
+#   hardlink rsync --link-dest against the previous snapshot; unchanged files are
+#            hardlinks to it, so only the first snapshot costs a full copy
+#   tar      the original gzip tarball (always available)
+# Directory snapshots live outside the docroot, in <parent>/.wp-snapshots/<name>,
+# and only the newest `keep` are retained. The DB is still dumped with mysqldump.
+
+class _SnapshotProvider(ABC):
+    name = "base"
+
+    @staticmethod
+    def available(probe):
+        return False
+
+    @abstractmethod
+    def take(self, c, wp_path, out_dir, keep=2):
+        """Snapshot wp-content; returns the fields stored in the update snapshot."""
+
+    @abstractmethod
+    def restore(self, c, snap, wp_path):
+        """Put wp-content back from what take() returned."""
+
+    def remove(self, c, path):
+        # older snapshots may come from another provider: subvolume or plain dir
+        c.run(f"btrfs subvolume delete {Q(path)} >/dev/null 2>&1 || rm -rf {Q(path)}", hide=True, warn=True)
+
+
+class _DirSnapshot(_SnapshotProvider):
+    """Directory snapshots under _snapshot_root(); only the newest `keep` are retained."""
+
+    @abstractmethod
+    def copy_tree(self, c, live, dest, prev):
+        ...
+
+    @abstractmethod
+    def restore_tree(self, c, snap_path, live):
+        ...
+
+    def take(self, c, wp_path, out_dir, keep=2):
+        live = f"{wp_path.rstrip('/')}/wp-content"
+        root = _snapshot_root(wp_path)
+        existing = _list_snapshots(c, root)
+        dest = f"{root}/wp-content-{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
+        try:
+            self.copy_tree(c, live, dest, existing[-1] if existing else None)
+        except Exception:
+            self.remove(c, dest)
+            raise
+        for old in existing[:max(0, len(existing) + 1 - max(1, keep))]:
+            self.remove(c, old)
+        return {"content_snapshot": dest}
+
+    def restore(self, c, snap, wp_path):
+        # exact copy of the tree (owners/modes included), no chmod pass needed
+        self.restore_tree(c, snap["content_snapshot"], f"{wp_path.rstrip('/')}/wp-content")
+
+    def swap_in(self, c, live, build):
+        """
+        build(tmp) creates the restored tree next to live; only a complete tree is
+        swapped in (two renames), and live is put back if the swap fails. A
+        .failed left by an interrupted swap holds the original when live is gone.
+        """
+        tmp, failed = f"{live}.restoring", f"{live}.failed"
+        c.run(f"if [ ! -e {Q(live)} ] && [ -e {Q(failed)} ]; then mv {Q(failed)} {Q(live)}; fi", hide=True)
+        self.remove(c, failed)
+        self.remove(c, tmp)
+        try:
+            build(tmp)
+        except Exception:
+            self.remove(c, tmp)
+            raise
+        c.run(f"mv {Q(live)} {Q(failed)} && {{ mv {Q(tmp)} {Q(live)} || {{ mv {Q(failed)} {Q(live)}; exit 1; }}; }}",
+              hide=True)
+        self.remove(c, failed)
+
+
+class _BtrfsSnapshot(_DirSnapshot):
+    name = "btrfs"
+
+    @staticmethod
+    def available(probe):
+        return probe["subvolume"] and probe["snap_fs"] == "btrfs"
+
+    def copy_tree(self, c, live, dest, prev):
+        c.run(f"btrfs subvolume snapshot -r {Q(live)} {Q(dest)}", hide=True)
+
+    def restore_tree(self, c, snap_path, live):
+        # writable snapshot of the read-only one
+        self.swap_in(c, live, lambda tmp: c.run(f"btrfs subvolume snapshot {Q(snap_path)} {Q(tmp)}", hide=True))
+
+
+class _ReflinkSnapshot(_DirSnapshot):
+    name = "reflink"
+
+    @staticmethod
+    def available(probe):
+        return probe["reflink"]
+
+    def copy_tree(self, c, live, dest, prev):
+        c.run(f"cp -a --reflink=always {Q(live)} {Q(dest)}", hide=True)
+
+    def restore_tree(self, c, snap_path, live):
+        self.swap_in(c, live, lambda tmp: c.run(f"cp -a --reflink=always {Q(snap_path)} {Q(tmp)}", hide=True))
+
+
+class _HardlinkSnapshot(_DirSnapshot):
+    name = "hardlink"
+
+    @staticmethod
+    def available(probe):
+        return probe["rsync"]
+
+    def copy_tree(self, c, live, dest, prev):
+        # hardlinks only ever point into the previous snapshot, never at live files,
+        # so in-place writes to wp-content cannot alter a snapshot
+        link = f"--link-dest={Q(prev)} " if prev else ""
+        c.run(f"rsync -a --delete {link}{Q(live)}/ {Q(dest)}/", hide=True)
+
+    def restore_tree(self, c, snap_path, live):
+        # copies only what differs; never hardlinks live files to the snapshot
+        c.run(f"rsync -a --delete {Q(snap_path)}/ {Q(live)}/", hide=True)
+
+
+class _TarSnapshot(_SnapshotProvider):
+    name = "tar"
+
+    @staticmethod
+    def available(probe):
+        return True
+
+    def take(self, c, wp_path, out_dir, keep=2):
+        return {"content_tar": backup_wp_content(c, wp_path, out_dir)["content_tar"]}
+
+    def restore(self, c, snap, wp_path):
+        # Ensure wp-content exists
+        c.run(f"mkdir -p {wp_path}/wp-content", warn=True)
+        # Extract tarball into wp_path; paths inside tar are 'wp-content/...'
+        c.run(f"tar -C {wp_path} -xzf {snap['content_tar']}", warn=False)
+        # Safe permissions (common defaults), one pass over the tree
+        c.run(f"find {wp_path}/wp-content \\( -type d -exec chmod 755 {{}} + \\) -o \\( -type f -exec chmod 644 {{}} + \\)", warn=True)
+
+
+_SNAPSHOT_PROVIDERS = [_BtrfsSnapshot, _ReflinkSnapshot, _HardlinkSnapshot, _TarSnapshot]
+
+def _snapshot_root(wp_path):
+    wp_path = wp_path.rstrip("/")
+    return f"{os.path.dirname(wp_path) or '/'}/.wp-snapshots/{os.path.basename(wp_path) or 'root'}"
+
+def _probe_snapshot_support(c, live, root):
+    """One round trip: fs types, subvolume, a real reflink attempt, rsync."""
+    script = (
+        f"W={Q(live)}; S={Q(root)}; mkdir -p \"$S\"; "
+        "sub=0; [ \"$(stat -f -c %T \"$W\")\" = btrfs ] && [ \"$(stat -c %i \"$W\")\" = 256 ] "
+        "&& command -v btrfs >/dev/null && sub=1; "
+        "ref=0; t=$(mktemp -p \"$W\" .reflink-probe.XXXXXX 2>/dev/null) && echo x > \"$t\" "
+        "&& cp --reflink=always \"$t\" \"$S/.reflink-probe\" 2>/dev/null && ref=1; "
+        "rm -f \"$t\" \"$S/.reflink-probe\"; "
+        "rs=0; command -v rsync >/dev/null && rs=1; "
+        "echo \"$(stat -f -c %T \"$W\") $(stat -f -c %T \"$S\") $sub $ref $rs\""
+    )
+    out = (c.run(script, hide=True, warn=True).stdout or "").split()
+    if len(out) != 5:
+        return {"fs": None, "snap_fs": None, "subvolume": False, "reflink": False, "rsync": False}
+    return {"fs": out[0], "snap_fs": out[1], "subvolume": out[2] == "1",
+            "reflink": out[3] == "1", "rsync": out[4] == "1"}
+
+def _list_snapshots(c, root):
+    out = c.run(f"ls -1d {Q(root)}/wp-content-* 2>/dev/null", hide=True, warn=True).stdout or ""
+    return sorted(line.strip() for line in out.splitlines() if line.strip())
+
+def _content_snapshot(c, wp_path, out_dir, snapshot="auto", keep=2):
+    """Snapshot wp-content with the best available provider -> dict stored in the update snapshot."""
+    live = f"{wp_path.rstrip('/')}/wp-content"
+    probe = _probe_snapshot_support(c, live, _snapshot_root(wp_path)) if snapshot != "tar" else {}
+    candidates = [p for p in _SNAPSHOT_PROVIDERS
+                  if (snapshot == "auto" and p.available(probe)) or p.name == snapshot]
+    if _TarSnapshot not in candidates:
+        candidates.append(_TarSnapshot)
+    errors = []
+    for cls in candidates:
+        started = datetime.datetime.utcnow()
+        try:
+            fields = cls().take(c, wp_path, out_dir, keep)
+        except Exception as e:
+            if cls is candidates[-1]:
+                raise               # tar is the last resort
+            errors.append(f"{cls.name}: {(getattr(getattr(e, 'result', None), 'stderr', '') or str(e)).strip()[-300:]}")
+            continue
+        return {"provider": cls.name, **fields, "probe": probe,
+                "content_seconds": round((datetime.datetime.utcnow() - started).total_seconds(), 3),
+                "provider_errors": errors or None}
+
+def _pre_update_snapshot(c, wp_path, db_name, db_user, db_pass, out_dir, snapshot="auto"):
+    db = backup_db(c, db_name, db_user, db_pass, out_dir)
+    snap = _content_snapshot(c, wp_path, out_dir, snapshot)
+    snap["db_dump"] = db["db_dump"]
+    snap["timestamp"] = db["timestamp"]
+    return snap
+
+
+# WordPress core tables (without prefix); everything else in the DB belongs to plugins
+_WP_CORE_TABLES = {"commentmeta", "comments", "links", "options", "postmeta", "posts",
+                   "term_relationships", "term_taxonomy", "termmeta", "terms", "usermeta", "users"}
+
+def _wp_root(c, wp_path, cmd):
+    """wp-cli as root (these tasks connect as root); a failed command raises instead of reading as empty."""
+    r = wp(c, wp_path, f"{cmd} --allow-root")
+    if r.exited != 0:
+        raise UnexpectedExit(r)
+    return r
+
+def _plugin_versions(c, wp_path):
+    r = _wp_root(c, wp_path, "plugin list --fields=name,version,update,file --format=json")
+    try:
+        return {p["name"]: p for p in json.loads(r.stdout)}
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"wp plugin list returned no usable JSON: {(r.stdout or '')[:200]!r}") from e
+
+def _plugin_path(p):
+    """wp-content-relative path of a plugin: its dir, or the file itself for single-file plugins (hello.php)."""
+    f = p.get("file") or p["name"]
+    return f"wp-content/plugins/{f.split('/', 1)[0]}" if "/" in f else f"wp-content/plugins/{f}"
+
+def _selective_snapshot(c, wp_path, db_name, db_user, db_pass, plugins, out_dir):
+    """Tar only the plugins about to change; dump only options + non-core tables."""
+    ts = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    c.run(f"mkdir -p {out_dir}")
+    tar = f"{out_dir}/plugins-{ts}.tar.gz"
+    sql = f"{out_dir}/{db_name}-partial-{ts}.sql.gz"
+    paths = sorted({_plugin_path(p) for p in plugins.values()})
+    try:
+        c.run(f"tar -C {wp_path} -czf {tar} {' '.join(Q(p) for p in paths)}")
+
+        prefix = (_wp_root(c, wp_path, "db prefix").stdout or "wp_").strip()
+        tables = [t for t in (_wp_root(c, wp_path, "db tables --all-tables-with-prefix --format=csv").stdout or "").strip().split(",") if t]
+        picked = [t for t in tables if t == f"{prefix}options" or t[len(prefix):] not in _WP_CORE_TABLES]
+        with c.prefix(f"export MYSQL_PWD='{db_pass}'"):
+            c.run(f"set -o pipefail; mysqldump -u {db_user} {db_name} {' '.join(Q(t) for t in picked)} | gzip > {sql}")
+    except Exception:
+        c.run(f"rm -f {Q(tar)} {Q(sql)}", hide=True, warn=True)
+        raise
+    return {"db_dump": sql, "tables": picked, "plugins_tar": tar, "plugins": sorted(plugins),
+            "paths": paths, "timestamp": ts}
+
+def _selective_restore(c, wp_path, db_name, db_user, db_pass, snap):
+    """Put back the snapshotted plugin dirs and tables; chmod only what was restored."""
+    with c.prefix(f"export MYSQL_PWD='{db_pass}'"):
+        c.run(f"gunzip -c {snap['db_dump']} | mysql -u {db_user} {db_name}", warn=False)
+    paths = [f"{wp_path}/{p}" for p in snap["paths"]]
+    c.run("rm -rf " + " ".join(Q(p) for p in paths), warn=False)
+    c.run(f"tar -C {wp_path} -xzf {snap['plugins_tar']}", warn=False)
+    c.run(f"find {' '.join(Q(p) for p in paths)} \\( -type d -exec chmod 755 {{}} + \\) -o \\( -type f -exec chmod 644 {{}} + \\)", warn=True)
+
+def _full_restore(c, wp_path, db_name, db_user, db_pass, snap):
+    restore_errors = []
+
+    # Restore DB
+    try:
+        with c.prefix(f"export MYSQL_PWD='{db_pass}'"):
+            c.run(f"gunzip -c {snap['db_dump']} | mysql -u {db_user} {db_name}", warn=False)
+    except Exception as db_e:
+        restore_errors.append(f"db_restore: {db_e}")
+
+    # Restore wp-content (records without "provider" predate providers: tar)
+    try:
+        provider = next(p for p in _SNAPSHOT_PROVIDERS if p.name == snap.get("provider", "tar"))()
+        provider.restore(c, snap, wp_path)
+    except Exception as fs_e:
+        restore_errors.append(f"content_restore: {fs_e}")
+    return restore_errors
+
 @task
-def update_with_rollback(c, wp_path, db_name, db_user, db_pass, out_dir="/tmp/backups"):
+def update_with_rollback(c, wp_path, db_name, db_user, db_pass, out_dir="/tmp/backups", rollback="selective",
+                         snapshot="auto"):
     """
-    1) Take a snapshot (DB dump + wp-content tar)
+    1) Take a snapshot (DB dump + wp-content btrfs/reflink/hardlink snapshot or tar;
+       snapshot="auto" picks the fastest the host supports)
     2) Try: wp plugin update --all
     3) On failure: restore DB + wp-content from the snapshot
+
+    rollback="selective" additionally snapshots just the plugins with pending
+    updates (their dirs + options and plugin tables) and, on failure, restores
+    only those. The full restore is used if that fails or leaves any of those
+    plugins on a different version (the full snapshot is always taken as that
+    fallback). The selective artifacts are removed when the task ends.
+    rollback="full" is the old behaviour.
     """
+    selective = None
+    selective_error = None
+    before = {}
+    if rollback == "selective":
+        try:
+            before = _plugin_versions(c, wp_path)
+        except Exception as e:
+            # wp-cli unusable: that is a failure, not "nothing to update"
+            return {"updated": False, "error": f"plugin list failed: {e}", "snapshot": None, "restored": None}
+        pending = {n: p for n, p in before.items() if p.get("update") == "available"}
+        if not pending:
+            return {"updated": True, "snapshot": None, "details": {"plugins": []}}
+        try:
+            selective = _selective_snapshot(c, wp_path, db_name, db_user, db_pass, pending, out_dir)
+        except Exception as e:
+            selective_error = f"selective snapshot failed: {e}"     # full rollback still covers us
+
     # 1) snapshot
-    snap = backup_site(c, wp_path, db_name, db_user, db_pass, out_dir)
+    snap = _pre_update_snapshot(c, wp_path, db_name, db_user, db_pass, out_dir, snapshot)
+
+    try:
+        return _update_or_rollback(c, wp_path, db_name, db_user, db_pass, snap, selective, before,
+                                   selective_error)
+    finally:
+        if selective is not None:
+            c.run(f"rm -f {Q(selective['plugins_tar'])} {Q(selective['db_dump'])}", hide=True, warn=True)
 
+def _update_or_rollback(c, wp_path, db_name, db_user, db_pass, snap, selective, before, selective_error):
     try:
         # 2) attempt updates
-        r = wp(c, wp_path, "plugin update --all --format=json")
-        if r.exited != 0:
-            raise UnexpectedExit(r)
+        r = _wp_root(c, wp_path, "plugin update --all --format=json")
 
         # Optional: update themes/core as needed (left commented)
-        # r_core = wp(c, wp_path, "core update --format=json")
-        # r_themes = wp(c, wp_path, "theme update --all --format=json")
+        # r_core = _wp_root(c, wp_path, "core update --format=json")
+        # r_themes = _wp_root(c, wp_path, "theme update --all --format=json")
 
         return {
             "updated": True,
@@ -150,31 +690,35 @@ def update_with_rollback(c, wp_path, db_name, db_user, db_pass, out_dir="/tmp/ba
 
     except Exception as e:
         # 3) restore from snapshot
-        restore_errors = []
-
-        # Restore DB
-        try:
-            with c.prefix(f"export MYSQL_PWD='{db_pass}'"):
-                c.run(f"gunzip -c {snap['db_dump']} | mysql -u {db_user} {db_name}", warn=False)
-        except Exception as db_e:
-            restore_errors.append(f"db_restore: {db_e}")
-
-        # Restore wp-content (extract over existing)
-        try:
-            # Ensure wp-content exists
-            c.run(f"mkdir -p {wp_path}/wp-content", warn=True)
-            # Extract tarball into wp_path; paths inside tar are 'wp-content/...'
-            c.run(f"tar -C {wp_path} -xzf {snap['content_tar']}", warn=False)
-            # Safe permissions (common defaults)
-            c.run(f"find {wp_path}/wp-content -type d -exec chmod 755 {{}} +", warn=True)
-            c.run(f"find {wp_path}/wp-content -type f -exec chmod 644 {{}} +", warn=True)
-        except Exception as fs_e:
-            restore_errors.append(f"content_restore: {fs_e}")
-
+        if selective is not None:
+            try:
+                _selective_restore(c, wp_path, db_name, db_user, db_pass, selective)
+                after = _plugin_versions(c, wp_path)
+                drift = [s for s in selective["plugins"]
+                         if (after.get(s) or {}).get("version") != before[s].get("version")]
+                if not drift:
+                    return {
+                        "updated": False,
+                        "error": str(e),
+                        "snapshot": snap,
+                        "rollback": "selective",
+                        "restored": True,
+                        "restored_plugins": selective["plugins"],
+                        "restore_errors": None
+                    }
+                fallback_reason = f"version mismatch after selective restore: {', '.join(drift)}"
+            except Exception as sel_e:
+                fallback_reason = f"selective restore failed: {sel_e}"
+        else:
+            fallback_reason = selective_error
+
+        restore_errors = _full_restore(c, wp_path, db_name, db_user, db_pass, snap)
         return {
             "updated": False,
             "error": str(e),
             "snapshot": snap,
+            "rollback": "full",
+            "fallback_reason": fallback_reason,
             "restored": len(restore_errors) == 0,
             "restore_errors": restore_errors or None
         }
@@ -240,6 +784,42 @@ def wp_reset_sh(
     except Exception:
         return {"status": "unknown", "raw": out.strip(), "parsed": False}
     
+@task
+def integrity_scan(c, wp_path, full=False, verify_checksums=True, excludes=None, max_items=200,
+                   cache_dir="/var/lib/nh-amc/integrity"):
+    """
+    Incremental file-integrity scan of a docroot (see wp_integrity.py).
+    Only files whose size/mtime changed since the last scan are rehashed on the
+    remote host; checksums are re-verified only for core / plugins that changed.
+    Returns a compact diff report.
+    """
+    local_script = Path(__file__).parent / "wp_integrity.py"
+
+    # private per-run dir (mktemp -d is 0700): the helper runs as root, so it must
+    # never be executed from a shared path another local user could write to
+    tmpdir = c.run("mktemp -d /tmp/wp-integrity.XXXXXXXX", hide=True).stdout.strip()
+    remote_script = f"{tmpdir}/wp_integrity.py"
+    c.put(str(local_script), remote_script)
+
+    args = [f"--path {Q(wp_path)}", f"--cache-dir {Q(cache_dir)}", f"--max-items {int(max_items)}"]
+    if verify_checksums:
+        args.append(f"--wp {Q('wp --allow-root')}")
+    if full:
+        args.append("--full")
+    for ex in excludes or []:
+        args.append(f"--exclude {Q(ex)}")
+
+    runner = c.run if c.user == "root" else c.sudo
+    try:
+        r = runner(f"python3 {Q(remote_script)} " + " ".join(args), hide=True, warn=True)
+    finally:
+        c.run(f"rm -rf {Q(tmpdir)}", hide=True, warn=True)
+    try:
+        return json.loads((r.stdout or "").strip().splitlines()[-1])
+    except Exception:
+        return {"ok": False, "error": "integrity helper returned no report",
+                "stderr": (r.stderr or "")[-2000:], "exit": r.exited}
+
 @task
 def wp_diag_log(c, log_path="/var/log/wp_provision.log"):
     return {
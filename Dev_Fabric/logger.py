@@ -1,15 +1,228 @@
-import json, logging, sys
+import atexit, contextvars, json, logging, os, queue, random, sys, threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging pipeline shared by the API and the workers.
+#  - Callers only enqueue the LogRecord (no formatting, no I/O); one listener
+#    thread per process formats and writes to stdout. If the queue is full the
+#    record is dropped and counted instead of blocking the task.
+#  - log_json(logger, "event", **fields) is the structured call: fields are
+#    serialized (and redacted) on the listener thread, so pass values, not
+#    pre-built strings. Plain log.info("... %s", x) calls stay lazy as well.
+#  - Secrets are redacted centrally by key name (password, token, auth, ...)
+#    in structured fields and in dict/list %-args.
+#  - LOG_SAMPLING="event=rate,..." keeps only a fraction of high-volume INFO
+#    events (warnings and errors are never sampled); kept records carry
+#    "sample_rate" so counts can be scaled back up.
+#  - bind()/log_context() put correlation ids (request id, task id) in a
+#    contextvar that is attached to every record.
+
+_SECRET_KEYS = {"auth", "basic_auth", "cookie", "db_pass", "key_filename", "smtp_pass"}
+_SECRET_PARTS = ("password", "passwd", "secret", "token", "private_key", "api_key", "authorization")
+_REDACTED = "***"
+
+_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+
+def _settings():
+    try:
+        from config import settings
+        return settings
+    except Exception:      # logging must work even when config cannot load
+        return None
+
+
+def _is_secret(key) -> bool:
+    k = str(key).lower()
+    return k in _SECRET_KEYS or any(p in k for p in _SECRET_PARTS)
+
+
+def redact(value, _depth: int = 0):
+    """Copy of `value` with secret-looking keys masked (dicts/lists, nested)."""
+    if _depth > 8:
+        return value
+    if isinstance(value, dict):
+        return {k: (_REDACTED if v not in (None, "") and _is_secret(k) else redact(v, _depth + 1))
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v, _depth + 1) for v in value]
+    return value
+
+
+# ----------------------------
+# Correlation context
+# ----------------------------
+def bind(**ctx) -> contextvars.Token:
+    """Add keys to the log context of the current task/request; undo with unbind(token)."""
+    return _context.set({**_context.get(), **{k: v for k, v in ctx.items() if v is not None}})
+
+
+def unbind(token: contextvars.Token):
+    _context.reset(token)
+
+
+@contextmanager
+def log_context(**ctx):
+    token = bind(**ctx)
+    try:
+        yield
+    finally:
+        unbind(token)
+
+
+def current_context() -> dict:
+    return _context.get()
+
+
+# ----------------------------
+# Formatting (runs on the listener thread)
+# ----------------------------
+def _message(record: logging.LogRecord) -> str:
+    if record.args:
+        if isinstance(record.args, dict):
+            record.args = redact(record.args)
+        else:
+            record.args = tuple(redact(a) if isinstance(a, (dict, list, tuple)) else a for a in record.args)
+    return record.getMessage()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+        }
+        out.update(getattr(record, "ctx", None) or {})
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            out["event"] = record.msg
+            out.update(redact(fields))
+        else:
+            out["msg"] = _message(record)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        if getattr(record, "log_dropped", 0):
+            out["log_dropped"] = record.log_dropped
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """LOG_FORMAT=text: the message (or event) followed by key=value pairs."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None)
+        line = record.msg if fields is not None else _message(record)
+        extra = {**(getattr(record, "ctx", None) or {}), **redact(fields or {})}
+        if extra:
+            line += " " + " ".join(f"{k}={json.dumps(v, default=str, ensure_ascii=False)}" for k, v in extra.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+# ----------------------------
+# Queue handler + per-process listener
+# ----------------------------
+class AsyncHandler(QueueHandler):
+    def __init__(self, stream=None, maxsize: int = 10000, fmt: str = "json"):
+        self._stream = stream or sys.stdout
+        self._maxsize = maxsize
+        self._fmt = fmt
+        self._lock = threading.Lock()
+        self._pid = None
+        self.listener = None
+        self.dropped = 0
+        super().__init__(queue.Queue(maxsize))
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # fresh queue after a fork (prefork pool): the parent's listener thread is not running here
+            self.queue = queue.Queue(self._maxsize)
+            out = logging.StreamHandler(self._stream)
+            out.setFormatter(TextFormatter() if self._fmt == "text" else JsonFormatter())
+            self.listener = QueueListener(self.queue, out, respect_handler_level=False)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()        # drains what is queued
+            self.listener = None
+            self._pid = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the default prepare() formats in the caller; defer that to the listener
+        record.ctx = _context.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.dropped:
+            record.log_dropped, self.dropped = self.dropped, 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1 + getattr(record, "log_dropped", 0)
+
+    def emit(self, record: logging.LogRecord):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+
+_handler = None
+
+
+def _shared_handler() -> AsyncHandler:
+    global _handler
+    if _handler is None:
+        s = _settings()
+        _handler = AsyncHandler(maxsize=getattr(s, "LOG_QUEUE_SIZE", 10000),
+                                fmt=str(getattr(s, "LOG_FORMAT", "json")).lower())
+        atexit.register(_handler.stop)
+    return _handler
+
 
 def get_logger(name="app"):
     logger = logging.getLogger(name)
     if logger.handlers:
         return logger
-    logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('%(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    logger.setLevel(str(getattr(_settings(), "LOG_LEVEL", "INFO")).upper())
+    logger.addHandler(_shared_handler())
     return logger
 
-def log_json(logger, **kwargs):
-    logger.info(json.dumps(kwargs))
\ No newline at end of file
+
+# ----------------------------
+# Structured events + sampling
+# ----------------------------
+_sampling = None
+
+
+def _sample_rate(event: str) -> float:
+    global _sampling
+    if _sampling is None:
+        rates = {}
+        for part in str(getattr(_settings(), "LOG_SAMPLING", "") or "").split(","):
+            name, _, rate = part.partition("=")
+            try:
+                rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                continue
+        _sampling = rates
+    return _sampling.get(event, 1.0)
+
+
+def log_json(logger, event="event", level=logging.INFO, sample=None, **fields):
+    """Structured event; serialized and redacted off the calling thread."""
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = _sample_rate(event) if sample is None else sample
+        if rate < 1.0:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+    logger.log(level, event, extra={"fields": fields})
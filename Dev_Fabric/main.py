@@ -1,25 +1,32 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException, Header, Depends, Request, BackgroundTasks, Body
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from celery.result import AsyncResult
 from celery_app import (
     run_site_task, celery, domain_ssl_collect_task, 
     wp_outdated_fetch_task, wp_update_plugins_task, 
-    wp_update_core_task, wp_update_all_task)
+    wp_update_core_task, wp_update_all_task, wave_start_task, http_probe_batch_task,
+    visual_regression_task, content_scan_sweep_task, backup_repo_prune_task, LANES, set_lane)
 from schemas import (
     DomainSSLCollectorRequest, SiteConfig, SSLCheckRequest, 
     HealthcheckRequest, TaskEnqueueResponse, TaskResultResponse, 
     WPInstallRequest, SiteConnection, SiteIdResponse, WPInstallRequest, 
     TaskEnqueueResponse, TaskResultResponse, WPResetRequest, WPOutdatedFetchRequest,
     WPUpdatePluginsRequest, WPUpdateCoreRequest, WPUpdateAllRequest,
-    BackupDbRequest, BackupContentRequest)
-from logger import get_logger
+    BackupDbRequest, BackupContentRequest, WPUpdateWaveRequest, WaveEnqueueResponse,
+    MonitorSiteRequest, HealthcheckBatchRequest, VisualRegressionRequest,
+    ContentScanRequest, IntegrityScanRequest, RepoBackupRequest, RepoPruneRequest,
+    IncrementalDbBackupRequest, PITRRestoreRequest)
+from logger import get_logger, log_json, bind, unbind
 from task_runner import verify_ssh, _conn_params, _normalize_site, _materialize_key
 from config import settings
-import uuid
-import os, tempfile, shutil
-from celery.result import AsyncResult
-from fabric import Connection
+import uuid, datetime
+import json, os, shutil
+# fabric/paramiko are imported where SSH is actually used (backup downloads),
+# not at import time: API cold start only pays for FastAPI, pydantic and celery.
     
 app = FastAPI(title="NH AMC MVP")
 log = get_logger("api")
@@ -33,6 +40,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def _request_context(request: Request, call_next):
+    # correlation id for this request's log records and the tasks it enqueues
+    rid = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    token = bind(corr_id=rid)
+    try:
+        response = await call_next(request)
+    finally:
+        unbind(token)
+    response.headers["X-Request-ID"] = rid
+    return response
+
+def _reject(rejected, client: str | None, sites, path: str):
+    reason, retry_after = rejected
+    log_json(log, "admission.rejected", client=client, sites=sorted(sites), reason=reason,
+             retry_after=retry_after, path=path)
+    raise HTTPException(status_code=429, detail={"error": reason, "retry_after": retry_after},
+                        headers={"Retry-After": str(retry_after)})
+
+def _admission(charge_sites: bool):
+    async def admission(request: Request):
+        """
+        Enqueue admission: picks the priority lane (?priority= or X-Priority:
+        interactive/scheduled/background; default per task), then checks that
+        lane's broker backlog + token buckets per client and per target site,
+        shared by all API workers through Redis. 429 + Retry-After.
+        Coalescing endpoints skip the site buckets here; _single_flight charges
+        them only when it really publishes a task.
+        """
+        lane = request.query_params.get("priority") or request.headers.get("x-priority")
+        if lane is not None and lane not in LANES:
+            raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(LANES)}")
+        set_lane(lane)          # request-scoped context: tasks this request publishes go to that lane
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        from starlette.concurrency import run_in_threadpool
+        from modules.ratelimit import admit, client_id, site_keys
+        try:
+            body = await request.json() if await request.body() else None
+        except ValueError:
+            body = None         # let the endpoint report the bad body
+        client = client_id(request.headers, request.client.host if request.client else None)
+        sites = site_keys(body) if charge_sites else set()
+        try:
+            rejected = await run_in_threadpool(admit, client, sites, lane or "interactive")
+        except Exception as e:  # Redis unreachable: fail open, the enqueue itself will fail if the broker is down
+            log.warning("[admission] check skipped: %s", e)
+            return
+        if rejected:
+            _reject(rejected, client, sites, request.url.path)
+    return admission
+
+ADMIT = Depends(_admission(charge_sites=True))
+ADMIT_COALESCED = Depends(_admission(charge_sites=False))
+
 def _extract_bearer(token_header: str | None) -> str | None:
     if not token_header:
         return None
@@ -54,11 +116,63 @@ def require_reset_token(
         raise HTTPException(status_code=401, detail="Invalid or missing reset token")
     return True
 
+@app.on_event("startup")
+def _log_startup():
+    from modules.startup import process_age_ms
+    STARTUP["ready_ms"] = process_age_ms()
+    log.info("[startup] api ready: imports %s ms, process start -> ready %s ms",
+             STARTUP["import_ms"], STARTUP["ready_ms"])
+
+def _charge_sites(body: dict):
+    """Per-site buckets of a coalescing endpoint, at publish time (429 when empty)."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    from modules.ratelimit import charge_sites, site_keys
+    sites = site_keys(body)
+    try:
+        rejected = charge_sites(sites)
+    except Exception as e:      # Redis unreachable: fail open, as admission does
+        log.warning("[admission] site check skipped: %s", e)
+        return
+    if rejected:
+        _reject(rejected, None, sites, "single-flight")
+
+def _single_flight(task, name: str, target: str, args: list, kwargs: dict, force: bool = False,
+                   site: dict | None = None) -> dict:
+    """
+    Enqueue a read-only task, or return the id of an identical one that is
+    queued/running ("coalesced") or finished within SINGLEFLIGHT_FRESH_SECONDS
+    ("cached"). `force` always runs a new one. `site` ({"host"/"url"/"domain"})
+    is charged to the per-site rate limit only when a task is published.
+    """
+    def publish(**extra):
+        _charge_sites(site or {})
+        return task.apply_async(args=args, kwargs=kwargs, **extra)
+
+    if force or not settings.SINGLEFLIGHT_ENABLED:
+        return {"task_id": publish().id, "status": "queued"}
+    from redis.exceptions import RedisError
+    from modules.singleflight import SingleFlight, HEADER, flight_key
+
+    key = flight_key(name, target, {"args": args, "kwargs": kwargs})
+    try:
+        task_id, status = SingleFlight().submit(
+            key,
+            lambda tid: publish(task_id=tid, headers={HEADER: key}),
+            lambda tid: AsyncResult(tid, app=celery).state,
+            inflight_ttl=settings.SINGLEFLIGHT_INFLIGHT_TTL)
+    except RedisError as e:
+        log.warning("[single-flight] %s: %s; enqueueing without coalescing", name, e)
+        return {"task_id": publish().id, "status": "queued"}
+    if status != "queued":
+        log_json(log, "singleflight.hit", task=name, target=target, status=status, task_id=task_id)
+    return {"task_id": task_id, "status": status}
+
 @app.get("/")
 def root():
-    return {"ok": True, "service": "NH AMC Fabric MVP"}
+    return {"ok": True, "service": "NH AMC Fabric MVP", "startup": STARTUP}
 
-@app.post("/tasks/backup", response_model=TaskEnqueueResponse)
+@app.post("/tasks/backup", dependencies=[ADMIT], response_model=TaskEnqueueResponse)
 def trigger_backup(site: SiteConfig):
     site.user = "root"  # <--
     task = run_site_task.delay(site.dict(), "backup_site",
@@ -66,32 +180,63 @@ def trigger_backup(site: SiteConfig):
                                db_user=site.db_user, db_pass=site.db_pass)
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/wp-status", response_model=TaskEnqueueResponse)
-def trigger_wp_status(site: SiteConfig):
+@app.post("/tasks/wp-status", dependencies=[ADMIT_COALESCED], response_model=TaskEnqueueResponse)
+def trigger_wp_status(site: SiteConfig, force: bool = False):
     site.user = "root"  # <--
-    task = run_site_task.delay(site.dict(), "wp_status", wp_path=site.wp_path)
-    return {"task_id": task.id, "status": "queued"}
-
-@app.post("/tasks/update", response_model=TaskEnqueueResponse)
-def trigger_update(site: SiteConfig):
+    args, kwargs = [site.dict(), "wp_status"], {"wp_path": site.wp_path}
+    return _single_flight(run_site_task, "wp_status", f"{site.host}:{site.wp_path}", args, kwargs, force,
+                          site={"host": site.host})
+
+@app.post("/tasks/update", dependencies=[ADMIT], response_model=TaskEnqueueResponse)
+def trigger_update(site: SiteConfig, rollback: str = "selective", snapshot: str = "auto"):
+    if rollback not in ("selective", "full"):
+        raise HTTPException(status_code=400, detail='rollback must be "selective" or "full"')
+    if snapshot not in ("auto", "btrfs", "reflink", "hardlink", "tar"):
+        raise HTTPException(status_code=400, detail='snapshot must be one of auto, btrfs, reflink, hardlink, tar')
     site.user = "root"  # <--
     task = run_site_task.delay(site.dict(), "update_with_rollback",
                                wp_path=site.wp_path, db_name=site.db_name,
-                               db_user=site.db_user, db_pass=site.db_pass)
+                               db_user=site.db_user, db_pass=site.db_pass,
+                               rollback=rollback, snapshot=snapshot)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.post("/tasks/integrity-scan", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Incremental file-integrity scan (changed files + WP checksums)")
+def trigger_integrity_scan(req: IntegrityScanRequest, site: SiteConfig):
+    site.user = "root"  # <--
+    task = run_site_task.delay(site.dict(), "integrity_scan",
+                               wp_path=site.wp_path, full=req.full,
+                               verify_checksums=req.verify_checksums,
+                               excludes=req.excludes, max_items=req.max_items)
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/ssl-expiry", response_model=TaskEnqueueResponse)
+@app.post("/tasks/ssl-expiry", dependencies=[ADMIT], response_model=TaskEnqueueResponse)
 def trigger_ssl(req: SSLCheckRequest, site: SiteConfig):
     site.user = "root"  # <--
     task = run_site_task.delay(site.dict(), "ssl_expiry", domain=req.domain)
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/healthcheck", response_model=TaskEnqueueResponse)
+@app.post("/tasks/healthcheck", dependencies=[ADMIT], response_model=TaskEnqueueResponse)
 def trigger_health(req: HealthcheckRequest, site: SiteConfig):
     site.user = "root"  # <--
     task = run_site_task.delay(site.dict(), "healthcheck",
                                url=req.url, keyword=req.keyword,
-                               screenshot=req.screenshot, out_path=req.out_path)
+                               screenshot=req.screenshot, out_path=req.out_path,
+                               scan=req.scan, allowed_domains=req.allowed_domains)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.post("/tasks/healthcheck/batch", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Probe many URLs concurrently from one worker (DNS/connect/TLS/TTFB timings)")
+def trigger_health_batch(req: HealthcheckBatchRequest):
+    targets = [{"url": t.url, "keyword": t.keyword} for t in req.targets]
+    task = http_probe_batch_task.delay(targets, concurrency=req.concurrency)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.post("/tasks/content-scan", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Scan sites for defacement/malware indicators, foreign links and exposed files")
+def trigger_content_scan(req: ContentScanRequest):
+    task = content_scan_sweep_task.delay(urls=req.urls, allowed_domains=req.allowed_domains,
+                                         concurrency=req.concurrency)
     return {"task_id": task.id, "status": "queued"}
 
 @app.post("/ssh/login", response_model=SiteIdResponse, summary="Verify SSH and create a site session")
@@ -115,7 +260,7 @@ def get_site(site_id: str):
     # don’t leak key; just basic info
     return {"site_id": site_id, "host": site["host"], "user": site["user"], "wp_path": site["wp_path"]}
 
-@app.post("/tasks/wp-install/{site_id}", response_model=TaskEnqueueResponse, summary="Install WP using a saved SSH session")
+@app.post("/tasks/wp-install/{site_id}", dependencies=[ADMIT], response_model=TaskEnqueueResponse, summary="Install WP using a saved SSH session")
 def trigger_wp_install(site_id: str, req: WPInstallRequest):
     site = SITES.get(site_id)
     if not site:
@@ -149,24 +294,15 @@ def get_task(task_id: str):
         payload["info"] = str(res.info)
     return JSONResponse(payload)
 
-@app.post("/tasks/wp-reset", response_model=TaskEnqueueResponse, summary="Hard reset the droplet to a clean state")
+@app.post("/tasks/wp-reset", dependencies=[ADMIT], response_model=TaskEnqueueResponse, summary="Hard reset the droplet to a clean state")
 def trigger_wp_reset(
     req: WPResetRequest,
     site: SiteConfig,
     _ok: bool = Depends(require_reset_token),
-    request: Request = None  # optional, lets us read raw body if needed
 ):
-    # Log the parsed models
-    log.info(f"[wp-reset] Parsed req: {req.dict()}")
-    log.info(f"[wp-reset] Parsed site: {site.dict()}")
-
-    # If you also want raw JSON from frontend (before pydantic parsing)
-    if request is not None:
-        try:
-            raw_body = request.json()
-            log.info(f"[wp-reset] Raw incoming body: {raw_body}")
-        except Exception as e:
-            log.warning(f"[wp-reset] Could not read raw body: {e}")
+    # destructive call: record what was asked, never the credentials
+    log_json(log, "wp_reset.request", host=site.host, wp_path=req.wp_path, domain=req.domain,
+             purge_stack=req.purge_stack)
 
     # Enforce required values
     if not site.host or not site.host.strip():
@@ -185,23 +321,25 @@ def trigger_wp_reset(
     )
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/domain-ssl-collect", response_model=TaskEnqueueResponse, summary="Check domain WHOIS + SSL (local task)")
-def trigger_domain_ssl_collect(req: DomainSSLCollectorRequest):
-    task = domain_ssl_collect_task.delay(domain=req.domain, report_email=req.report_email)
-    return {"task_id": task.id, "status": "queued"}
-
-@app.post("/tasks/wp-outdated-fetch", response_model=TaskEnqueueResponse)
-def trigger_wp_outdated_fetch(req: WPOutdatedFetchRequest):
-    task = wp_outdated_fetch_task.delay(
-        url=req.url,
-        headers=req.headers,
-        report_email=req.report_email,
-        basic_auth=req.basic_auth,
-        timeout=req.timeout or 15,
-    )
-    return {"task_id": task.id, "status": "queued"}
-
-@app.post("/tasks/wp-update/plugins", response_model=TaskEnqueueResponse, summary="Update WP plugins via REST")
+@app.post("/tasks/domain-ssl-collect", dependencies=[ADMIT_COALESCED], response_model=TaskEnqueueResponse, summary="Check domain WHOIS + SSL (local task)")
+def trigger_domain_ssl_collect(req: DomainSSLCollectorRequest, force: bool = False):
+    kwargs = {"domain": req.domain, "report_email": req.report_email}
+    return _single_flight(domain_ssl_collect_task, "domain_ssl", req.domain, [], kwargs, force,
+                          site={"domain": req.domain})
+
+@app.post("/tasks/wp-outdated-fetch", dependencies=[ADMIT_COALESCED], response_model=TaskEnqueueResponse)
+def trigger_wp_outdated_fetch(req: WPOutdatedFetchRequest, force: bool = False):
+    kwargs = {
+        "url": req.url,
+        "headers": req.headers,
+        "report_email": req.report_email,
+        "basic_auth": req.basic_auth,
+        "timeout": req.timeout or 15,
+    }
+    return _single_flight(wp_outdated_fetch_task, "wp_outdated", req.url, [], kwargs, force,
+                          site={"url": req.url})
+
+@app.post("/tasks/wp-update/plugins", dependencies=[ADMIT], response_model=TaskEnqueueResponse, summary="Update WP plugins via REST")
 def trigger_wp_update_plugins(req: WPUpdatePluginsRequest):
     task = wp_update_plugins_task.delay(
         base_url=req.base_url,
@@ -210,22 +348,24 @@ def trigger_wp_update_plugins(req: WPUpdatePluginsRequest):
         blocklist=req.blocklist,
         auth=(req.auth.dict() if req.auth else None),
         headers=req.headers,
-        report_email=req.report_email
+        report_email=req.report_email,
+        site_id=req.site_id
     )
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/wp-update/core", response_model=TaskEnqueueResponse, summary="Update WP core via REST")
+@app.post("/tasks/wp-update/core", dependencies=[ADMIT], response_model=TaskEnqueueResponse, summary="Update WP core via REST")
 def trigger_wp_update_core(req: WPUpdateCoreRequest):
     task = wp_update_core_task.delay(
         base_url=req.base_url,
         precheck=req.precheck,
         auth=(req.auth.dict() if req.auth else None),
         headers=req.headers,
-        report_email=req.report_email
+        report_email=req.report_email,
+        site_id=req.site_id
     )
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/wp-update/all", response_model=TaskEnqueueResponse, summary="Update plugins + core in one click")
+@app.post("/tasks/wp-update/all", dependencies=[ADMIT], response_model=TaskEnqueueResponse, summary="Update plugins + core in one click")
 def trigger_wp_update_all(req: WPUpdateAllRequest):
     task = wp_update_all_task.delay(
         base_url=req.base_url,
@@ -236,10 +376,87 @@ def trigger_wp_update_all(req: WPUpdateAllRequest):
         headers=req.headers,
         auth=(req.auth.dict() if req.auth else None),
         report_email=req.report_email,
+        site_id=req.site_id,
     )
     return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/backup/db")   # remove response_model so we can return FileResponse
+@app.post("/tasks/wp-update/wave", dependencies=[ADMIT], response_model=WaveEnqueueResponse, summary="Fleet update in host-aware waves")
+def trigger_wp_update_wave(req: WPUpdateWaveRequest):
+    if not req.targets:
+        raise HTTPException(status_code=422, detail="targets must not be empty")
+    from modules.credentials import CredentialStore, split_secrets
+
+    wave_id = str(uuid.uuid4())
+    # auth/headers go to the credential store; the wave (kept 7 days) only references them
+    store, refs, targets = CredentialStore(), {}, []
+    for t in req.targets:
+        kw, secret = split_secrets(t.dict(), ("auth", "headers"))
+        if secret:
+            key = json.dumps(secret, sort_keys=True)
+            if key not in refs:
+                refs[key] = store.put(secret, ttl=7 * 86400)
+            kw["credentials_ref"] = refs[key]
+        targets.append(kw)
+    limits = {
+        "max_per_host": req.max_per_host,
+        "max_in_flight": req.max_in_flight,
+        "canary": req.canary,
+        "failure_threshold": req.failure_threshold,
+        "min_samples": req.min_samples,
+    }
+    task = wave_start_task.delay(wave_id=wave_id, targets=targets, limits=limits)
+    return {"wave_id": wave_id, "task_id": task.id, "status": "queued"}
+
+def _load_wave(wave_id: str):
+    from redis_client import get_redis
+    from modules import update_waves as uw
+    state = uw.load(get_redis(), wave_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Unknown wave_id (not planned yet or expired)")
+    return state
+
+@app.get("/locks/{site}", summary="Mutating task holding a site and the tasks queued behind it")
+def get_site_lock(site: str):
+    from modules.site_lock import waiting
+    return waiting(site)
+
+@app.get("/waves/{wave_id}", summary="Progress of an update wave")
+def get_wave(wave_id: str):
+    from modules import update_waves as uw
+    return uw.summary(_load_wave(wave_id))
+
+@app.post("/waves/{wave_id}/pause", summary="Stop starting new targets in a wave")
+def pause_wave(wave_id: str):
+    from redis_client import get_redis
+    from modules import update_waves as uw
+    r = get_redis()
+    with uw.lock(r, wave_id):
+        state = _load_wave(wave_id)
+        uw.pause(state)
+        uw.save(r, state)
+    return uw.summary(state)
+
+@app.post("/waves/{wave_id}/resume", summary="Resume a paused wave")
+def resume_wave(wave_id: str):
+    from redis_client import get_redis
+    from modules import update_waves as uw
+    from celery_app import _wave_pump
+    r = get_redis()
+    with uw.lock(r, wave_id):
+        state = _load_wave(wave_id)
+        uw.resume(state)
+        uw.save(r, state)
+    state = _wave_pump(wave_id) or state
+    return uw.summary(state)
+
+def _release_download(lock, tmpdir: str):
+    """Background task: runs after the response body is sent, still under the path lock."""
+    try:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    finally:
+        lock.release()
+
+@app.post("/tasks/backup/db", dependencies=[ADMIT])   # remove response_model so we can return FileResponse
 def trigger_backup_db(
     req: BackupDbRequest = Body(embed=True),
     site: SiteConfig = Body(embed=True),
@@ -273,23 +490,69 @@ def trigger_backup_db(
     key_path = _materialize_key(site_dict)
     params = _conn_params(site_dict)
 
-    tmpdir = tempfile.mkdtemp(prefix="dl_")
+    from fabric import Connection
+    from modules.transfer import PathLock, download, stable_local_path, transfer_headers, verify as verify_transfer
     download_name = req.filename or os.path.basename(remote_path) or "database.sql.gz"
-    local_path = os.path.join(tmpdir, download_name)
+    # stable path: an interrupted download resumes on retry instead of restarting
+    local_path = stable_local_path(settings.TRANSFER_DIR, site_dict["host"], remote_path, download_name)
+    tmpdir = os.path.dirname(local_path)
+    # one request per (host, file) at a time: held until the file has been streamed and removed
+    try:
+        lock = PathLock(local_path).acquire(timeout=req.wait_timeout)
+    except TimeoutError as e:
+        if key_created and key_path:
+            try: os.remove(key_path)
+            except Exception: pass
+        return JSONResponse({"task_id": task.id, "error": str(e)}, status_code=409)
 
     try:
         with Connection(**params) as c:
-            c.get(remote_path, local=local_path)
+            stats = download(c, remote_path, local_path, parallel=settings.TRANSFER_PARALLEL)
+    except BaseException:
+        lock.release()          # keep the partial file: the next attempt resumes it
+        raise
     finally:
         if key_created and key_path:
             try: os.remove(key_path)
             except Exception: pass
 
-    background_tasks.add_task(shutil.rmtree, tmpdir, ignore_errors=True)
-    return FileResponse(local_path, media_type="application/gzip", filename=download_name)
+    log_json(log, "transfer.download", remote=remote_path, bytes=stats["bytes"], seconds=stats["seconds"],
+             mbps=stats["mbps"], resumed_bytes=stats["resumed_bytes"], workers=stats["workers"])
+    background_tasks.add_task(_release_download, lock, tmpdir)
+    expected = (result or {}).get("db_dump_sha256")
+    problem = verify_transfer(stats, expected)
+    if problem:
+        log.error("[transfer] %s: %s", remote_path, problem)
+        return JSONResponse({"task_id": task.id, "error": problem, "remote_sha256": expected,
+                             "received_sha256": stats.get("sha256"), "result": result}, status_code=502)
+    return FileResponse(local_path, media_type="application/gzip", filename=download_name,
+                        headers=transfer_headers(stats, expected))
+
+
+@app.post("/tasks/backup/db/incremental", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Binlog-based incremental DB backup (periodic base + shipped segments)")
+def trigger_backup_db_incremental(req: IncrementalDbBackupRequest, site: SiteConfig):
+    site.user = "root"
+    task = run_site_task.delay(site.dict(), "backup_db_incremental",
+                               db_name=site.db_name, db_user=site.db_user, db_pass=site.db_pass,
+                               out_dir=req.out_dir, full_every_hours=req.full_every_hours,
+                               force_full=req.force_full, keep_chains=req.keep_chains)
+    return {"task_id": task.id, "status": "queued"}
 
+@app.post("/tasks/restore/db/pitr", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Restore the DB to a point in time (token-protected)")
+def trigger_restore_db_pitr(req: PITRRestoreRequest, site: SiteConfig, _=Depends(require_reset_token)):
+    try:
+        datetime.datetime.strptime(req.target, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise HTTPException(status_code=400, detail='target must be "YYYY-MM-DD HH:MM:SS"')
+    site.user = "root"
+    task = run_site_task.delay(site.dict(), "restore_db_pitr",
+                               db_name=site.db_name, db_user=site.db_user, db_pass=site.db_pass,
+                               target=req.target, out_dir=req.out_dir, dry_run=req.dry_run)
+    return {"task_id": task.id, "status": "queued"}
 
-@app.post("/tasks/backup/content")  # remove response_model so we can return FileResponse
+@app.post("/tasks/backup/content", dependencies=[ADMIT])  # remove response_model so we can return FileResponse
 def trigger_backup_content(req: BackupDbRequest = Body(embed=True),
     site: SiteConfig = Body(embed=True),
     background_tasks: BackgroundTasks = None
@@ -318,17 +581,197 @@ def trigger_backup_content(req: BackupDbRequest = Body(embed=True),
     key_path = _materialize_key(site_dict)
     params = _conn_params(site_dict)
 
-    tmpdir = tempfile.mkdtemp(prefix="dl_")
+    from fabric import Connection
+    from modules.transfer import PathLock, download, stable_local_path, transfer_headers, verify as verify_transfer
     download_name = req.filename or os.path.basename(remote_path) or "wp-content.tar.gz"
-    local_path = os.path.join(tmpdir, download_name)
+    # stable path: an interrupted download resumes on retry instead of restarting
+    local_path = stable_local_path(settings.TRANSFER_DIR, site_dict["host"], remote_path, download_name)
+    tmpdir = os.path.dirname(local_path)
+    # one request per (host, file) at a time: held until the file has been streamed and removed
+    try:
+        lock = PathLock(local_path).acquire(timeout=req.wait_timeout)
+    except TimeoutError as e:
+        if key_created and key_path:
+            try: os.remove(key_path)
+            except Exception: pass
+        return JSONResponse({"task_id": task.id, "error": str(e)}, status_code=409)
 
     try:
         with Connection(**params) as c:
-            c.get(remote_path, local=local_path)
+            stats = download(c, remote_path, local_path, parallel=settings.TRANSFER_PARALLEL)
+    except BaseException:
+        lock.release()          # keep the partial file: the next attempt resumes it
+        raise
     finally:
         if key_created and key_path:
             try: os.remove(key_path)
             except Exception: pass
 
-    background_tasks.add_task(shutil.rmtree, tmpdir, ignore_errors=True)
-    return FileResponse(local_path, media_type="application/gzip", filename=download_name)
\ No newline at end of file
+    log_json(log, "transfer.download", remote=remote_path, bytes=stats["bytes"], seconds=stats["seconds"],
+             mbps=stats["mbps"], resumed_bytes=stats["resumed_bytes"], workers=stats["workers"])
+    background_tasks.add_task(_release_download, lock, tmpdir)
+    expected = (result or {}).get("content_tar_sha256")
+    problem = verify_transfer(stats, expected)
+    if problem:
+        log.error("[transfer] %s: %s", remote_path, problem)
+        return JSONResponse({"task_id": task.id, "error": problem, "remote_sha256": expected,
+                             "received_sha256": stats.get("sha256"), "result": result}, status_code=502)
+    return FileResponse(local_path, media_type="application/gzip", filename=download_name,
+                        headers=transfer_headers(stats, expected))
+
+# ----------------------------
+# Backup repository (deduplicated, controller side)
+# ----------------------------
+@app.post("/repo/backups", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Stream a DB and/or wp-content backup into the backup repository")
+def trigger_repo_backup(req: RepoBackupRequest, site: SiteConfig):
+    if req.kind not in ("db", "content", "site"):
+        raise HTTPException(status_code=400, detail='kind must be "db", "content" or "site"')
+    site.user = "root"  # <--
+    task = run_site_task.delay(site.dict(), "repo_backup",
+                               wp_path=site.wp_path, db_name=site.db_name,
+                               db_user=site.db_user, db_pass=site.db_pass,
+                               kind=req.kind, name=req.name)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.get("/repo/backups", summary="Backup catalog (newest first)")
+def repo_list(site: str | None = None, kind: str | None = None, since: float | None = None, limit: int = 100):
+    from modules.backup_repo import BackupRepo
+    items = BackupRepo().list(site=site, kind=kind, since=since, limit=limit)
+    return {"count": len(items), "backups": items}
+
+@app.get("/repo/backups/{backup_id}", summary="One catalog entry")
+def repo_get(backup_id: str):
+    from modules.backup_repo import BackupRepo
+    item = BackupRepo().get(backup_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="backup not found")
+    return item
+
+@app.get("/repo/backups/{backup_id}/download", summary="Rebuilt .sql.gz / .tar.gz, streamed")
+def repo_download(backup_id: str):
+    from modules.backup_repo import BackupRepo
+    repo = BackupRepo()
+    item = repo.get(backup_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="backup not found")
+    safe_site = "".join(ch if ch.isalnum() or ch in "-." else "_" for ch in item["site"])
+    name = f"{safe_site}-{item['kind']}-{backup_id}.{'sql' if item['kind'] == 'db' else 'tar'}.gz"
+    headers = {"Content-Disposition": f'attachment; filename="{name}"'}
+    if item["kind"] == "db" and item.get("content_sha256"):
+        # the rebuilt SQL is byte-identical to what was ingested (the gzip wrapper is not)
+        headers["X-Content-SHA256"] = item["content_sha256"]
+    return StreamingResponse(repo.restore_stream(backup_id), media_type="application/gzip", headers=headers)
+
+@app.post("/repo/prune", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Apply retention (BACKUP_KEEP_* unless overridden) and garbage-collect chunks")
+def trigger_repo_prune(req: RepoPruneRequest):
+    policy = {k: v for k, v in req.dict(include={"keep_last", "keep_daily", "keep_weekly", "keep_monthly"}).items()
+              if v is not None}
+    task = backup_repo_prune_task.delay(policy=policy, site=req.site, dry_run=req.dry_run, full_gc=req.full_gc)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.get("/repo/stats", summary="Logical vs stored bytes and dedup ratio")
+def repo_stats():
+    from modules.backup_repo import BackupRepo
+    return BackupRepo().stats()
+
+@app.get("/history", summary="Sites with recorded status history")
+def history_sites():
+    from modules.status_history import StatusHistory
+    return {"sites": StatusHistory().sites()}
+
+@app.get("/history/{site}", summary="Status change events for a site (optionally one plugin/theme)")
+def history_events(site: str, since: float | None = None, until: float | None = None, item: str | None = None):
+    """
+    `site` is the host (e.g. example.com); `since`/`until` are epoch seconds;
+    `item` is "plugin:<slug>", "theme:<slug>" or "core".
+    """
+    from modules.status_history import StatusHistory, site_key
+    key = site_key(site)
+    events = StatusHistory().events(key, since=since, until=until, item=item)
+    return {"site": key, "item": item, "count": len(events), "events": events}
+
+@app.get("/history/{site}/state", summary="Reconstructed site state at a point in time")
+def history_state(site: str, at: float | None = None):
+    from modules.status_history import StatusHistory, site_key
+    key = site_key(site)
+    return {"site": key, "at": at, "items": StatusHistory().state_at(key, at)}
+
+@app.get("/history/{site}/behind", summary="Since when an item has been outdated")
+def history_behind(site: str, item: str):
+    from modules.status_history import StatusHistory, site_key
+    key = site_key(site)
+    return {"site": key, "item": item, "outdated_since": StatusHistory().behind_since(key, item)}
+
+@app.get("/fleet/{kind}", summary="Slugs known to the fleet index (plugin|theme|core)")
+def fleet_slugs(kind: str):
+    from modules.fleet_index import FleetIndex, KINDS
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"kind must be one of {KINDS}")
+    return {"kind": kind, "slugs": FleetIndex().slugs(kind)}
+
+@app.get("/fleet/{kind}/{slug}", summary="Sites running a plugin/theme, filtered by version range")
+def fleet_query(kind: str, slug: str,
+                older_than: str | None = None, at_least: str | None = None,
+                active: bool | None = None, outdated: bool | None = None):
+    """e.g. /fleet/plugin/akismet?older_than=5.3&active=true"""
+    from modules.fleet_index import FleetIndex, KINDS
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"kind must be one of {KINDS}")
+    rows = FleetIndex().query(kind, slug, older_than=older_than, at_least=at_least, active=active, outdated=outdated)
+    return {"kind": kind, "slug": slug, "count": len(rows), "sites": rows}
+
+@app.get("/fleet/{kind}/{slug}/versions", summary="Installed-version distribution for a plugin/theme")
+def fleet_versions(kind: str, slug: str):
+    from modules.fleet_index import FleetIndex, KINDS
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"kind must be one of {KINDS}")
+    return {"kind": kind, "slug": slug, "versions": FleetIndex().versions(kind, slug)}
+
+
+@app.post("/monitor/sites", summary="Register a site for periodic healthcheck/outdated/domain-SSL sweeps")
+def monitor_register(req: MonitorSiteRequest):
+    from modules.monitor_scheduler import MonitorRegistry
+    site_id = MonitorRegistry().register(req.dict())
+    return {"site_id": site_id, "registered": True}
+
+@app.get("/monitor/sites", summary="Registered monitoring sites")
+def monitor_list():
+    from modules.monitor_scheduler import MonitorRegistry
+    sites = MonitorRegistry().all()
+    return {"count": len(sites),
+            "sites": {k: {"url": v["url"], "domain": v.get("domain"), "checks": v.get("checks")} for k, v in sites.items()}}
+
+@app.get("/monitor/sites/{site_id}", summary="Monitoring config and latest check results")
+def monitor_get(site_id: str):
+    from modules.monitor_scheduler import MonitorRegistry
+    reg = MonitorRegistry()
+    cfg = reg.get(site_id)
+    if not cfg:
+        raise HTTPException(status_code=404, detail="Unknown site_id")
+    for k in ("basic_auth", "headers", "credentials_ref"):
+        cfg.pop(k, None)
+    return {"site_id": site_id, "config": cfg, "last": reg.last_results(site_id)}
+
+@app.delete("/monitor/sites/{site_id}", summary="Stop monitoring a site")
+def monitor_unregister(site_id: str):
+    from modules.monitor_scheduler import MonitorRegistry
+    if not MonitorRegistry().unregister(site_id):
+        raise HTTPException(status_code=404, detail="Unknown site_id")
+    return {"site_id": site_id, "registered": False}
+
+@app.post("/tasks/visual-regression", dependencies=[ADMIT], response_model=TaskEnqueueResponse,
+          summary="Screenshot sites and diff their perceptual hashes against baselines")
+def trigger_visual_regression(req: VisualRegressionRequest):
+    task = visual_regression_task.delay(urls=req.urls, set_baseline=req.set_baseline,
+                                        threshold=req.threshold, region_threshold=req.region_threshold)
+    return {"task_id": task.id, "status": "queued"}
+
+@app.post("/visual-regression/baseline", summary="Accept the latest screenshots as the new baseline")
+def visual_promote(sites: list[str] | None = Body(default=None, embed=True)):
+    from modules.screenshots import HashStore
+    return {"promoted": HashStore().promote(sites)}
+
+# module import time (main + everything it pulls in), see modules/startup.py
+STARTUP = {"import_ms": round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1), "ready_ms": None}
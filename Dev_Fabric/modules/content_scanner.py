@@ -0,0 +1,235 @@
+# modules/content_scanner.py
+from __future__ import annotations
+
+import asyncio
+import re
+from typing import Dict, Any, Optional, List, Iterable, Sequence, Tuple
+from urllib.parse import urljoin, urlparse
+
+# Defacement / malware indicators over a streamed page body, in one pass:
+#   - all indicator patterns are compiled into ONE case-insensitive bytes regex
+#     (named alternation), so each chunk is scanned once regardless of how many
+#     indicators there are;
+#   - links are pulled out with a byte regex on href attributes instead of
+#     building a DOM (src is left out: CDN scripts and images are not links);
+#   - suspicious paths are HEAD-probed concurrently through the async prober.
+# Both scanners keep a small tail of the previous chunk so matches that
+# straddle a chunk boundary are found; indicator hits are deduplicated by
+# absolute offset so a match is counted once even if it grows into a more
+# specific indicator when the next chunk arrives.
+
+# (name, pattern, is_regex). Alternation is first-match-wins at a given
+# position, so more specific indicators must precede the generic ones.
+DEFAULT_INDICATORS: List[Tuple[str, str, bool]] = [
+    ("hacked_by", "hacked by", False),
+    ("defaced", "defaced", False),
+    ("rooted", "rooted", False),
+    ("shell", r"\b(?:web)?shell\b", True),
+    ("hidden_iframe", r"<iframe[^>]{0,200}(?:width|height)\s*=\s*[\"']?0\b", True),
+    ("iframe", "<iframe", False),
+    ("eval", "eval(", False),
+    ("atob", "atob(", False),
+    ("base64", "base64", False),
+    ("bitcoin", "bitcoin", False),
+    ("doc_write_unescape", "document.write(unescape", False),
+    ("onerror", "onerror=", False),
+    ("malware", "malware", False),
+    ("phish", "phish", False),
+    ("fromcharcode", "string.fromcharcode(", False),
+]
+
+DEFAULT_SUSPICIOUS_PATHS = [
+    "/shell.php", "/adminer.php", "/phpinfo.php", "/wp-content/uploads/malicious.js",
+    "/wp-config.php.bak", "/.env", "/.git/config", "/wp-content/debug.log",
+]
+
+_LINK_RE = re.compile(rb"""href\s*=\s*(?:"([^"]{1,2048})"|'([^']{1,2048})'|([^\s"'<>]{1,2048}))""", re.I)
+_LINK_TAIL = 4200   # longest attribute the regex accepts (+ slack), see _LINK_RE
+
+
+class PatternSet:
+    """Named patterns compiled into a single alternation; reused across pages."""
+
+    def __init__(self, indicators: Sequence[Tuple[str, str, bool]] = DEFAULT_INDICATORS, max_len: int = 256):
+        parts = []
+        self.names: List[str] = []
+        longest = 1
+        for i, (name, pattern, is_regex) in enumerate(indicators):
+            src = pattern.encode("utf-8") if is_regex else re.escape(pattern.encode("utf-8"))
+            parts.append(b"(?P<p%d>%s)" % (i, src))
+            self.names.append(name)
+            longest = max(longest, max_len if is_regex else len(pattern.encode("utf-8")))
+        self.regex = re.compile(b"|".join(parts) or b"(?!)", re.I)
+        # regex indicators are assumed to match at most max_len bytes
+        self.overlap = longest - 1
+
+
+class StreamScanner:
+    """Counts indicator hits across chunks; keeps a short sample around each first hit."""
+
+    def __init__(self, patterns: Optional[PatternSet] = None, sample_bytes: int = 80):
+        self.patterns = patterns or _default_patterns()
+        self.tail = b""
+        self.offset = 0          # absolute offset of self.tail[0]
+        self.consumed = 0        # absolute end of the last counted hit
+        self.hits: Dict[str, Dict[str, Any]] = {}
+        self.sample_bytes = sample_bytes
+
+    def feed(self, chunk: bytes):
+        window = self.tail + chunk
+        boundary = len(self.tail)
+        # resume after the last counted hit: no second count for the same bytes
+        for m in self.patterns.regex.finditer(window, max(0, self.consumed - self.offset)):
+            if m.end() <= boundary:
+                continue                      # fully inside the tail: seen last time
+            self.consumed = self.offset + m.end()
+            name = self.patterns.names[int(m.lastgroup[1:])]
+            hit = self.hits.get(name)
+            if hit is None:
+                lo = max(0, m.start() - self.sample_bytes // 2)
+                self.hits[name] = {"count": 1, "offset": self.offset + m.start(),
+                                   "sample": window[lo:m.end() + self.sample_bytes // 2].decode("utf-8", "replace")}
+            else:
+                hit["count"] += 1
+        keep = min(len(window), self.patterns.overlap)
+        self.offset += len(window) - keep
+        self.tail = window[len(window) - keep:] if keep else b""
+
+
+class LinkExtractor:
+    """href values from streamed HTML, resolved against the page URL."""
+
+    def __init__(self, base_url: str, allowed_domains: Optional[Iterable[str]] = None, limit: int = 5000):
+        self.base_url = base_url
+        host = (urlparse(base_url).hostname or "").lower()
+        self.allowed = {d.lower() for d in (allowed_domains or [])} | ({host} if host else set())
+        self.links: List[str] = []
+        self._seen = set()
+        self.tail = b""
+        self.limit = limit
+
+    def feed(self, chunk: bytes):
+        window = self.tail + chunk
+        boundary = len(self.tail)
+        for m in _LINK_RE.finditer(window):
+            if m.end() <= boundary:
+                continue
+            # an unquoted value that touches the window end may continue in the next chunk
+            if m.group(3) is not None and m.end() == len(window):
+                continue
+            raw = (m.group(1) or m.group(2) or m.group(3)).decode("utf-8", "replace").strip()
+            if raw and raw not in self._seen and len(self.links) < self.limit:
+                self._seen.add(raw)
+                self.links.append(raw)
+        self.tail = window[-_LINK_TAIL:]
+
+    def _is_allowed(self, host: str) -> bool:
+        return any(host == d or host.endswith("." + d) for d in self.allowed)
+
+    def external(self) -> List[str]:
+        out = []
+        for raw in self.links:
+            if raw.startswith(("#", "mailto:", "tel:", "javascript:", "data:")):
+                continue
+            host = (urlparse(urljoin(self.base_url, raw)).hostname or "").lower()
+            if host and not self._is_allowed(host):
+                out.append(raw)
+        return out
+
+
+_DEFAULT_PATTERNS: Optional[PatternSet] = None
+
+
+def _default_patterns() -> PatternSet:
+    global _DEFAULT_PATTERNS
+    if _DEFAULT_PATTERNS is None:
+        _DEFAULT_PATTERNS = PatternSet()
+    return _DEFAULT_PATTERNS
+
+
+class ContentScanner:
+    """Indicator scan + link extraction fed from one stream (pass `feed` as the prober's on_chunk)."""
+
+    def __init__(self, base_url: str, allowed_domains: Optional[Iterable[str]] = None,
+                 patterns: Optional[PatternSet] = None):
+        self.indicators = StreamScanner(patterns)
+        self.links = LinkExtractor(base_url, allowed_domains)
+
+    def feed(self, chunk: bytes):
+        self.indicators.feed(chunk)
+        self.links.feed(chunk)
+
+    def report(self) -> Dict[str, Any]:
+        external = self.links.external()
+        return {
+            "indicators": self.indicators.hits,
+            "links": len(self.links.links),
+            "external_links": external[:200],
+            "external_link_count": len(external),
+        }
+
+
+# ----------------------------
+# Suspicious paths
+# ----------------------------
+async def probe_paths(base_url: str, paths: Sequence[str] = DEFAULT_SUSPICIOUS_PATHS,
+                      timeout: float = 5.0, concurrency: int = 20,
+                      headers: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """HEAD every path concurrently (GET when HEAD is refused); returns the ones answering 200."""
+    from modules.http_prober import probe
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    root = base_url.rstrip("/")
+
+    async def one(path: str) -> Dict[str, Any]:
+        async with sem:
+            r = await probe(root + path, method="HEAD", timeout=timeout, headers=headers)
+            if r["status"] in (405, 501):
+                r = await probe(root + path, method="GET", timeout=timeout, headers=headers)
+            return r
+
+    results = await asyncio.gather(*(one(p) for p in paths))
+    return [{"url": r["url"], "status": r["status"]} for r in results if r["status"] == 200]
+
+
+# ----------------------------
+# One-shot / fleet helpers
+# ----------------------------
+async def scan_site(url: str, keyword: Optional[str] = None,
+                    allowed_domains: Optional[Iterable[str]] = None,
+                    paths: Optional[Sequence[str]] = DEFAULT_SUSPICIOUS_PATHS,
+                    timeout: float = 15.0, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Fetch + scan the page and probe suspicious paths at the same time."""
+    from modules.http_prober import probe
+
+    scanner = ContentScanner(url, allowed_domains)
+    page_job = probe(url, keyword=keyword, timeout=timeout, follow_redirects=5, headers=headers,
+                     on_chunk=scanner.feed)
+    if paths:
+        page, exposed = await asyncio.gather(page_job, probe_paths(url, paths, headers=headers))
+    else:
+        page, exposed = await page_job, []
+    report = scanner.report()
+    report["exposed_paths"] = exposed
+    report["clean"] = not report["indicators"] and not exposed
+    return {"url": url, "status": page["status"], "ok": page["ok"], "timings_ms": page["timings_ms"],
+            "error": page.get("error"), "keyword_present": page.get("keyword_present"), "scan": report}
+
+
+async def scan_many(targets: List[Dict[str, Any]], concurrency: int = 20) -> List[Dict[str, Any]]:
+    """targets: [{"url", "keyword"?, "allowed_domains"?}, ...] -> results in order."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(t: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            return await scan_site(t["url"], keyword=t.get("keyword"), allowed_domains=t.get("allowed_domains"))
+
+    return await asyncio.gather(*(one(t) for t in targets))
+
+
+def scan_site_sync(url: str, **kwargs) -> Dict[str, Any]:
+    return asyncio.run(scan_site(url, **kwargs))
+
+
+def scan_many_sync(targets: List[Dict[str, Any]], concurrency: int = 20) -> List[Dict[str, Any]]:
+    return asyncio.run(scan_many(targets, concurrency=concurrency))
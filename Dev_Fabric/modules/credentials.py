@@ -0,0 +1,85 @@
+# modules/credentials.py
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+from typing import Any, Dict, Optional
+
+# Secrets of long-lived Redis records (monitored sites, update waves) are not
+# kept inside those records. The record holds a reference and the secret
+# lives under its own key:
+#   cred:<ref>   "f1:<Fernet token>" when CREDENTIALS_KEY is set (cryptography's
+#                Fernet, already installed with paramiko), else "p1:<json>"
+# Without a key the secret is still plaintext in Redis, but only there: it is
+# never returned by the API, is dropped with its owner and carries a TTL when
+# the owner has one. Set CREDENTIALS_KEY (Fernet.generate_key()) on the API
+# and every worker in production.
+
+PREFIX = "cred"
+log = logging.getLogger(__name__)
+_warned = False
+
+
+def _fernet():
+    from config import settings
+    if not settings.CREDENTIALS_KEY:
+        return None
+    from cryptography.fernet import Fernet
+    return Fernet(settings.CREDENTIALS_KEY.encode())
+
+
+def _seal(secret: Dict[str, Any]) -> str:
+    global _warned
+    raw = json.dumps(secret, separators=(",", ":"))
+    f = _fernet()
+    if f is not None:
+        return "f1:" + f.encrypt(raw.encode()).decode()
+    if not _warned:
+        log.warning("CREDENTIALS_KEY is not set: stored site credentials are not encrypted")
+        _warned = True
+    return "p1:" + raw
+
+
+def _open(blob: str) -> Dict[str, Any]:
+    kind, _, body = blob.partition(":")
+    if kind == "f1":
+        f = _fernet()
+        if f is None:
+            raise RuntimeError("stored credentials are encrypted but CREDENTIALS_KEY is not set")
+        return json.loads(f.decrypt(body.encode()))
+    return json.loads(body)
+
+
+class CredentialStore:
+    def __init__(self, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        self.r = redis
+
+    def put(self, secret: Dict[str, Any], ttl: Optional[int] = None) -> Optional[str]:
+        """Store the non-empty fields of `secret`; returns their reference (None when there are none)."""
+        secret = {k: v for k, v in (secret or {}).items() if v}
+        if not secret:
+            return None
+        ref = uuid.uuid4().hex
+        self.r.set(f"{PREFIX}:{ref}", _seal(secret), ex=ttl)
+        return ref
+
+    def get(self, ref: Optional[str]) -> Dict[str, Any]:
+        """{} for no reference or an expired one."""
+        if not ref:
+            return {}
+        blob = self.r.get(f"{PREFIX}:{ref}")
+        return _open(blob) if blob else {}
+
+    def delete(self, ref: Optional[str]) -> None:
+        if ref:
+            self.r.delete(f"{PREFIX}:{ref}")
+
+
+def split_secrets(data: Dict[str, Any], fields=("auth", "basic_auth", "headers")):
+    """(data without the secret fields, the secret fields)."""
+    rest = {k: v for k, v in data.items() if k not in fields}
+    return rest, {k: data[k] for k in fields if data.get(k)}
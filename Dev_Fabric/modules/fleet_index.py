@@ -0,0 +1,163 @@
+# modules/fleet_index.py
+from __future__ import annotations
+
+import json
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
+
+# Inverted index of installed software across the fleet, kept in Redis:
+#   fidx:item:{kind}:{slug}   hash  site -> [installed, latest, active, update_available, ts]
+#   fidx:site:{site}          hash  "{kind}:{slug}" -> same encoding (what the site had last time)
+#   fidx:slugs:{kind}         set   slugs seen for plugin/theme/core
+# Updating a site diffs against fidx:site:{site} and only touches changed rows.
+PREFIX = "fidx"
+KINDS = ("plugin", "theme", "core")
+
+
+# ----------------------------
+# WordPress (PHP version_compare) ordering
+# ----------------------------
+_SPECIAL = {"dev": 2, "alpha": 4, "a": 4, "beta": 6, "b": 6, "rc": 8, "pl": 12, "p": 12}
+_END = (9, 0)        # sorts after RC/beta/…, before any further number or "pl"
+_NUMBER = 10
+_SPLIT = re.compile(r"\d+|[^\d]+")
+
+
+@lru_cache(maxsize=8192)
+def version_key(v: Optional[str]) -> Tuple[Tuple[int, int], ...]:
+    """
+    Sort key equivalent to PHP's version_compare(), which is what WordPress
+    uses: "6.5" < "6.5.0" < "6.5.1", "1.0-beta2" < "1.0RC1" < "1.0" < "1.0pl1".
+    Unknown words sort below "dev"; None/"" sorts below everything.
+    """
+    if not v:
+        return ()
+    s = re.sub(r"[-_+]", ".", str(v).strip().lower())
+    parts: List[Tuple[int, int]] = []
+    for chunk in s.split("."):
+        for tok in _SPLIT.findall(chunk):
+            if tok.isdigit():
+                parts.append((_NUMBER, int(tok)))
+            else:
+                parts.append((_SPECIAL.get(tok, 0), 0))
+    parts.append(_END)
+    return tuple(parts)
+
+
+def version_compare(a: Optional[str], b: Optional[str]) -> int:
+    ka, kb = version_key(a), version_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+# ----------------------------
+# Index
+# ----------------------------
+def _split_item(item: str) -> Tuple[str, str]:
+    kind, _, slug = item.partition(":")
+    return (kind, slug) if slug else ("core", "wordpress")
+
+
+class FleetIndex:
+    """slug -> {site -> (installed, latest, active)} with incremental updates."""
+
+    def __init__(self, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        self.r = redis
+
+    def update_site(self, site: str, status_like: Any, ts: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Apply one snapshot of `site`. Rows that did not change are not written;
+        items no longer present are removed from their slug's posting list.
+        """
+        from modules.status_history import normalize_snapshot, FLAG_UPDATE, FLAG_ACTIVE, FLAG_ACTIVE_KNOWN
+
+        ts = float(ts if ts is not None else time.time())
+        snapshot = normalize_snapshot(status_like)
+        k_site = f"{PREFIX}:site:{site}"
+        previous = self.r.hgetall(k_site)
+
+        current: Dict[str, List[Any]] = {}
+        for item, (installed, latest, flags) in snapshot.items():
+            active = bool(flags & FLAG_ACTIVE) if flags & FLAG_ACTIVE_KNOWN else None
+            current[item] = [installed, latest, active, bool(flags & FLAG_UPDATE)]
+
+        pipe = self.r.pipeline()
+        changed = 0
+        for item, row in current.items():
+            prev = previous.get(item)
+            if prev is not None and json.loads(prev)[:4] == row:
+                continue
+            kind, slug = _split_item(item)
+            enc = json.dumps(row + [ts])
+            pipe.hset(f"{PREFIX}:item:{kind}:{slug}", site, enc)
+            pipe.hset(k_site, item, enc)
+            pipe.sadd(f"{PREFIX}:slugs:{kind}", slug)
+            changed += 1
+        gone = [item for item in previous if item not in current]
+        for item in gone:
+            kind, slug = _split_item(item)
+            pipe.hdel(f"{PREFIX}:item:{kind}:{slug}", site)
+        if gone:
+            pipe.hdel(k_site, *gone)
+        pipe.execute()
+        return {"site": site, "items": len(current), "changed": changed, "removed": len(gone)}
+
+    def remove_site(self, site: str):
+        k_site = f"{PREFIX}:site:{site}"
+        pipe = self.r.pipeline()
+        for item in self.r.hkeys(k_site):
+            kind, slug = _split_item(item)
+            pipe.hdel(f"{PREFIX}:item:{kind}:{slug}", site)
+        pipe.delete(k_site)
+        pipe.execute()
+
+    # ---- queries ----
+    def sites_for(self, kind: str, slug: str) -> Dict[str, Dict[str, Any]]:
+        raw = self.r.hgetall(f"{PREFIX}:item:{kind}:{slug.lower()}")
+        out: Dict[str, Dict[str, Any]] = {}
+        for site, enc in raw.items():
+            installed, latest, active, update, ts = json.loads(enc)
+            out[site] = {"installed": installed, "latest": latest, "active": active,
+                         "update_available": update, "updated_at": ts}
+        return out
+
+    def query(self, kind: str, slug: str,
+              older_than: Optional[str] = None,
+              at_least: Optional[str] = None,
+              active: Optional[bool] = None,
+              outdated: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Sites running `slug` with at_least <= installed < older_than (either
+        bound optional), filtered by active/outdated when given. Sorted oldest first.
+        """
+        hi = version_key(older_than) if older_than else None
+        lo = version_key(at_least) if at_least else None
+        rows = []
+        for site, row in self.sites_for(kind, slug).items():
+            k = version_key(row["installed"])
+            if hi is not None and not k < hi:
+                continue
+            if lo is not None and not k >= lo:
+                continue
+            if active is not None and row["active"] is not None and row["active"] != active:
+                continue
+            if outdated is not None and row["update_available"] != outdated:
+                continue
+            rows.append({"site": site, **row})
+        rows.sort(key=lambda x: (version_key(x["installed"]), x["site"]))
+        return rows
+
+    def versions(self, kind: str, slug: str) -> List[Dict[str, Any]]:
+        """Installed-version histogram for a slug, newest first."""
+        counts: Dict[Optional[str], int] = {}
+        for row in self.sites_for(kind, slug).values():
+            counts[row["installed"]] = counts.get(row["installed"], 0) + 1
+        return [{"version": v, "sites": n}
+                for v, n in sorted(counts.items(), key=lambda kv: version_key(kv[0]), reverse=True)]
+
+    def slugs(self, kind: str) -> List[str]:
+        return sorted(self.r.smembers(f"{PREFIX}:slugs:{kind}"))
@@ -0,0 +1,284 @@
+# modules/http_prober.py
+from __future__ import annotations
+
+import asyncio
+import socket
+import ssl
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from urllib.parse import urlparse, urljoin
+
+# Minimal HTTP/1.1 client on asyncio streams (stdlib only) so a single worker
+# can probe hundreds of sites concurrently and time each phase separately:
+#   dns -> connect (TCP) -> tls -> ttfb (first response byte) -> total
+# The body is streamed: keyword matching keeps only a small overlap between
+# chunks, and reading stops as soon as nothing else needs the body.
+
+USER_AGENT = "nh-amc-prober/1.0"
+_DNS_TTL = 300.0
+_dns_cache: Dict[Tuple[str, int], Tuple[float, List[Tuple]]] = {}
+
+
+async def _resolve(host: str, port: int) -> Tuple[List[Tuple], bool]:
+    """getaddrinfo with a small TTL cache shared by every probe in the process."""
+    key = (host, port)
+    hit = _dns_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1], True
+    loop = asyncio.get_running_loop()
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    _dns_cache[key] = (time.monotonic() + _DNS_TTL, infos)
+    return infos, False
+
+
+class _KeywordScanner:
+    """
+    Substring search across chunk boundaries without keeping the whole body.
+    ignore_case folds ASCII letters on both sides (bytes.lower()).
+    """
+
+    def __init__(self, keyword: str, ignore_case: bool = False):
+        self.ignore_case = ignore_case
+        self.needle = keyword.encode("utf-8").lower() if ignore_case else keyword.encode("utf-8")
+        self.tail = b""
+        self.found = False
+
+    def feed(self, chunk: bytes):
+        if self.found or not self.needle:
+            return
+        window = self.tail + (chunk.lower() if self.ignore_case else chunk)
+        if self.needle in window:
+            self.found = True
+        self.tail = window[-(len(self.needle) - 1):] if len(self.needle) > 1 else b""
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("empty response")
+    parts = status_line.decode("latin-1").split(" ", 2)
+    status = int(parts[1])
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = line.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    return status, headers
+
+
+async def _iter_body(reader: asyncio.StreamReader, headers: Dict[str, str], chunk_size: int = 16384):
+    """Yield body chunks for content-length, chunked and read-until-close bodies."""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                await reader.readline()
+                return
+            remaining = size
+            while remaining:
+                data = await reader.read(min(chunk_size, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+            await reader.readline()
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            data = await reader.read(min(chunk_size, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+async def probe(url: str,
+                keyword: Optional[str] = None,
+                method: str = "GET",
+                timeout: float = 15.0,
+                max_body_bytes: int = 5 * 1024 * 1024,
+                follow_redirects: int = 0,
+                headers: Optional[Dict[str, str]] = None,
+                verify_tls: bool = True,
+                on_chunk: Optional[Callable[[bytes], None]] = None,
+                ignore_case: bool = False) -> Dict[str, Any]:
+    """
+    Probe one URL. Returns
+    {url, ok, status, timings_ms: {dns, connect, tls, ttfb, total}, bytes,
+     keyword_present?, ip, tls: {not_after, days_left}?, redirects?, error?}
+    `on_chunk` receives every body chunk (used by content scanners).
+    `ignore_case` makes the keyword match case-insensitive.
+    Every resolved address is tried in turn before the host counts as down.
+    """
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"url": url, "ok": False, "status": 0, "method": method}
+    timings: Dict[str, Optional[float]] = {"dns": None, "connect": None, "tls": None, "ttfb": None, "total": None}
+    result["timings_ms"] = timings
+    scanner = _KeywordScanner(keyword, ignore_case) if keyword else None
+    writer = None
+
+    def ms(since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    try:
+        async with _timeout(timeout):
+            p = urlparse(url)
+            https = p.scheme == "https"
+            host = p.hostname or ""
+            port = p.port or (443 if https else 80)
+            path = (p.path or "/") + (f"?{p.query}" if p.query else "")
+
+            t = time.perf_counter()
+            infos, cached = await _resolve(host, port)
+            timings["dns"] = 0.0 if cached else ms(t)
+
+            t = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            sock, last_err = None, None
+            for family, _, proto, _, addr in infos:
+                s = socket.socket(family, socket.SOCK_STREAM, proto)
+                s.setblocking(False)
+                try:
+                    await loop.sock_connect(s, addr)
+                except OSError as e:
+                    s.close()
+                    last_err = e
+                    continue
+                except BaseException:
+                    s.close()
+                    raise
+                sock = s
+                result["ip"] = addr[0]
+                break
+            if sock is None:
+                raise last_err or ConnectionError(f"no address for {host}")
+            timings["connect"] = ms(t)
+
+            t = time.perf_counter()
+            ctx = None
+            if https:
+                ctx = ssl.create_default_context()
+                if not verify_tls:
+                    ctx.check_hostname = False
+                    ctx.verify_mode = ssl.CERT_NONE
+            reader, writer = await asyncio.open_connection(
+                sock=sock, ssl=ctx, server_hostname=host if https else None)
+            if https:
+                timings["tls"] = ms(t)
+                cert = writer.get_extra_info("peercert") or {}
+                if cert.get("notAfter"):
+                    na = datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y %Z").replace(tzinfo=timezone.utc)
+                    result["tls"] = {"not_after": na.isoformat(),
+                                     "days_left": (na - datetime.now(timezone.utc)).days}
+
+            req_headers = {"Host": p.netloc, "User-Agent": USER_AGENT, "Accept": "*/*",
+                           "Accept-Encoding": "identity", "Connection": "close", **(headers or {})}
+            head = f"{method} {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in req_headers.items()) + "\r\n"
+            t_req = time.perf_counter()
+            writer.write(head.encode("latin-1"))
+            await writer.drain()
+
+            status, resp_headers = await _read_headers(reader)
+            timings["ttfb"] = ms(t_req)
+            result["status"] = status
+
+            location = resp_headers.get("location")
+            if follow_redirects > 0 and status in (301, 302, 303, 307, 308) and location:
+                writer.close()
+                writer = None
+                nxt = await probe(urljoin(url, location), keyword=keyword, method=method,
+                                  timeout=max(1.0, timeout - (time.perf_counter() - started)),
+                                  max_body_bytes=max_body_bytes, follow_redirects=follow_redirects - 1,
+                                  headers=headers, verify_tls=verify_tls, on_chunk=on_chunk,
+                                  ignore_case=ignore_case)
+                nxt["redirects"] = [{"url": url, "status": status}] + nxt.get("redirects", [])
+                nxt["timings_ms"]["total"] = ms(started)
+                return nxt
+
+            received = 0
+            if method != "HEAD" and status not in (204, 304):
+                need_body = scanner is not None or on_chunk is not None
+                async for chunk in _iter_body(reader, resp_headers):
+                    received += len(chunk)
+                    if scanner:
+                        scanner.feed(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+                    if not need_body or received >= max_body_bytes:
+                        break
+                    if scanner and scanner.found and on_chunk is None:
+                        break
+            result["bytes"] = received
+            result["ok"] = status == 200
+            if scanner:
+                result["keyword_present"] = scanner.found
+                result["ok"] = result["ok"] and scanner.found
+    except asyncio.TimeoutError:
+        result["error"] = f"timeout after {timeout}s"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if writer is not None:
+            writer.close()
+        timings["total"] = ms(started)
+    return result
+
+
+class _timeout:
+    """asyncio.timeout() is 3.11+; this keeps the prober working on 3.10."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._handle = None
+        self._task = None
+        self._fired = False
+
+    def _fire(self):
+        self._fired = True
+        self._task.cancel()
+
+    async def __aenter__(self):
+        self._task = asyncio.current_task()
+        self._handle = asyncio.get_running_loop().call_later(self.seconds, self._fire)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._handle.cancel()
+        if exc_type is asyncio.CancelledError and self._fired:
+            if hasattr(self._task, "uncancel"):
+                self._task.uncancel()
+            raise asyncio.TimeoutError()
+        return False
+
+
+async def probe_many(targets: List[Dict[str, Any]], concurrency: int = 100) -> List[Dict[str, Any]]:
+    """
+    Probe many targets concurrently: [{"url": ..., "keyword": ..., ...probe kwargs}, ...].
+    Results are returned in input order.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(t: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            return await probe(**t)
+
+    return await asyncio.gather(*(one(t) for t in targets))
+
+
+def probe_sync(url: str, **kwargs) -> Dict[str, Any]:
+    """Blocking wrapper for Fabric tasks and scripts."""
+    return asyncio.run(probe(url, **kwargs))
+
+
+def probe_many_sync(targets: List[Dict[str, Any]], concurrency: int = 100) -> List[Dict[str, Any]]:
+    return asyncio.run(probe_many(targets, concurrency=concurrency))
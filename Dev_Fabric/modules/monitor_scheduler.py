@@ -0,0 +1,151 @@
+# modules/monitor_scheduler.py
+from __future__ import annotations
+
+import json
+import time
+import uuid
+import hashlib
+from typing import Dict, Any, Optional, List, Tuple
+from urllib.parse import urlparse
+
+# Registry + schedule (Redis):
+#   mon:sites                 hash  site_id -> JSON config (no secrets: headers and
+#                             basic_auth live in the credential store, see credentials.py)
+#   mon:sched:{check}         zset  site_id -> phase in [0, 1)   (deterministic hash)
+#   mon:last:{check}:{site}   JSON of the latest result
+#   mon:cursor:{check}        end of the last dispatched window; advanced atomically,
+#                             so two beats never dispatch the same window twice
+#
+# A check with period P runs every site once per P seconds, at
+#   phase * P  seconds into each period.
+# Each beat tick covers the windows from the cursor up to the end of the next
+# tick window and dispatches only the sites whose phase falls in them, each
+# with a countdown to its exact offset, so starts are spread evenly instead of
+# bunching at the top of the minute. A late tick or a beat restart therefore
+# catches up on the windows it missed (at most one period back) instead of
+# skipping those sites for a whole period.
+CHECKS = ("healthcheck", "outdated", "domain_ssl")
+PREFIX = "mon"
+
+
+def phase_for(site_id: str, check: str) -> float:
+    """Stable, uniformly spread phase in [0, 1) per (site, check)."""
+    digest = hashlib.blake2b(f"{check}:{site_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def window_slices(window_start: float, window_len: float, period: float) -> List[Tuple[float, float, float]]:
+    """
+    Map a wall-clock window onto phase space. Returns (lo, hi, base) triples:
+    sites with lo <= phase < hi start at base + phase * period. Handles the
+    window straddling a period boundary (two slices).
+    """
+    base = window_start - (window_start % period)
+    lo = (window_start % period) / period
+    if window_len >= period:
+        # every site once, at its slot in [window_start, window_start + period)
+        return [(lo, 1.0, base)] + ([(0.0, lo, base + period)] if lo > 0 else [])
+    hi = lo + window_len / period
+    if hi <= 1.0:
+        return [(lo, hi, base)]
+    return [(lo, 1.0, base), (0.0, hi - 1.0, base + period)]
+
+
+# cursor -> max(cursor, oldest) .. upto; first run starts at `first`. Nothing when already covered.
+_ADVANCE = """
+local cur = tonumber(redis.call('GET', KEYS[1]) or '')
+local upto, first, oldest = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local start = first
+if cur then start = math.max(cur, oldest) end
+if start >= upto then return false end
+redis.call('SET', KEYS[1], ARGV[1])
+return tostring(start)
+"""
+
+
+class MonitorRegistry:
+    def __init__(self, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        self.r = redis
+
+    # ---- registry ----
+    def register(self, cfg: Dict[str, Any], site_id: Optional[str] = None) -> str:
+        from modules.credentials import CredentialStore, split_secrets
+
+        site_id = site_id or str(uuid.uuid4())
+        store = CredentialStore(self.r)
+        old = self.get(site_id)
+        cfg, secret = split_secrets(dict(cfg), ("headers", "basic_auth"))
+        cfg["credentials_ref"] = store.put(secret)
+        if old:
+            store.delete(old.get("credentials_ref"))
+        if not cfg.get("domain"):
+            cfg["domain"] = urlparse(cfg["url"]).hostname
+        checks = [c for c in (cfg.get("checks") or CHECKS) if c in CHECKS]
+        cfg["checks"] = checks
+        pipe = self.r.pipeline()
+        pipe.hset(f"{PREFIX}:sites", site_id, json.dumps(cfg))
+        for check in CHECKS:
+            if check in checks:
+                pipe.zadd(f"{PREFIX}:sched:{check}", {site_id: phase_for(site_id, check)})
+            else:
+                pipe.zrem(f"{PREFIX}:sched:{check}", site_id)
+        pipe.execute()
+        return site_id
+
+    def unregister(self, site_id: str) -> bool:
+        from modules.credentials import CredentialStore
+
+        cfg = self.get(site_id)
+        if cfg:
+            CredentialStore(self.r).delete(cfg.get("credentials_ref"))
+        pipe = self.r.pipeline()
+        pipe.hdel(f"{PREFIX}:sites", site_id)
+        for check in CHECKS:
+            pipe.zrem(f"{PREFIX}:sched:{check}", site_id)
+            pipe.delete(f"{PREFIX}:last:{check}:{site_id}")
+        return bool(pipe.execute()[0])
+
+    def get(self, site_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.r.hget(f"{PREFIX}:sites", site_id)
+        return json.loads(raw) if raw else None
+
+    def credentials(self, cfg: Dict[str, Any]) -> Dict[str, Any]:
+        """{"headers", "basic_auth"} of a site config (also reads configs stored before the credential store)."""
+        from modules.credentials import CredentialStore
+
+        secret = CredentialStore(self.r).get(cfg.get("credentials_ref"))
+        return {k: secret.get(k) or cfg.get(k) for k in ("headers", "basic_auth")}
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return {k: json.loads(v) for k, v in self.r.hgetall(f"{PREFIX}:sites").items()}
+
+    # ---- schedule ----
+    def due(self, check: str, period: float, window_start: float, window_len: float) -> List[Tuple[str, float]]:
+        """(site_id, start_at_epoch) for every site whose slot falls in the window."""
+        out: List[Tuple[str, float]] = []
+        for lo, hi, base in window_slices(window_start, window_len, period):
+            for site_id, phase in self.r.zrangebyscore(f"{PREFIX}:sched:{check}", lo, f"({hi}", withscores=True):
+                out.append((site_id, base + phase * period))
+        return out
+
+    def claim_windows(self, check: str, upto: int, first: int, oldest: int) -> Optional[int]:
+        """
+        Move the check's cursor to `upto` and return where the caller's range
+        starts (the old cursor, no earlier than `oldest`; `first` on the very
+        first run), or None when another tick already covered it.
+        """
+        start = self.r.register_script(_ADVANCE)(keys=[f"{PREFIX}:cursor:{check}"],
+                                                 args=[int(upto), int(first), int(oldest)])
+        return None if start is None else int(float(start))
+
+    # ---- results ----
+    def store_result(self, check: str, site_id: str, result: Dict[str, Any]):
+        doc = {"at": time.time(), "result": result}
+        self.r.set(f"{PREFIX}:last:{check}:{site_id}", json.dumps(doc, default=str), ex=7 * 86400)
+
+    def last_results(self, site_id: str) -> Dict[str, Any]:
+        keys = [f"{PREFIX}:last:{c}:{site_id}" for c in CHECKS]
+        return {c: (json.loads(v) if v else None) for c, v in zip(CHECKS, self.r.mget(keys))}
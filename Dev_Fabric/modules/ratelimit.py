@@ -0,0 +1,181 @@
+# modules/ratelimit.py
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+# Admission control for the task-enqueue endpoints.
+#  - Token buckets per client and per site live in Redis and are checked and
+#    charged by one Lua script, so every API worker enforces the same limits
+#    and a request is only charged when *all* of its buckets have tokens.
+#    Time comes from Redis (TIME), not from each API host's clock.
+#  - Backpressure: when a lane's broker queue is deeper than QUEUE_MAX_DEPTH
+#    new work for that lane is refused outright; the client is told when to
+#    retry instead of adding to a backlog nobody will reach in time.
+# Both are reported as (reason, retry_after_seconds); main.py turns that into
+# 429 + Retry-After.
+
+PREFIX = "ratelimit"
+
+_TAKE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  local b = redis.call('HMGET', key, 'tokens', 'ts')
+  local have = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  have = math.min(burst, have + math.max(0, now - ts) * rate)
+  if have < cost then wait = math.max(wait, (cost - have) / rate) end
+  tokens[i] = have
+end
+if wait > 0 then return {0, tostring(wait)} end
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  redis.call('HSET', key, 'tokens', tostring(tokens[i] - cost), 'ts', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return {1, '0'}
+"""
+
+
+class RateLimiter:
+    def __init__(self, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        self.r = redis
+        self._take = self.r.register_script(_TAKE)
+
+    def take(self, buckets: List[Tuple[str, float, float]], cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        buckets: [(name, rate per second, burst), ...]. Charges `cost` to all
+        of them or to none; returns (allowed, seconds until it would be).
+        """
+        buckets = [b for b in buckets if b[1] > 0 and b[2] > 0]
+        if not buckets:
+            return True, 0.0
+        keys = [f"{PREFIX}:{name}" for name, _, _ in buckets]
+        args: List[Any] = [min(cost, min(b[2] for b in buckets))]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        allowed, wait = self._take(keys=keys, args=args)
+        return bool(int(allowed)), float(wait)
+
+
+# ----------------------------
+# Broker backlog
+# ----------------------------
+_depth_cache: Dict[str, Tuple[float, int]] = {}
+
+
+def _broker_redis():
+    from redis_client import get_redis
+    from config import settings
+    if not settings.BROKER_URL or str(settings.BROKER_URL) == str(settings.REDIS_URL):
+        return get_redis()
+    import redis
+    return redis.Redis.from_url(str(settings.BROKER_URL), decode_responses=True)
+
+
+def lane_keys(lane: str, steps: int = 10, sep: str = ":") -> List[str]:
+    """Redis lists behind one Celery queue with priority steps ("q", "q:1", ... "q:9")."""
+    return [lane] + [f"{lane}{sep}{p}" for p in range(1, steps)]
+
+
+def queue_depth(queues: Iterable[str] = ("interactive",), max_age: float = 1.0, redis=None) -> int:
+    """Messages waiting in the broker lists (cached `max_age` seconds per process)."""
+    key = ",".join(queues)
+    hit = _depth_cache.get(key)
+    now = time.monotonic()
+    if hit and now - hit[0] < max_age:
+        return hit[1]
+    r = redis or _broker_redis()
+    pipe = r.pipeline()
+    for q in queues:
+        pipe.llen(q)
+    depth = sum(int(n or 0) for n in pipe.execute())
+    _depth_cache[key] = (now, depth)
+    return depth
+
+
+# ----------------------------
+# Request -> client / sites
+# ----------------------------
+def client_id(headers, remote: Optional[str]) -> str:
+    """X-Client-ID when the frontend sends one (one per dashboard/tab/user), else the peer address."""
+    return (headers.get("x-client-id") or remote or "unknown").strip()[:128]
+
+
+def _site_of(d: Dict[str, Any]) -> Optional[str]:
+    if d.get("host"):
+        return str(d["host"]).strip().lower()
+    for k in ("base_url", "url"):
+        if d.get(k):
+            return (urlparse(str(d[k])).hostname or str(d[k])).lower()
+    if d.get("domain"):
+        return str(d["domain"]).strip().lower()
+    return None
+
+
+def site_keys(body: Any) -> Set[str]:
+    """Sites a request body targets: top level or one level down (embedded `site`/`req`)."""
+    out: Set[str] = set()
+    if not isinstance(body, dict):
+        return out
+    top = _site_of(body)
+    if top:
+        out.add(top)
+    for v in body.values():
+        if isinstance(v, dict):
+            s = _site_of(v)
+            if s:
+                out.add(s)
+    return out
+
+
+def _site_buckets(sites: Iterable[str]) -> List[Tuple[str, float, float]]:
+    from config import settings
+    return [(f"site:{s}", settings.RATE_LIMIT_SITE_RATE, settings.RATE_LIMIT_SITE_BURST) for s in sorted(sites)]
+
+
+def charge_sites(sites: Iterable[str], cost: float = 1.0,
+                 limiter: Optional[RateLimiter] = None) -> Optional[Tuple[str, int]]:
+    """
+    Site buckets only, for coalescing endpoints: charged when a task is really
+    published, not for requests answered by an identical queued/cached task.
+    """
+    buckets = _site_buckets(sites)
+    if not buckets:
+        return None
+    allowed, wait = (limiter or RateLimiter()).take(buckets, cost=cost)
+    if not allowed:
+        return "rate limit exceeded", max(1, math.ceil(wait))
+    return None
+
+
+def admit(client: str, sites: Iterable[str], lane: str = "interactive", cost: float = 1.0,
+          limiter: Optional[RateLimiter] = None) -> Optional[Tuple[str, int]]:
+    """
+    None if the request may enqueue on `lane`, else (reason, retry_after_seconds).
+    Pass no sites for endpoints that charge them later through charge_sites().
+    """
+    from config import settings
+
+    if settings.QUEUE_MAX_DEPTH > 0:
+        # per lane: a deep background backlog must not refuse interactive work
+        depth = queue_depth(lane_keys(lane))
+        if depth >= settings.QUEUE_MAX_DEPTH:
+            return f"{lane} queue is full ({depth} waiting)", settings.QUEUE_RETRY_AFTER
+
+    buckets = [(f"client:{client}", settings.RATE_LIMIT_CLIENT_RATE, settings.RATE_LIMIT_CLIENT_BURST)]
+    buckets += _site_buckets(sites)
+    allowed, wait = (limiter or RateLimiter()).take(buckets, cost=cost)
+    if not allowed:
+        return "rate limit exceeded", max(1, math.ceil(wait))
+    return None
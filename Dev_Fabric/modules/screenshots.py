@@ -0,0 +1,402 @@
+# modules/screenshots.py
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Sequence
+
+# Screenshots + visual regression.
+#  - Capture: a per-process pool of warm headless Chromium pages (Playwright,
+#    optional) driven from one background event loop; falls back to spawning
+#    wkhtmltoimage / headless Chrome when Playwright is not installed or its
+#    browser cannot be launched (the pool then stays off for the process).
+#  - Hashing: 64-bit dHash of the whole page plus one per cell of a GRID x GRID
+#    region grid, so a diff can say *where* the page changed.
+#  - Store: one .npz per deployment holding site names and uint64 matrices for
+#    baselines and latest captures; a fleet comparison is one XOR + popcount.
+
+VIEWPORT = (1366, 768)
+GRID = 4
+HASH_WORDS = 1 + GRID * GRID          # [whole page, region 0 .. region GRID*GRID-1]
+
+
+# ----------------------------
+# Tool detection (cached; no `command -v` per screenshot)
+# ----------------------------
+@lru_cache(maxsize=32)
+def find_tool(name: str) -> Optional[str]:
+    return shutil.which(name)
+
+
+@lru_cache(maxsize=1)
+def playwright_available() -> bool:
+    try:
+        import playwright.async_api  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ----------------------------
+# Warm browser pool (Playwright)
+# ----------------------------
+class BrowserPool:
+    """
+    One Chromium per process with `size` reusable pages. The browser lives on
+    a daemon thread's event loop, so synchronous callers (Celery tasks, Fabric
+    tasks) can submit captures and several run concurrently.
+    """
+
+    def __init__(self, size: int = 2, timeout: float = 30.0):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pages: Optional[asyncio.Queue] = None
+        self._pw = None
+        self._browser = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self.error: Optional[str] = None     # launch failure in this process: pool is not used again
+
+    @property
+    def usable(self) -> bool:
+        return not (self.error and self._pid == os.getpid())
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                if self.error:
+                    raise RuntimeError(f"browser pool unavailable: {self.error}")
+                if self._loop is not None:
+                    return
+            # first use, or a forked worker: the parent's loop/thread do not exist here
+            self._pid, self._loop, self.error = os.getpid(), None, None
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True).start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._launch(), loop).result(timeout=60)
+            except BaseException as e:
+                # e.g. playwright installed without `playwright install chromium`
+                try:
+                    asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=15)
+                except BaseException:
+                    pass
+                loop.call_soon_threadsafe(loop.stop)
+                self._pages = self._browser = self._pw = None
+                self.error = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+                raise RuntimeError(f"browser pool unavailable: {self.error}") from e
+            self._loop = loop
+
+    async def _launch(self):
+        from playwright.async_api import async_playwright
+
+        self._pw = await async_playwright().start()
+        self._browser = await self._pw.chromium.launch(args=["--no-sandbox", "--disable-gpu"])
+        pages = asyncio.Queue()
+        for _ in range(self.size):
+            ctx = await self._browser.new_context(viewport={"width": VIEWPORT[0], "height": VIEWPORT[1]})
+            await pages.put(await ctx.new_page())
+        self._pages = pages
+
+    async def _shutdown(self):
+        if self._browser is not None:
+            await self._browser.close()
+        if self._pw is not None:
+            await self._pw.stop()
+
+    async def _capture(self, url: str, out_path: str, full_page: bool) -> Dict[str, Any]:
+        page = await self._pages.get()
+        try:
+            await page.goto(url, wait_until="networkidle", timeout=self.timeout * 1000)
+            await page.screenshot(path=out_path, full_page=full_page)
+            return {"ok": True, "path": out_path, "tool": "playwright", "error": None}
+        except Exception as e:
+            return {"ok": False, "path": out_path, "tool": "playwright", "error": str(e)}
+        finally:
+            try:
+                await page.goto("about:blank")
+            except Exception:
+                # page is wedged: replace it so the pool keeps its size
+                page = await page.context.new_page()
+            await self._pages.put(page)
+
+    def submit(self, url: str, out_path: str, full_page: bool = True) -> Future:
+        self._start()
+        return asyncio.run_coroutine_threadsafe(self._capture(url, out_path, full_page), self._loop)
+
+    def capture(self, url: str, out_path: str, full_page: bool = True) -> Dict[str, Any]:
+        return self.submit(url, out_path, full_page).result(timeout=self.timeout + 15)
+
+    def capture_many(self, jobs: Sequence[tuple], full_page: bool = True) -> List[Dict[str, Any]]:
+        """jobs: [(url, out_path), ...]; at most `size` run at once."""
+        try:
+            self._start()
+        except Exception as e:
+            return [{"ok": False, "path": path, "tool": "playwright", "error": str(e)} for _, path in jobs]
+        futures = [self.submit(url, path, full_page) for url, path in jobs]
+        out = []
+        for (url, path), fut in zip(jobs, futures):
+            try:
+                out.append(fut.result(timeout=self.timeout * (1 + len(jobs) / self.size) + 15))
+            except Exception as e:
+                out.append({"ok": False, "path": path, "tool": "playwright", "error": str(e)})
+        return out
+
+
+_POOL: Optional[BrowserPool] = None
+
+
+def get_pool() -> Optional[BrowserPool]:
+    global _POOL
+    from config import settings
+
+    if settings.SCREENSHOT_POOL_SIZE <= 0 or not playwright_available():
+        return None
+    if _POOL is None:
+        _POOL = BrowserPool(size=settings.SCREENSHOT_POOL_SIZE)
+    return _POOL if _POOL.usable else None
+
+
+# ----------------------------
+# CLI fallback
+# ----------------------------
+def capture_cli(url: str, out_path: str, timeout: int = 60) -> Dict[str, Any]:
+    """wkhtmltoimage first, then headless Chrome/Chromium (old _take_screenshot behaviour)."""
+    wk = find_tool("wkhtmltoimage")
+    if wk:
+        r = subprocess.run([wk, "--format", "png", "--width", str(VIEWPORT[0]), "--height", "0", url, out_path],
+                           capture_output=True, timeout=timeout)
+        if r.returncode == 0 and os.path.exists(out_path):
+            return {"ok": True, "path": out_path, "tool": "wkhtmltoimage", "error": None}
+
+    for name in ("google-chrome", "google-chrome-stable", "chromium-browser", "chromium"):
+        chrome = find_tool(name)
+        if not chrome:
+            continue
+        # run in a scratch dir: some builds ignore --screenshot=<path> and write ./screenshot.png
+        with tempfile.TemporaryDirectory(prefix="shot_") as tmp:
+            r = subprocess.run([chrome, "--headless", "--disable-gpu", "--hide-scrollbars", "--no-sandbox",
+                                f"--window-size={VIEWPORT[0]},{VIEWPORT[1]}", f"--screenshot={out_path}", url],
+                               capture_output=True, timeout=timeout, cwd=tmp)
+            if r.returncode == 0 and os.path.exists(out_path):
+                return {"ok": True, "path": out_path, "tool": name, "error": None}
+            fallback = os.path.join(tmp, "screenshot.png")
+            if os.path.exists(fallback):
+                try:
+                    shutil.move(fallback, out_path)
+                    return {"ok": True, "path": out_path, "tool": name, "error": None}
+                except Exception as mv_e:
+                    return {"ok": False, "path": out_path, "tool": name, "error": f"move_failed: {mv_e}"}
+
+    return {
+        "ok": False,
+        "path": out_path,
+        "tool": None,
+        "error": "No screenshot tool found (install playwright, wkhtmltoimage or Chrome/Chromium headless).",
+    }
+
+
+def take_screenshot(url: str, out_path: str, full_page: bool = True) -> Dict[str, Any]:
+    """Returns {"ok": bool, "path": out_path, "tool": str, "error": Optional[str]}"""
+    os.makedirs(os.path.dirname(out_path) or "/tmp", exist_ok=True)
+    pool = get_pool()
+    if pool is not None:
+        try:
+            res = pool.capture(url, out_path, full_page)
+            if res["ok"]:
+                return res
+        except Exception:
+            pass            # no usable browser (or a stuck capture): the CLI tools still may work
+    return capture_cli(url, out_path)
+
+
+def take_screenshots(jobs: Sequence[tuple], full_page: bool = True) -> List[Dict[str, Any]]:
+    """Batch version of take_screenshot: [(url, out_path), ...] -> results in order."""
+    for _, path in jobs:
+        os.makedirs(os.path.dirname(path) or "/tmp", exist_ok=True)
+    pool = get_pool()
+    if pool is None:
+        return [capture_cli(url, path) for url, path in jobs]
+    results = pool.capture_many(jobs, full_page)
+    return [r if r["ok"] else capture_cli(url, path) for (url, path), r in zip(jobs, results)]
+
+
+# ----------------------------
+# Perceptual hashing
+# ----------------------------
+def _dhash(gray) -> int:
+    """64-bit difference hash of a grayscale PIL image."""
+    import numpy as np
+    from PIL import Image
+
+    px = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def perceptual_hash(image_path: str, grid: int = GRID):
+    """
+    uint64 vector [whole, r0 .. r(grid*grid-1)]. Regions are taken over the
+    first viewport height (above the fold), where defacements show up first.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(image_path) as im:
+        gray = im.convert("L")
+    w, h = gray.size
+    fold = gray.crop((0, 0, w, min(h, max(VIEWPORT[1], w * VIEWPORT[1] // VIEWPORT[0]))))
+    fw, fh = fold.size
+    out = [_dhash(gray)]
+    for r in range(grid):
+        for c in range(grid):
+            box = (c * fw // grid, r * fh // grid, (c + 1) * fw // grid, (r + 1) * fh // grid)
+            out.append(_dhash(fold.crop(box)))
+    return np.array(out, dtype=np.uint64)
+
+
+def hamming(a, b):
+    """Bitwise distance between uint64 arrays of equal shape (vectorized popcount)."""
+    import numpy as np
+
+    x = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    bits = np.unpackbits(np.ascontiguousarray(x).view(np.uint8).reshape(*x.shape, 8), axis=-1)
+    return bits.sum(axis=-1, dtype=np.int64)
+
+
+# ----------------------------
+# Fleet hash store (.npz)
+# ----------------------------
+class HashStore:
+    """
+    {site -> baseline hash vector, latest hash vector} in one .npz:
+      sites (N,) str, baseline (N, HASH_WORDS) uint64, current (N, HASH_WORDS) uint64,
+      baseline_at / current_at (N,) float64 (0 = never)
+    Writes are serialized with flock and replaced atomically.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            from config import settings
+            path = os.path.join(settings.SCREENSHOT_DIR, "hashes.npz")
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.path + ".lock", "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read(self) -> Dict[str, Any]:
+        import numpy as np
+
+        if not os.path.exists(self.path):
+            return {"sites": np.array([], dtype=str),
+                    "baseline": np.zeros((0, HASH_WORDS), dtype=np.uint64),
+                    "current": np.zeros((0, HASH_WORDS), dtype=np.uint64),
+                    "baseline_at": np.zeros(0), "current_at": np.zeros(0)}
+        with np.load(self.path) as z:
+            return {k: z[k] for k in z.files}
+
+    def _write(self, data: Dict[str, Any]):
+        import numpy as np
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".npz")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, **data)
+        os.replace(tmp, self.path)
+
+    def update(self, current: Dict[str, Any], set_baseline: bool = False) -> None:
+        """Store the latest hashes; sites without a baseline (or set_baseline) get one."""
+        import numpy as np
+
+        now = time.time()
+        with self._locked():
+            d = self._read()
+            index = {s: i for i, s in enumerate(d["sites"].tolist())}
+            new = [s for s in current if s not in index]
+            if new:
+                n = len(new)
+                d["sites"] = np.concatenate([d["sites"], np.array(new, dtype=str)])
+                for k in ("baseline", "current"):
+                    d[k] = np.vstack([d[k], np.zeros((n, HASH_WORDS), dtype=np.uint64)])
+                for k in ("baseline_at", "current_at"):
+                    d[k] = np.concatenate([d[k], np.zeros(n)])
+                index.update({s: len(index) + i for i, s in enumerate(new)})
+            rows = np.array([index[s] for s in current], dtype=np.int64)
+            vecs = np.vstack([np.asarray(v, dtype=np.uint64) for v in current.values()])
+            d["current"][rows] = vecs
+            d["current_at"][rows] = now
+            reset = rows if set_baseline else rows[d["baseline_at"][rows] == 0]
+            if len(reset):
+                d["baseline"][reset] = d["current"][reset]
+                d["baseline_at"][reset] = now
+            self._write(d)
+
+    def promote(self, sites: Optional[List[str]] = None) -> int:
+        """Accept the latest captures as the new baseline (all sites when None)."""
+        import numpy as np
+
+        with self._locked():
+            d = self._read()
+            mask = d["current_at"] > 0
+            if sites is not None:
+                mask &= np.isin(d["sites"], sites)
+            d["baseline"][mask] = d["current"][mask]
+            d["baseline_at"][mask] = d["current_at"][mask]
+            self._write(d)
+            return int(mask.sum())
+
+    def remove(self, sites: List[str]) -> int:
+        import numpy as np
+
+        with self._locked():
+            d = self._read()
+            keep = ~np.isin(d["sites"], sites)
+            self._write({k: v[keep] for k, v in d.items()})
+            return int((~keep).sum())
+
+    def compare(self, threshold: int = 10, region_threshold: int = 12,
+                sites: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Distance of every site's latest capture from its baseline in one
+        vectorized pass. A site is flagged when the whole-page distance exceeds
+        `threshold` or any region exceeds `region_threshold`.
+        """
+        import numpy as np
+
+        d = self._read()
+        mask = (d["current_at"] > 0) & (d["baseline_at"] > 0)
+        if sites is not None:
+            mask &= np.isin(d["sites"], sites)
+        idx = np.nonzero(mask)[0]
+        dist = hamming(d["current"][idx], d["baseline"][idx])       # (n, HASH_WORDS)
+        whole, regions = dist[:, 0], dist[:, 1:]
+        flagged = (whole > threshold) | (regions > region_threshold).any(axis=1)
+        out = []
+        for j, i in enumerate(idx):
+            changed = np.nonzero(regions[j] > region_threshold)[0]
+            out.append({
+                "site": str(d["sites"][i]),
+                "distance": int(whole[j]),
+                "changed": bool(flagged[j]),
+                "regions": [{"row": int(k // GRID), "col": int(k % GRID), "distance": int(regions[j][k])}
+                            for k in changed],
+                "baseline_at": float(d["baseline_at"][i]),
+                "captured_at": float(d["current_at"][i]),
+            })
+        out.sort(key=lambda x: (-x["changed"], -x["distance"]))
+        return out
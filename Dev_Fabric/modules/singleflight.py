@@ -0,0 +1,86 @@
+# modules/singleflight.py
+from __future__ import annotations
+
+import hashlib
+import json
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+# Request coalescing for read-only tasks (wp-status, outdated fetch, domain/SSL).
+#   singleflight:<task>:<target>:<args hash>  ->  task id
+# The key is claimed with SET NX before the task is sent, so N identical
+# requests produce one task and N-1 callers get its id back ("coalesced").
+# The task carries the key in a "singleflight" message header; when it
+# finishes the worker shortens the key's life to the freshness window (the
+# result is reused as "cached" until then) or deletes it if the run failed.
+# INFLIGHT_TTL only bounds how long a task lost by a dead worker blocks reruns.
+
+PREFIX = "singleflight"
+HEADER = "singleflight"
+_LIVE_STATES = ("PENDING", "RECEIVED", "STARTED", "RETRY")
+
+# shorten (ARGV[2] > 0) or drop the key, but only while it still points at this task
+_FINISH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  if tonumber(ARGV[2]) > 0 then return redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def normalize_target(target: str) -> str:
+    """Host/URL/domain -> comparable form (lowercase host, no trailing slash)."""
+    t = (target or "").strip()
+    if "://" in t:
+        u = urlparse(t)
+        return f"{u.scheme.lower()}://{(u.netloc or '').lower()}{u.path.rstrip('/')}"
+    return t.lower().rstrip("/")
+
+
+def flight_key(task_name: str, target: str, args: Optional[Dict[str, Any]] = None) -> str:
+    # args may hold credentials: only their hash ends up in Redis
+    digest = hashlib.sha1(json.dumps(args or {}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"{PREFIX}:{task_name}:{normalize_target(target)}:{digest}"
+
+
+class SingleFlight:
+    def __init__(self, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        self.r = redis
+        self._finish = self.r.register_script(_FINISH)
+
+    def submit(self, key: str, send: Callable[[str], Any], state_of: Callable[[str], str],
+               inflight_ttl: int = 900) -> Tuple[str, str]:
+        """
+        Returns (task_id, status): "queued" (sent now), "coalesced" (identical
+        task queued/running) or "cached" (identical task succeeded recently).
+        send(task_id) must enqueue the task under that id with the HEADER set.
+        """
+        tid = self.r.get(key)
+        if tid:
+            state = state_of(tid)
+            if state in _LIVE_STATES:
+                return tid, "coalesced"
+            if state == "SUCCESS":
+                return tid, "cached"
+            self.finish(key, tid, ok=False)
+
+        new = str(uuid.uuid4())
+        if not self.r.set(key, new, nx=True, ex=inflight_ttl):
+            other = self.r.get(key)
+            if other:
+                return other, "coalesced"
+            # claimed and released in between: just run it
+        try:
+            send(new)
+        except Exception:
+            self.finish(key, new, ok=False)
+            raise
+        return new, "queued"
+
+    def finish(self, key: str, task_id: str, ok: bool, fresh_seconds: int = 0) -> bool:
+        return bool(self._finish(keys=[key], args=[task_id, fresh_seconds if ok else 0]))
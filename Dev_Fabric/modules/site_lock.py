@@ -0,0 +1,147 @@
+# modules/site_lock.py
+from __future__ import annotations
+
+import threading
+from typing import Optional, Tuple
+
+# Per-site mutual exclusion for mutating tasks (updates, backups, reset, ...).
+#   sitelock:<site>:owner   task id holding the site, with a lease (PX) that a
+#                           background thread renews while the task runs; a
+#                           dead worker stops renewing and the site frees up
+#   sitelock:<site>:queue   ZSET of waiting task ids, scored by arrival (FIFO)
+#   sitelock:<site>:seen    task id -> last time it asked (waiters that stop
+#                           asking, e.g. revoked or lost, are dropped)
+# A task that cannot take the site is not parked on a worker: the caller
+# retries it with a countdown and it asks again later, keeping its place.
+# Only the head of the queue may take a free site, so waiters run in order.
+# <site> is site_key(): the same WordPress site must map to the same key
+# whether the task reaches it over SSH (Fabric) or over its REST API.
+
+PREFIX = "sitelock"
+
+_ACQUIRE = """
+local owner_key, queue_key, seen_key = KEYS[1], KEYS[2], KEYS[3]
+local id, lease, stale = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local owner = redis.call('GET', owner_key)
+if owner == id then
+  redis.call('PEXPIRE', owner_key, lease)
+  return {1, 0}
+end
+redis.call('ZADD', queue_key, 'NX', now, id)
+redis.call('HSET', seen_key, id, now)
+redis.call('EXPIRE', queue_key, 86400)
+redis.call('EXPIRE', seen_key, 86400)
+
+while true do
+  local head = redis.call('ZRANGE', queue_key, 0, 0)[1]
+  if not head or head == id then break end
+  local seen = tonumber(redis.call('HGET', seen_key, head) or '0')
+  if now - seen <= stale then break end
+  redis.call('ZREM', queue_key, head)
+  redis.call('HDEL', seen_key, head)
+end
+
+local rank = redis.call('ZRANK', queue_key, id)
+if owner or rank > 0 then
+  return {0, rank}
+end
+redis.call('SET', owner_key, id, 'PX', lease)
+redis.call('ZREM', queue_key, id)
+redis.call('HDEL', seen_key, id)
+return {1, 0}
+"""
+
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+_RELEASE = """
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+def site_key(site_id: Optional[str] = None, url: Optional[str] = None,
+             host: Optional[str] = None) -> Optional[str]:
+    """
+    Canonical lock key of a site: the explicit site_id when given, else the
+    hostname of the domain/URL, else the SSH host (lowercased, no "www.").
+    """
+    if site_id and str(site_id).strip():
+        return str(site_id).strip().lower()
+    u = (url or "").strip() or (host or "").strip()
+    if not u:
+        return None
+    from urllib.parse import urlparse
+    name = (urlparse(u if "//" in u else "//" + u).hostname or u).lower().rstrip(".")
+    return name[4:] if name.startswith("www.") else name
+
+
+class SiteLock:
+    def __init__(self, site: str, task_id: str, lease: float = 60.0, stale: float = 300.0, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        self.r = redis
+        self.site = site.strip().lower()
+        self.task_id = task_id
+        self.lease_ms = int(lease * 1000)
+        self.stale_ms = int(stale * 1000)
+        base = f"{PREFIX}:{self.site}"
+        self.keys = [f"{base}:owner", f"{base}:queue", f"{base}:seen"]
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def acquire(self) -> Tuple[bool, int]:
+        """(True, 0) when this task now holds the site, else (False, tasks ahead of it)."""
+        got, ahead = self.r.register_script(_ACQUIRE)(keys=self.keys, args=[self.task_id, self.lease_ms, self.stale_ms])
+        return bool(int(got)), int(ahead)
+
+    def owner(self) -> Optional[str]:
+        return self.r.get(self.keys[0])
+
+    def _renew_loop(self):
+        renew = self.r.register_script(_RENEW)
+        while not self._stop.wait(self.lease_ms / 3000):
+            try:
+                if not renew(keys=self.keys[:1], args=[self.task_id, self.lease_ms]):
+                    self.lost = True        # lease expired (e.g. a long GC/network stall); someone else may run
+                    return
+            except Exception:
+                continue                    # transient Redis error: retry on the next tick, lease still covers us
+
+    def start_renewal(self):
+        self._thread = threading.Thread(target=self._renew_loop, name=f"sitelock-{self.site}", daemon=True)
+        self._thread.start()
+
+    def release(self) -> bool:
+        """Stop renewing and free the site (also leaves the queue if still waiting)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        return bool(self.r.register_script(_RELEASE)(keys=self.keys, args=[self.task_id]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+def waiting(site: str, redis=None) -> dict:
+    """Current holder and FIFO of a site (for the API)."""
+    if redis is None:
+        from redis_client import get_redis
+        redis = get_redis()
+    site = site_key(url=site)
+    base = f"{PREFIX}:{site}"
+    return {"site": site, "owner": redis.get(f"{base}:owner"),
+            "queue": redis.zrange(f"{base}:queue", 0, -1)}
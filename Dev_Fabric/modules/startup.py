@@ -0,0 +1,82 @@
+# modules/startup.py
+from __future__ import annotations
+
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+# Cold-start measurement for the API and worker processes.
+#   process_age_ms()  ms since this process was exec'd (logged by the API on
+#                     startup and by the worker on worker_ready)
+#   python -m modules.startup [module ...] [--runs N]
+#                     imports each module in fresh interpreters and prints the
+#                     best wall time plus the slowest imports (-X importtime),
+#                     e.g. to check that fabric/paramiko are not on the API path.
+
+_DEFAULT_MODULES = ["main", "celery_app"]
+_HEAVY = ("fabric", "paramiko", "invoke", "requests", "numpy", "PIL", "playwright")
+
+
+def process_age_ms() -> Optional[float]:
+    """Milliseconds since this process started (Linux /proc; None elsewhere)."""
+    try:
+        with open("/proc/self/stat") as fh:
+            # fields after the ")" of the command name start at field 3; starttime is field 22
+            start_ticks = int(fh.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as fh:
+            uptime = float(fh.read().split()[0])
+        return round((uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def measure(module: str, runs: int = 5, top: int = 10) -> Dict[str, Any]:
+    """Best-of-`runs` wall time of `python -c "import <module>"` plus its slowest imports."""
+    cmd = [sys.executable, "-c", f"import {module}"]
+    best = None
+    for _ in range(max(1, runs)):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        took = (time.perf_counter() - t0) * 1000
+        best = took if best is None else min(best, took)
+
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                       check=True, capture_output=True, text=True)
+    rows: List[tuple] = []
+    loaded = set()
+    for line in r.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m:
+            name = m.group(4)
+            loaded.add(name.split(".")[0])
+            if len(m.group(3)) == 3:
+                rows.append((int(m.group(2)) / 1000, name))     # direct imports of `module`
+    rows.sort(reverse=True)
+    return {
+        "module": module,
+        "best_ms": round(best, 1),
+        "slowest_imports": [{"module": n, "ms": round(ms, 1)} for ms, n in rows[:top]],
+        "heavy_loaded": sorted(loaded.intersection(_HEAVY)),
+    }
+
+
+def main(argv: List[str]) -> int:
+    runs = 5
+    if "--runs" in argv:
+        i = argv.index("--runs")
+        runs = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    for module in argv or _DEFAULT_MODULES:
+        res = measure(module, runs=runs)
+        print(f"{res['module']}: {res['best_ms']} ms (best of {runs}); "
+              f"heavy deps loaded: {', '.join(res['heavy_loaded']) or 'none'}")
+        for row in res["slowest_imports"]:
+            print(f"    {row['ms']:8.1f} ms  {row['module']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,264 @@
+# modules/status_history.py
+from __future__ import annotations
+
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Optional, List, Tuple
+from urllib.parse import urlparse
+
+# Layout (per site, all Redis keys under "hist:{site}:"):
+#   ts         float64 column, one entry per change event (append-only)
+#   item       uint32 column  -> string id of "plugin:<slug>" / "theme:<slug>" / "core"
+#   installed  uint32 column  -> string id of installed version (0 = none)
+#   latest     uint32 column  -> string id of latest version   (0 = none)
+#   flags      uint8 column   -> FLAG_* bits below
+#   strings    list  (id = index + 1) / strid hash (string -> id)
+#   last       hash  item -> "installed_id,latest_id,flags,since" (state after the
+#              last event; `since` is that event's ts, absent on older records)
+# Only items whose state differs from `last` are appended, so an unchanged
+# site costs one HGETALL and zero writes per snapshot, and the current state
+# is read from `last` without touching the columns.
+PREFIX = "hist"
+FLAG_UPDATE = 1
+FLAG_ACTIVE = 2
+FLAG_ACTIVE_KNOWN = 4
+FLAG_REMOVED = 8
+
+_COLUMNS = (("ts", "d"), ("item", "I"), ("installed", "I"), ("latest", "I"), ("flags", "B"))
+
+Row = Tuple[Optional[str], Optional[str], int]   # (installed, latest, flags)
+
+
+# ----------------------------
+# Snapshot normalization
+# ----------------------------
+def site_key(url: str) -> str:
+    """'https://Example.com/wp-json/...' -> 'example.com' (falls back to the raw string)."""
+    p = urlparse(url if "://" in url else f"//{url}")
+    return (p.netloc or url).lower().strip("/")
+
+
+def _flags(has_update: Any, active: Any) -> int:
+    f = FLAG_UPDATE if has_update else 0
+    if active is not None:
+        f |= FLAG_ACTIVE_KNOWN | (FLAG_ACTIVE if active else 0)
+    return f
+
+
+def _str(v: Any) -> Optional[str]:
+    return None if v is None or v == "" else str(v)
+
+
+def normalize_snapshot(status_like: Any) -> Dict[str, Row]:
+    """
+    Reduce a /status body (new or legacy schema, wrapped or not) to
+    {"plugin:<slug>": (installed, latest, flags), "theme:<slug>": ..., "core": ...}.
+    """
+    from modules.wp_status import WPStatus
+
+    st = WPStatus.of(status_like)
+    out: Dict[str, Row] = {}
+
+    for p in st.plugins:
+        slug = (p.slug or p.plugin_file or p.name).lower()
+        if slug:
+            out[f"plugin:{slug}"] = (_str(p.version), _str(p.latest_version), _flags(p.update_available, p.active))
+
+    for t in st.themes:
+        slug = t.slug.lower()
+        if slug:
+            out[f"theme:{slug}"] = (_str(t.version), _str(t.latest_version), _flags(t.update_available, t.active))
+
+    c = st.core
+    if c is not None:
+        out["core"] = (_str(c.version), _str(c.latest_version), _flags(c.update_available, None))
+    return out
+
+
+# ----------------------------
+# Store
+# ----------------------------
+class StatusHistory:
+    """Delta-encoded, column-per-key status history backed by Redis."""
+
+    def __init__(self, redis=None):
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis(binary=True)
+        self.r = redis
+
+    def _k(self, site: str, name: str) -> str:
+        return f"{PREFIX}:{site}:{name}"
+
+    # ---- ingest ----
+    def ingest(self, site: str, status_like: Any, ts: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Append only the items whose (installed, latest, flags) changed since the
+        previous snapshot of `site`; items that disappeared get a REMOVED event.
+        """
+        from redis.exceptions import WatchError
+
+        snapshot = normalize_snapshot(status_like)
+        ts = float(ts if ts is not None else time.time())
+        k_last, k_strid, k_strings = self._k(site, "last"), self._k(site, "strid"), self._k(site, "strings")
+        k_ts = self._k(site, "ts")
+
+        for _ in range(5):
+            with self.r.pipeline() as pipe:
+                try:
+                    pipe.watch(k_last, k_strid, k_ts)
+                    # keep the ts column sorted even if snapshots arrive out of order
+                    tail = pipe.getrange(k_ts, -8, -1)
+                    if tail:
+                        ts = max(ts, array("d", tail)[0])
+                    last = {k.decode(): v.decode() for k, v in pipe.hgetall(k_last).items()}
+                    strid = {k.decode(): int(v) for k, v in pipe.hgetall(k_strid).items()}
+                    next_id = pipe.llen(k_strings) + 1
+                    new_strings: List[str] = []
+
+                    def sid(s: Optional[str]) -> int:
+                        nonlocal next_id
+                        if s is None:
+                            return 0
+                        if s not in strid:
+                            strid[s] = next_id
+                            new_strings.append(s)
+                            next_id += 1
+                        return strid[s]
+
+                    cols = {name: array(code) for name, code in _COLUMNS}
+                    new_last: Dict[str, str] = {}
+                    removed: List[str] = []
+                    for item, (installed, latest, flags) in sorted(snapshot.items()):
+                        enc = f"{sid(installed)},{sid(latest)},{flags}"
+                        if item in last and last[item].split(",")[:3] == enc.split(","):
+                            continue
+                        iid, lid, fl = (int(x) for x in enc.split(","))
+                        for name, v in (("ts", ts), ("item", sid(item)), ("installed", iid), ("latest", lid), ("flags", fl)):
+                            cols[name].append(v)
+                        new_last[item] = f"{enc},{ts!r}"
+                    for item in sorted(set(last) - set(snapshot)):
+                        for name, v in (("ts", ts), ("item", sid(item)), ("installed", 0), ("latest", 0), ("flags", FLAG_REMOVED)):
+                            cols[name].append(v)
+                        removed.append(item)
+
+                    pipe.multi()
+                    if new_strings:
+                        pipe.rpush(k_strings, *new_strings)
+                        pipe.hset(k_strid, mapping={s: strid[s] for s in new_strings})
+                    if cols["ts"]:
+                        for name, _code in _COLUMNS:
+                            pipe.append(self._k(site, name), cols[name].tobytes())
+                    if new_last:
+                        pipe.hset(k_last, mapping=new_last)
+                    if removed:
+                        pipe.hdel(k_last, *removed)
+                    pipe.sadd(f"{PREFIX}:sites", site)
+                    pipe.execute()
+                    return {"site": site, "ts": ts, "items": len(snapshot), "changes": len(cols["ts"])}
+                except WatchError:
+                    continue
+        raise RuntimeError(f"history ingest for {site} kept conflicting; giving up")
+
+    # ---- queries ----
+    def _strings(self, site: str) -> List[Optional[str]]:
+        return [None] + [s.decode() for s in self.r.lrange(self._k(site, "strings"), 0, -1)]
+
+    def _bounds(self, site: str, since: Optional[float], until: Optional[float]) -> Tuple[int, int]:
+        ts = array("d", self.r.get(self._k(site, "ts")) or b"")
+        lo = bisect_left(ts, since) if since is not None else 0
+        hi = bisect_right(ts, until) if until is not None else len(ts)
+        return lo, hi
+
+    def _slice(self, site: str, name: str, code: str, lo: int, hi: int) -> array:
+        size = array(code).itemsize
+        raw = self.r.getrange(self._k(site, name), lo * size, hi * size - 1) if hi > lo else b""
+        return array(code, raw)
+
+    def events(self, site: str, since: Optional[float] = None, until: Optional[float] = None,
+               item: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Change events for `site` in [since, until], optionally for one item
+        ("plugin:akismet", "theme:astra", "core"). Time bounds are a binary
+        search on the ts column; only the matching slice of each column is read.
+        """
+        lo, hi = self._bounds(site, since, until)
+        if hi <= lo:
+            return []
+        want = None
+        if item is not None:
+            raw = self.r.hget(self._k(site, "strid"), item)
+            if raw is None:
+                return []
+            want = int(raw)
+        cols = {name: self._slice(site, name, code, lo, hi) for name, code in _COLUMNS}
+        strings = self._strings(site)
+        out: List[Dict[str, Any]] = []
+        for i in range(hi - lo):
+            if want is not None and cols["item"][i] != want:
+                continue
+            fl = cols["flags"][i]
+            out.append({
+                "ts": cols["ts"][i],
+                "item": strings[cols["item"][i]],
+                "installed": strings[cols["installed"][i]],
+                "latest": strings[cols["latest"][i]],
+                "update_available": bool(fl & FLAG_UPDATE),
+                "active": bool(fl & FLAG_ACTIVE) if fl & FLAG_ACTIVE_KNOWN else None,
+                "removed": bool(fl & FLAG_REMOVED),
+            })
+        return out
+
+    def _current(self, site: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Latest state straight from `last`; None if a record predates `since`."""
+        last = self.r.hgetall(self._k(site, "last"))
+        strings = self._strings(site) if last else [None]
+        state: Dict[str, Dict[str, Any]] = {}
+        for item, enc in last.items():
+            parts = enc.decode().split(",")
+            if len(parts) < 4:
+                return None
+            fl = int(parts[2])
+            state[item.decode()] = {
+                "installed": strings[int(parts[0])],
+                "latest": strings[int(parts[1])],
+                "update_available": bool(fl & FLAG_UPDATE),
+                "active": bool(fl & FLAG_ACTIVE) if fl & FLAG_ACTIVE_KNOWN else None,
+                "since": float(parts[3]),
+            }
+        return state
+
+    def state_at(self, site: str, ts: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-item state of a site at `ts`. The latest state (ts omitted) is read
+        from `last`; only historical points replay the event columns.
+        """
+        if ts is None:
+            current = self._current(site)
+            if current is not None:
+                return current
+        state: Dict[str, Dict[str, Any]] = {}
+        for ev in self.events(site, until=ts):
+            if ev["removed"]:
+                state.pop(ev["item"], None)
+            else:
+                state[ev["item"]] = {k: ev[k] for k in ("installed", "latest", "update_available", "active")}
+                state[ev["item"]]["since"] = ev["ts"]
+        return state
+
+    def behind_since(self, site: str, item: str) -> Optional[float]:
+        """
+        Timestamp from which `item` has been continuously flagged as outdated,
+        or None if it is currently up to date / unknown.
+        """
+        since = None
+        for ev in self.events(site, item=item):
+            if ev["update_available"] and not ev["removed"]:
+                since = since if since is not None else ev["ts"]
+            else:
+                since = None
+        return since
+
+    def sites(self) -> List[str]:
+        return sorted(s.decode() for s in self.r.smembers(f"{PREFIX}:sites"))
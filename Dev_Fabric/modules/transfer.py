@@ -0,0 +1,417 @@
+# modules/transfer.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional, Callable, List
+
+# SFTP transfer engine used for backup downloads.
+#  - Reads are pipelined: each worker issues all SFTP read requests for an
+#    8 MiB unit at once (readv) instead of one request per round trip.
+#  - Channels get a large window so the server never stalls waiting for acks.
+#  - Large files are split into units pulled by `parallel` workers, each with
+#    its own SFTP channel; give `connect` to use separate TCP connections too.
+#  - Progress is kept in "<local>.part" + "<local>.part.json" (remote size,
+#    mtime and finished units), so an interrupted download resumes.
+#  - The sha256 (and a gzip CRC check for .gz files) is computed from the
+#    received bytes in file order, so verifying costs no second read. A
+#    digest thread does it, fed through a short queue, so hashing/inflating
+#    one unit never holds up the workers fetching the next ones.
+
+UNIT = 8 * 1024 * 1024
+WINDOW_SIZE = 64 * 1024 * 1024
+MAX_PACKET_SIZE = 256 * 1024
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024     # below this a single stream is already fast enough
+
+
+def open_sftp(transport, window_size: int = WINDOW_SIZE, max_packet_size: int = MAX_PACKET_SIZE):
+    import paramiko
+    return paramiko.SFTPClient.from_transport(transport, window_size=window_size,
+                                              max_packet_size=max_packet_size)
+
+
+def _transport(conn):
+    """Fabric Connection / paramiko SSHClient / Transport -> Transport."""
+    if hasattr(conn, "open") and hasattr(conn, "client"):      # fabric.Connection
+        conn.open()
+        return conn.client.get_transport()
+    if hasattr(conn, "get_transport"):                           # paramiko.SSHClient
+        return conn.get_transport()
+    return conn
+
+
+class GzipCheck:
+    """Inflates a gzip stream incrementally (output discarded) so CRC/length trailers get verified."""
+
+    def __init__(self):
+        self._d = zlib.decompressobj(31)
+        self._open = False          # inside a member that has not reached its trailer
+        self.members = 0
+        self.error: Optional[str] = None
+
+    def feed(self, data: bytes):
+        if self.error:
+            return
+        try:
+            while data:
+                self._open = True
+                self._d.decompress(data, 1 << 20)
+                while self._d.unconsumed_tail:
+                    self._d.decompress(self._d.unconsumed_tail, 1 << 20)
+                data = b""
+                if self._d.eof:                      # trailer checked; another member may follow
+                    self.members += 1
+                    self._open = False
+                    data = self._d.unused_data
+                    self._d = zlib.decompressobj(31)
+        except zlib.error as e:
+            self.error = str(e)
+
+    def result(self) -> Dict[str, Any]:
+        error = self.error or ("truncated gzip stream" if self._open or not self.members else None)
+        return {"ok": error is None, "members": self.members, "error": error}
+
+
+class _OrderedDigest:
+    """
+    sha256 (+ optional gzip check) fed in file order while parallel workers finish
+    units out of order. Early units are held in memory up to `max_buffer`; past
+    that (and for units finished by an earlier, resumed run) they are read back
+    from the file, which is still in the page cache.
+    """
+
+    def __init__(self, fd: int, size: int, gzip_check: bool, max_buffer: int = 256 * 1024 * 1024):
+        self.fd, self.size = fd, size
+        self.sha256 = hashlib.sha256()
+        self.gzip = GzipCheck() if gzip_check else None
+        self.next = 0
+        self.pending: Dict[int, Optional[bytes]] = {}
+        self.buffered = 0
+        self.max_buffer = max_buffer
+        self.reread = 0
+
+    def _feed(self, data: bytes):
+        self.sha256.update(data)
+        if self.gzip is not None:
+            self.gzip.feed(data)
+
+    def add(self, i: int, data: Optional[bytes]):
+        if i != self.next:
+            if data is not None and self.buffered + len(data) <= self.max_buffer:
+                self.pending[i] = data
+                self.buffered += len(data)
+            else:
+                self.pending[i] = None
+            return
+        self._feed(data if data is not None else self._read(i))
+        self.next += 1
+        while self.next in self.pending:
+            held = self.pending.pop(self.next)
+            if held is None:
+                held = self._read(self.next)
+            else:
+                self.buffered -= len(held)
+            self._feed(held)
+            self.next += 1
+
+    def _read(self, i: int) -> bytes:
+        n = min(UNIT, self.size - i * UNIT)
+        self.reread += n
+        return os.pread(self.fd, n, i * UNIT)
+
+
+def _stats(nbytes: int, started: float, **extra) -> Dict[str, Any]:
+    secs = max(time.monotonic() - started, 1e-6)
+    return {"bytes": nbytes, "seconds": round(secs, 3), "mbps": round(nbytes / secs / 1e6 * 8, 2),
+            "MBps": round(nbytes / secs / 1e6, 2), **extra}
+
+
+# ----------------------------
+# Download
+# ----------------------------
+def _load_sidecar(path: str, size: int, mtime: int) -> set:
+    try:
+        with open(path) as fh:
+            meta = json.load(fh)
+        if meta.get("size") == size and meta.get("mtime") == mtime and meta.get("unit") == UNIT:
+            return set(meta.get("done") or [])
+    except (OSError, ValueError):
+        pass
+    return set()
+
+
+def _save_sidecar(path: str, remote: str, size: int, mtime: int, done: set):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump({"remote": remote, "size": size, "mtime": mtime, "unit": UNIT, "done": sorted(done)}, fh)
+    os.replace(tmp, path)
+
+
+def download(conn, remote: str, local: str, parallel: int = 4, resume: bool = True,
+             connect: Optional[Callable[[], Any]] = None,
+             progress: Optional[Callable[[int, int], None]] = None,
+             gzip_check: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Fetch `remote` into `local`. Returns throughput stats:
+    {bytes, seconds, mbps, MBps, size, resumed_bytes, workers, mode, sha256, gzip?}.
+    The sha256 (and, for .gz files or gzip_check=True, a full inflate that
+    verifies the gzip CRCs) is computed from the bytes as they arrive.
+    `connect` (optional) returns a fresh, unopened connection per extra worker.
+    """
+    started = time.monotonic()
+    main_sftp = open_sftp(_transport(conn))
+    st = main_sftp.stat(remote)
+    size, mtime = int(st.st_size), int(st.st_mtime or 0)
+
+    part, sidecar = local + ".part", local + ".part.json"
+    os.makedirs(os.path.dirname(local) or ".", exist_ok=True)
+    done = _load_sidecar(sidecar, size, mtime) if resume and os.path.exists(part) else set()
+    units = [i for i in range((size + UNIT - 1) // UNIT) if i not in done]
+    resumed = sum(min(UNIT, size - i * UNIT) for i in done)
+
+    fd = os.open(part, os.O_RDWR | os.O_CREAT | (0 if done else os.O_TRUNC), 0o600)
+    os.ftruncate(fd, size)
+    if gzip_check is None:
+        gzip_check = remote.endswith((".gz", ".tgz"))
+    digest = _OrderedDigest(fd, size, gzip_check)
+    for i in sorted(done):
+        digest.add(i, None)
+    workers = 1 if size < PARALLEL_MIN_SIZE else max(1, min(parallel, len(units) or 1))
+    todo: "queue.Queue[int]" = queue.Queue()
+    for i in units:
+        todo.put(i)
+    lock = threading.Lock()
+    moved = [0]
+    errors: List[BaseException] = []
+    extra_conns: List[Any] = []
+    sftps = [main_sftp]
+    # bounded so the workers cannot run more than a few units ahead of the digest
+    received: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=workers + 1)
+
+    def digester():
+        try:
+            while True:
+                item = received.get()
+                if item is None:
+                    return
+                digest.add(*item)
+        except BaseException as e:  # surfaced after join
+            errors.append(e)
+
+    def worker(sftp):
+        try:
+            with sftp.open(remote, "rb") as fh:
+                while not errors:
+                    try:
+                        i = todo.get_nowait()
+                    except queue.Empty:
+                        return
+                    start = i * UNIT
+                    off = start
+                    pieces = []
+                    for data in fh.readv([(start, min(UNIT, size - start))]):
+                        os.pwrite(fd, data, off)
+                        off += len(data)
+                        pieces.append(data)
+                    while True:
+                        try:
+                            received.put((i, b"".join(pieces)), timeout=1)
+                            break
+                        except queue.Full:
+                            if errors:          # the digest thread died; nobody drains the queue
+                                return
+                    with lock:
+                        done.add(i)
+                        moved[0] += off - start
+                        if resume:
+                            _save_sidecar(sidecar, remote, size, mtime, done)
+                        if progress:
+                            progress(resumed + moved[0], size)
+        except BaseException as e:  # surfaced after join
+            errors.append(e)
+
+    try:
+        for _ in range(workers - 1):
+            if connect is not None:
+                c = connect()
+                extra_conns.append(c)
+                sftps.append(open_sftp(_transport(c)))
+            else:
+                sftps.append(open_sftp(_transport(conn)))
+        hasher = threading.Thread(target=digester, name="transfer-digest", daemon=True)
+        hasher.start()
+        threads = [threading.Thread(target=worker, args=(s,), daemon=True) for s in sftps]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        while hasher.is_alive():
+            try:
+                received.put(None, timeout=1)
+                break
+            except queue.Full:
+                pass
+        hasher.join()
+        if errors:
+            raise errors[0]
+        if digest.next * UNIT < size:
+            raise IOError(f"download incomplete: {digest.next * UNIT} of {size} bytes hashed")
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+        for s in sftps[1:]:
+            try: s.close()
+            except Exception: pass
+        for c in extra_conns:
+            try: c.close()
+            except Exception: pass
+        main_sftp.close()
+
+    os.replace(part, local)
+    try:
+        os.remove(sidecar)
+    except OSError:
+        pass
+    stats = _stats(moved[0], started, size=size, resumed_bytes=resumed, workers=workers,
+                   mode="parallel" if workers > 1 else "pipelined", sha256=digest.sha256.hexdigest(),
+                   reread_bytes=digest.reread)
+    if digest.gzip is not None:
+        stats["gzip"] = digest.gzip.result()
+    return stats
+
+
+# ----------------------------
+# Upload
+# ----------------------------
+def upload(conn, local: str, remote: str, resume: bool = True, block: int = 1024 * 1024,
+           progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Pipelined write to "<remote>.part" (appending when resuming), then an
+    atomic rename. Returns the same stats shape as download().
+    """
+    started = time.monotonic()
+    size = os.path.getsize(local)
+    part = remote + ".part"
+    sftp = open_sftp(_transport(conn))
+    try:
+        offset = 0
+        if resume:
+            try:
+                offset = min(int(sftp.stat(part).st_size), size)
+            except IOError:
+                offset = 0
+        sha = hashlib.sha256()
+        with open(local, "rb") as src, sftp.open(part, "ab" if offset else "wb") as dst:
+            dst.set_pipelined(True)
+            # the already-uploaded prefix only needs hashing, not sending
+            remaining = offset
+            while remaining:
+                data = src.read(min(block, remaining))
+                if not data:
+                    break
+                sha.update(data)
+                remaining -= len(data)
+            sent = offset
+            while True:
+                data = src.read(block)
+                if not data:
+                    break
+                sha.update(data)
+                dst.write(data)
+                sent += len(data)
+                if progress:
+                    progress(sent, size)
+        try:
+            sftp.posix_rename(part, remote)
+        except IOError:
+            sftp.rename(part, remote)
+    finally:
+        sftp.close()
+    return _stats(size - offset, started, size=size, resumed_bytes=offset, workers=1, mode="pipelined",
+                  sha256=sha.hexdigest())
+
+
+def stable_local_path(base_dir: str, host: str, remote: str, name: Optional[str] = None) -> str:
+    """Same (host, remote) -> same local path, so a retried download resumes."""
+    key = hashlib.sha1(f"{host}:{remote}".encode()).hexdigest()[:16]
+    return os.path.join(base_dir, key, name or os.path.basename(remote))
+
+
+class PathLock:
+    """
+    Exclusive flock guarding the directory of a stable_local_path() while one
+    request downloads into it and serves it. Works across threads and API
+    worker processes. The lock file sits next to the directory (not inside
+    it) so removing the directory never swaps the inode others wait on.
+    """
+
+    def __init__(self, local_path: str):
+        self.path = os.path.dirname(os.path.abspath(local_path)) + ".lock"
+        self._fd: Optional[int] = None
+
+    def acquire(self, timeout: Optional[float] = None) -> "PathLock":
+        """Block until held; with `timeout`, raise TimeoutError after that many seconds."""
+        import fcntl
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            if timeout is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError(f"{self.path} is held by another download")
+                        time.sleep(0.2)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return self
+
+    def release(self):
+        if self._fd is not None:
+            import fcntl
+            fd, self._fd = self._fd, None
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    # a response whose background task never ran (client gone) must not pin the lock
+    __del__ = release
+
+
+def transfer_headers(stats: Dict[str, Any], expected_sha256: Optional[str] = None) -> Dict[str, str]:
+    headers = {
+        "X-Transfer-Bytes": str(stats["bytes"]),
+        "X-Transfer-Seconds": str(stats["seconds"]),
+        "X-Transfer-Mbps": str(stats["mbps"]),
+        "X-Transfer-Resumed-Bytes": str(stats["resumed_bytes"]),
+        "X-Transfer-Workers": str(stats["workers"]),
+    }
+    if stats.get("sha256"):
+        headers["X-Checksum-SHA256"] = stats["sha256"]
+        headers["X-Checksum-Verified"] = ("unknown" if not expected_sha256
+                                          else str(expected_sha256 == stats["sha256"]).lower())
+    if "gzip" in stats:
+        headers["X-Gzip-Valid"] = str(stats["gzip"]["ok"]).lower()
+    return headers
+
+
+def verify(stats: Dict[str, Any], expected_sha256: Optional[str] = None) -> Optional[str]:
+    """None when the transfer checks out, else why it does not."""
+    if expected_sha256 and stats.get("sha256") != expected_sha256:
+        return f"sha256 mismatch: source {expected_sha256}, received {stats.get('sha256')}"
+    if "gzip" in stats and not stats["gzip"]["ok"]:
+        return f"corrupt gzip stream: {stats['gzip']['error']}"
+    return None
@@ -0,0 +1,235 @@
+# modules/update_waves.py
+from __future__ import annotations
+
+import json
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlparse
+
+# A wave is a plain JSON document (stored in Redis by the caller):
+# {
+#   "id": str, "status": "running"|"paused"|"done", "phase": "canary"|"main",
+#   "limits": {"max_per_host", "max_in_flight", "canary", "failure_threshold", "min_samples"},
+#   "targets": {tid: {"host": ip, "kwargs": {...}}},   kwargs hold a credentials_ref, not auth/headers
+#   "pending": {host: [tid, ...]},  "in_flight": {tid: host},
+#   "canaries": [tid, ...],  "succeeded": [tid, ...],  "failed": [tid, ...],
+#   "task_ids": {tid: celery_id}, "paused_reason": str|None, ...
+# }
+# Everything below is pure state manipulation so it can be unit-reasoned and
+# run under a Redis lock by whichever worker finishes a target.
+
+
+@lru_cache(maxsize=4096)
+def resolve_host(url: str) -> str:
+    """Physical host for a site URL: its first resolved IP, or the hostname if DNS fails."""
+    host = urlparse(url if "://" in url else f"//{url}").hostname or url
+    try:
+        return socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)[0][4][0]
+    except OSError:
+        return host.lower()
+
+
+def plan_wave(targets: List[Dict[str, Any]],
+              max_per_host: int = 1,
+              max_in_flight: int = 20,
+              canary: int = 1,
+              failure_threshold: float = 0.2,
+              min_samples: int = 5,
+              wave_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a wave from update kwargs (each must have `base_url`). DNS lookups
+    run in parallel; targets are grouped per resolved IP so shared droplets
+    are throttled together. Canaries are picked one per host, largest hosts first.
+    """
+    urls = [t["base_url"] for t in targets]
+    with ThreadPoolExecutor(max_workers=min(32, max(1, len(urls)))) as ex:
+        hosts = list(ex.map(resolve_host, urls))
+
+    state: Dict[str, Any] = {
+        "id": wave_id or str(uuid.uuid4()),
+        "status": "running",
+        "phase": "canary" if canary > 0 else "main",
+        "limits": {
+            "max_per_host": max(1, int(max_per_host)),
+            "max_in_flight": max(1, int(max_in_flight)),
+            "canary": max(0, int(canary)),
+            "failure_threshold": float(failure_threshold),
+            "min_samples": max(1, int(min_samples)),
+        },
+        "targets": {}, "pending": {}, "in_flight": {},
+        "canaries": [], "succeeded": [], "failed": [], "task_ids": {},
+        "paused_reason": None,
+        "baseline": {"succeeded": 0, "failed": 0},   # outcomes before the last resume
+        "created_at": time.time(), "updated_at": time.time(),
+    }
+    for i, (kw, host) in enumerate(zip(targets, hosts)):
+        tid = f"t{i}"
+        state["targets"][tid] = {"host": host, "kwargs": kw}
+        state["pending"].setdefault(host, []).append(tid)
+
+    by_size = sorted(state["pending"], key=lambda h: -len(state["pending"][h]))
+    state["canaries"] = [state["pending"][h][0] for h in by_size[:state["limits"]["canary"]]]
+    if not state["canaries"]:
+        state["phase"] = "main"
+    return state
+
+
+def next_batch(state: Dict[str, Any]) -> List[str]:
+    """
+    Pick targets to start now and move them to in_flight. Honors the global
+    cap, the per-host cap, the canary phase, and the paused/done status.
+    Hosts are served round-robin so one big droplet can't starve the rest.
+    """
+    if state["status"] != "running":
+        return []
+    lim = state["limits"]
+    per_host: Dict[str, int] = {}
+    for host in state["in_flight"].values():
+        per_host[host] = per_host.get(host, 0) + 1
+    room = lim["max_in_flight"] - len(state["in_flight"])
+    picked: List[str] = []
+
+    if state["phase"] == "canary":
+        for tid in state["canaries"]:
+            if room <= 0:
+                break
+            host = state["targets"][tid]["host"]
+            queue = state["pending"].get(host) or []
+            if tid in queue and per_host.get(host, 0) < lim["max_per_host"]:
+                queue.remove(tid)
+                picked.append(tid)
+                per_host[host] = per_host.get(host, 0) + 1
+                room -= 1
+    else:
+        progressed = True
+        while room > 0 and progressed:
+            progressed = False
+            for host, queue in state["pending"].items():
+                if room <= 0:
+                    break
+                if queue and per_host.get(host, 0) < lim["max_per_host"]:
+                    tid = queue.pop(0)
+                    picked.append(tid)
+                    per_host[host] = per_host.get(host, 0) + 1
+                    room -= 1
+                    progressed = True
+
+    for tid in picked:
+        state["in_flight"][tid] = state["targets"][tid]["host"]
+    state["pending"] = {h: q for h, q in state["pending"].items() if q}
+    state["updated_at"] = time.time()
+    return picked
+
+
+def unpick(state: Dict[str, Any], tids: List[str]) -> None:
+    """Undo next_batch() for targets that were never sent: back to the front of their host queue."""
+    for tid in reversed(tids):
+        host = state["in_flight"].pop(tid, None)
+        if host is not None:
+            state["pending"].setdefault(host, []).insert(0, tid)
+    state["updated_at"] = time.time()
+
+
+def credential_refs(state: Dict[str, Any]) -> List[str]:
+    return sorted({t["kwargs"]["credentials_ref"] for t in state["targets"].values()
+                   if t["kwargs"].get("credentials_ref")})
+
+
+def record_outcome(state: Dict[str, Any], tid: str, ok: bool, error: Optional[str] = None) -> None:
+    """
+    Book a finished target and re-evaluate the wave: finish the canary phase,
+    pause on a failure rate above threshold, or mark the wave done.
+    """
+    if tid not in state["in_flight"]:
+        return  # duplicate callback
+    state["in_flight"].pop(tid)
+    (state["succeeded"] if ok else state["failed"]).append(tid)
+    if error:
+        state["targets"][tid]["error"] = error[:500]
+    lim = state["limits"]
+
+    if state["phase"] == "canary":
+        done = [t for t in state["canaries"] if t in state["succeeded"] or t in state["failed"]]
+        failed = [t for t in state["canaries"] if t in state["failed"]]
+        if failed:
+            state["status"] = "paused"
+            state["paused_reason"] = f"canary failed: {', '.join(failed)}"
+        elif len(done) == len(state["canaries"]):
+            state["phase"] = "main"
+    else:
+        failed = len(state["failed"]) - state["baseline"]["failed"]
+        finished = len(state["succeeded"]) - state["baseline"]["succeeded"] + failed
+        rate = failed / finished if finished else 0.0
+        if finished >= lim["min_samples"] and rate > lim["failure_threshold"]:
+            state["status"] = "paused"
+            state["paused_reason"] = f"failure rate {rate:.0%} > {lim['failure_threshold']:.0%}"
+
+    if not state["pending"] and not state["in_flight"] and state["status"] == "running":
+        state["status"] = "done"
+    state["updated_at"] = time.time()
+
+
+def pause(state: Dict[str, Any], reason: str = "paused by operator") -> None:
+    """Stop starting new targets; in-flight ones finish and are still recorded."""
+    if state["status"] == "running":
+        state["status"] = "paused"
+        state["paused_reason"] = reason
+        state["updated_at"] = time.time()
+
+
+def resume(state: Dict[str, Any]) -> None:
+    """
+    Continue a paused wave. A failed canary phase is considered acknowledged,
+    and the failure-rate window restarts from here.
+    """
+    if state["status"] != "paused":
+        return
+    state["status"] = "running" if (state["pending"] or state["in_flight"]) else "done"
+    state["paused_reason"] = None
+    state["phase"] = "main"
+    state["baseline"] = {"succeeded": len(state["succeeded"]), "failed": len(state["failed"])}
+    state["updated_at"] = time.time()
+
+
+def summary(state: Dict[str, Any]) -> Dict[str, Any]:
+    hosts: Dict[str, Dict[str, int]] = {}
+    for tid, t in state["targets"].items():
+        h = hosts.setdefault(t["host"], {"targets": 0, "in_flight": 0})
+        h["targets"] += 1
+        h["in_flight"] += int(tid in state["in_flight"])
+    return {
+        "wave_id": state["id"], "status": state["status"], "phase": state["phase"],
+        "paused_reason": state["paused_reason"], "limits": state["limits"],
+        "total": len(state["targets"]),
+        "pending": sum(len(q) for q in state["pending"].values()),
+        "in_flight": len(state["in_flight"]),
+        "succeeded": len(state["succeeded"]), "failed": len(state["failed"]),
+        "hosts": hosts,
+        "targets": {tid: {"url": t["kwargs"].get("base_url"), "host": t["host"],
+                          "task_id": state["task_ids"].get(tid), "error": t.get("error")}
+                    for tid, t in state["targets"].items()},
+    }
+
+
+# ----------------------------
+# Redis persistence
+# ----------------------------
+def _key(wave_id: str) -> str:
+    return f"wave:{wave_id}"
+
+
+def load(r, wave_id: str) -> Optional[Dict[str, Any]]:
+    raw = r.get(_key(wave_id))
+    return json.loads(raw) if raw else None
+
+
+def save(r, state: Dict[str, Any], ttl: int = 7 * 86400) -> None:
+    r.set(_key(state["id"]), json.dumps(state), ex=ttl)
+
+
+def lock(r, wave_id: str):
+    return r.lock(f"{_key(wave_id)}:lock", timeout=60, blocking_timeout=30)
@@ -0,0 +1,208 @@
+# modules/wp_status.py
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+# One parsed view of a /wp-json/custom/v1/status body, built in a single pass
+# and shared by the updater, the Celery tasks, status history / fleet index
+# and the outdated fetcher. Both schemas are understood:
+#   new:    {"core": {"installed", "updates": [...]}, "plugins": {"list": [...]}, "themes": {"list": [...]}}
+#   legacy: {"core": {"current_version", ...}, "plugins": [...], "themes": [...], "php_mysql": {...}}
+# Wrapped bodies ({"raw": ...}, {"result": {...}}) and JSON strings are accepted.
+# Plugin lookups by plugin_file, slug, name or directory are dict hits.
+# WPStatus.of(x) returns x itself when it is already parsed, so a snapshot is
+# parsed once however many consumers it is handed to.
+
+
+def coerce_status_dict(status_like: Any) -> Dict[str, Any]:
+    """
+    Accept anything and return a dict that looks like the /status JSON body.
+    Handles:
+      - dict already at status shape
+      - dicts wrapped like {"result": {...}} or {"raw": {...}}
+      - string JSON bodies
+    Falls back to {}.
+    """
+    if isinstance(status_like, WPStatus):
+        return status_like.raw
+    if isinstance(status_like, dict):
+        if "plugins" in status_like and "themes" in status_like:
+            return status_like
+        if "raw" in status_like and isinstance(status_like["raw"], dict):
+            return status_like["raw"]
+        if "result" in status_like and isinstance(status_like["result"], dict):
+            inner = status_like["result"]
+            if "raw" in inner and isinstance(inner["raw"], dict):
+                return inner["raw"]
+            if "plugins" in inner and "themes" in inner:
+                return inner
+        return status_like
+    if isinstance(status_like, str):
+        try:
+            return coerce_status_dict(json.loads(status_like.strip()))
+        except Exception:
+            return {}
+    return {}
+
+
+def _rows(obj: Any) -> List[Dict[str, Any]]:
+    rows = (obj.get("list") or []) if isinstance(obj, dict) else (obj if isinstance(obj, list) else [])
+    return [r for r in rows if isinstance(r, dict)]
+
+
+def _has_update(flag: Any, current: Any, latest: Any) -> bool:
+    if flag is None and current is not None and latest is not None:
+        return str(current) != str(latest)
+    return bool(flag)
+
+
+class PluginInfo:
+    __slots__ = ("plugin_file", "slug", "name", "version", "latest_version", "update_available", "active")
+
+    def __init__(self, row: Dict[str, Any]):
+        pf = (row.get("plugin_file") or row.get("file") or "").strip()
+        self.plugin_file = pf
+        self.slug = (row.get("slug") or (pf.split("/", 1)[0] if pf else "")).strip()
+        self.name = (row.get("name") or self.slug or pf).strip()
+        self.version = row.get("version") or row.get("installed")
+        self.latest_version = row.get("latest_version") or row.get("available")
+        flag = row.get("update_available")
+        self.update_available = _has_update(row.get("has_update") if flag is None else flag,
+                                            self.version, self.latest_version)
+        self.active = row.get("active")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class ThemeInfo:
+    __slots__ = ("slug", "name", "version", "latest_version", "update_available", "active")
+
+    def __init__(self, row: Dict[str, Any]):
+        self.slug = (row.get("stylesheet") or row.get("slug") or row.get("name") or "").strip()
+        self.name = (row.get("name") or self.slug).strip()
+        self.version = row.get("installed") or row.get("version")
+        self.latest_version = row.get("available") or row.get("latest_version")
+        flag = row.get("has_update", row.get("update_available"))
+        self.update_available = _has_update(flag, self.version, self.latest_version)
+        self.active = row.get("active")
+
+
+class CoreInfo:
+    __slots__ = ("version", "latest_version", "update_available")
+
+    def __init__(self, core: Dict[str, Any]):
+        self.version = core.get("installed") or core.get("current_version")
+        updates = [u for u in (core.get("updates") or []) if isinstance(u, dict)] \
+            if isinstance(core.get("updates"), list) else []
+        self.latest_version = core.get("latest_version") or (updates[0].get("version") if updates else None)
+        flag = core.get("update_available")
+        if flag is None and any((u.get("response") or "").lower() == "upgrade" and u.get("version") for u in updates):
+            flag = True
+        self.update_available = _has_update(flag, self.version, self.latest_version)
+
+
+class WPStatus:
+    __slots__ = ("raw", "schema", "plugins", "themes", "core", "php_version", "mysql_version",
+                 "by_file", "by_slug", "by_name", "by_dir")
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        plugins_obj = raw.get("plugins")
+        self.schema = "new" if isinstance(plugins_obj, dict) else ("legacy" if isinstance(plugins_obj, list) else "unknown")
+        self.plugins = [PluginInfo(r) for r in _rows(plugins_obj)]
+        self.themes = [ThemeInfo(r) for r in _rows(raw.get("themes"))]
+        core = raw.get("core")
+        self.core = CoreInfo(core) if isinstance(core, dict) and core else None
+        env = raw.get("php_mysql") if isinstance(raw.get("php_mysql"), dict) else {}
+        self.php_version = env.get("php_version")
+        self.mysql_version = env.get("mysql_version")
+
+        self.by_file: Dict[str, PluginInfo] = {}
+        self.by_slug: Dict[str, PluginInfo] = {}
+        self.by_name: Dict[str, PluginInfo] = {}
+        self.by_dir: Dict[str, PluginInfo] = {}
+        for p in self.plugins:
+            if not p.plugin_file:
+                continue
+            self.by_file[p.plugin_file] = p
+            if p.slug:
+                self.by_slug[p.slug.lower()] = p
+            if p.name:
+                self.by_name[p.name.lower()] = p
+            self.by_dir.setdefault(p.plugin_file.split("/", 1)[0], p)
+
+    @classmethod
+    def of(cls, status_like: Any) -> "WPStatus":
+        if isinstance(status_like, cls):
+            return status_like
+        return cls(coerce_status_dict(status_like))
+
+    # ---- plugins ----
+    def plugin(self, token: str) -> Optional[PluginInfo]:
+        """plugin_file, slug, name (case-insensitive) or plugin directory -> plugin."""
+        token = (token or "").strip()
+        if not token:
+            return None
+        hit = self.by_file.get(token)
+        if hit:
+            return hit
+        key = token.lower()
+        return self.by_slug.get(key) or self.by_name.get(key) or (self.by_dir.get(key) if "/" not in key else None)
+
+    def resolve(self, tokens: Iterable[str]) -> List[str]:
+        """
+        Selection given as names, slugs or plugin files -> plugin_file list.
+        Explicit "dir/file.php" tokens and unknown tokens are kept as given.
+        """
+        out: List[str] = []
+        for t in tokens or []:
+            token = str(t or "").strip()
+            if not token:
+                continue
+            if token.endswith(".php") and "/" in token:
+                out.append(token)
+                continue
+            hit = self.plugin(token)
+            out.append(hit.plugin_file if hit else token)
+        return out
+
+    def outdated_plugins(self, blocklist: Optional[Iterable[str]] = None) -> List[str]:
+        block = set(blocklist or [])
+        return [p.plugin_file for p in self.plugins
+                if p.update_available and p.plugin_file and p.plugin_file not in block]
+
+    def versions_map(self) -> Dict[str, Dict[str, Optional[str]]]:
+        """plugin_file -> {current, latest}"""
+        return {p.plugin_file: {"current": p.version, "latest": p.latest_version}
+                for p in self.plugins if p.plugin_file}
+
+    def plugin_rows(self) -> List[Dict[str, Any]]:
+        return [p.as_dict() for p in self.plugins]
+
+    # ---- summaries ----
+    def core_view(self) -> Dict[str, Any]:
+        c = self.core
+        if c is None:
+            return {"current": None, "latest": None, "update_available": False}
+        return {"current": c.version, "latest": c.latest_version or c.version,
+                "update_available": c.update_available}
+
+    def outdated_summary(self) -> Dict[str, Any]:
+        """The `summary` block of fetch_outdated()."""
+        core = self.core_view()
+
+        def item(x):
+            return {"name": x.name, "active": None if x.active is None else bool(x.active),
+                    "current": x.version, "latest": x.latest_version}
+
+        return {
+            "plugins_outdated": [item(p) for p in self.plugins if p.update_available],
+            "themes_outdated": [item(t) for t in self.themes if t.update_available],
+            "core_update_available": bool(core["update_available"]),
+            "core_current": core["current"],
+            "core_latest": core["latest"],
+            "php_version": self.php_version,
+            "mysql_version": self.mysql_version,
+        }
@@ -5,6 +5,8 @@ import requests
 import json
 import time
 
+from modules.wp_status import WPStatus, coerce_status_dict
+
 # ---------- URL helpers ----------
 
 def _urls(base_url: str) -> Dict[str, str]:
@@ -28,89 +30,17 @@ def _auth_or_headers(
     return kw
 
 # ---------- Schema coercion & plugin list helpers ----------
+# Parsing lives in modules/wp_status.py (WPStatus); these keep the old call sites working.
 
 def _coerce_status_dict(status_like: Any) -> Dict[str, Any]:
-    """
-    Accept anything and return a dict that looks like the /status JSON body.
-    Handles:
-      - dict already at status shape
-      - dicts wrapped like {"result": {...}} or {"raw": {...}}
-      - string JSON bodies
-    Falls back to {}.
-    """
-    if isinstance(status_like, dict):
-        # Already status-like?
-        if "plugins" in status_like and "themes" in status_like:
-            return status_like
-        # Common wrappers
-        if "raw" in status_like and isinstance(status_like["raw"], dict):
-            return status_like["raw"]
-        if "result" in status_like and isinstance(status_like["result"], dict):
-            inner = status_like["result"]
-            if "raw" in inner and isinstance(inner["raw"], dict):
-                return inner["raw"]
-            if "plugins" in inner and "themes" in inner:
-                return inner
-        return status_like
-
-    if isinstance(status_like, str):
-        try:
-            parsed = json.loads(status_like.strip())
-            return _coerce_status_dict(parsed)
-        except Exception:
-            return {}
-
-    return {}
+    return coerce_status_dict(status_like)
 
-def _plugins_list_from_status(status_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _plugins_list_from_status(status_json: Any) -> List[Dict[str, Any]]:
     """
-    Returns a list of plugin dicts with unified keys:
-      - plugin_file
-      - slug
-      - name
-      - version
-      - latest_version
-      - update_available (bool)
-    Works for both legacy and new schema. Filters out non-dict rows.
+    Plugin dicts with unified keys (plugin_file, slug, name, version,
+    latest_version, update_available, active) for either schema.
     """
-    status_json = _coerce_status_dict(status_json)
-    plugins_obj = (status_json or {}).get("plugins")
-
-    # Extract raw rows
-    if isinstance(plugins_obj, dict):
-        rows = plugins_obj.get("list") or []
-    elif isinstance(plugins_obj, list):
-        rows = plugins_obj
-    else:
-        rows = []
-
-    unified: List[Dict[str, Any]] = []
-    for row in rows:
-        if not isinstance(row, dict):
-            continue
-        plugin_file = row.get("plugin_file") or row.get("file") or ""
-        slug = row.get("slug") or (plugin_file.split("/")[0] if plugin_file else "")
-        name = row.get("name") or slug or plugin_file
-
-        # Map version fields
-        current = row.get("version") or row.get("installed")
-        latest  = row.get("latest_version") or row.get("available")
-        has_up  = row.get("update_available")
-        if has_up is None and (current is not None and latest is not None):
-            try:
-                has_up = str(current) != str(latest)
-            except Exception:
-                has_up = False
-
-        unified.append({
-            "plugin_file": plugin_file,
-            "slug": slug,
-            "name": name,
-            "version": current,
-            "latest_version": latest,
-            "update_available": bool(has_up),
-        })
-    return unified
+    return WPStatus.of(status_json).plugin_rows()
 
 # ---------- Status  selection ----------
 
@@ -135,36 +65,20 @@ def fetch_status(
             return {"_non_json": True, "url": u, "status_code": r.status_code, "body_preview": text[:1000]}
 
 def select_outdated_plugins(
-    status_json: Dict[str, Any],
+    status_json: Any,
     blocklist: Optional[List[str]] = None
 ) -> List[str]:
     """
     Return plugin_file entries that have update_available=True, minus any blocklisted items.
+    Accepts a parsed WPStatus as well as raw/wrapped status bodies.
     """
-    block = set((blocklist or []))
-    result: List[str] = []
-    for p in _plugins_list_from_status(_coerce_status_dict(status_json)):
-        if p.get("update_available"):
-            plugin_file = p.get("plugin_file")
-            if plugin_file and plugin_file not in block:
-                result.append(plugin_file)
-    return result
+    return WPStatus.of(status_json).outdated_plugins(blocklist)
 
 # ---------- Introspection helpers ----------
 
 def _plugin_versions_map(status_like: Any) -> Dict[str, Dict[str, Optional[str]]]:
-    """
-    Map plugin_file -> {current, latest}
-    Schema-agnostic: uses _plugins_list_from_status so it works with both legacy list
-    and new {"plugins":{"list":[...]}} shapes; also accepts JSON strings/wrappers.
-    """
-    status = _coerce_status_dict(status_like)
-    out: Dict[str, Dict[str, Optional[str]]] = {}
-    for p in _plugins_list_from_status(status):
-        pf = p.get("plugin_file")
-        if pf:
-            out[pf] = {"current": p.get("version"), "latest": p.get("latest_version")}
-    return out
+    """Map plugin_file -> {current, latest} (either schema, wrappers, JSON strings)."""
+    return WPStatus.of(status_like).versions_map()
 
 def _looks_updated(before: Dict[str, Dict[str, Optional[str]]],
                    after: Dict[str, Dict[str, Optional[str]]],
@@ -0,0 +1,11 @@
+from functools import lru_cache
+from config import settings
+
+@lru_cache(maxsize=2)
+def get_redis(binary: bool = False):
+    """
+    Shared Redis client (one connection pool per process).
+    binary=True returns raw bytes instead of decoded strings.
+    """
+    import redis
+    return redis.Redis.from_url(str(settings.REDIS_URL), decode_responses=not binary)
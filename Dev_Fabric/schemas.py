@@ -13,6 +13,10 @@ class SiteConfig(BaseModel):
     db_user: str
     db_pass: str
     port: Optional[int] = 22
+    # Site lock key: set the same site_id (or a domain matching base_url) here and
+    # on wp-update requests so SSH and REST work on one site queue together.
+    site_id: Optional[str] = None
+    domain: Optional[str] = None
 
 class SSLCheckRequest(BaseModel):
     domain: str
@@ -22,6 +26,12 @@ class HealthcheckRequest(BaseModel):
     keyword: Optional[str] = None
     screenshot: bool = False
     out_path: Optional[str] = "/tmp/site.png"
+    scan: bool = False                      # indicator/link scan + suspicious path probes
+    allowed_domains: Optional[List[str]] = None
+
+class HealthcheckBatchRequest(BaseModel):
+    targets: List[HealthcheckRequest]     # screenshot/out_path are ignored in batch mode
+    concurrency: int = 100
 
 class WPStatusResponse(BaseModel):
     core: List[dict] = Field(default_factory=list)
@@ -98,6 +108,7 @@ class WPUpdatePluginsRequest(BaseModel):
     headers: Optional[Dict[str, str]] = None
     auth: Optional[BasicAuth] = None
     report_email: Optional[str] = None
+    site_id: Optional[str] = None        # lock key shared with SiteConfig.site_id
 
 class WPUpdateCoreRequest(BaseModel):
     base_url: str
@@ -105,6 +116,7 @@ class WPUpdateCoreRequest(BaseModel):
     headers: Optional[Dict[str, str]] = None
     auth: Optional[BasicAuth] = None
     report_email: Optional[str] = None
+    site_id: Optional[str] = None        # lock key shared with SiteConfig.site_id
 
 class WPUpdateAllRequest(BaseModel):
     base_url: str
@@ -116,6 +128,7 @@ class WPUpdateAllRequest(BaseModel):
     headers: Optional[Dict[str, str]] = None
     auth: Optional[BasicAuth] = None       # reuse BasicAuth from earlier, or define it if not present
     report_email: Optional[str] = None
+    site_id: Optional[str] = None        # lock key shared with SiteConfig.site_id
 
 class BackupDbRequest(BaseModel):
     out_dir: Optional[str] = "/tmp/backups"
@@ -127,4 +140,65 @@ class BackupContentRequest(BaseModel):
     out_dir: Optional[str] = "/tmp/backups"
     download: bool = False
     filename: Optional[str] = None
-    wait_timeout: int = 600
\ No newline at end of file
+    wait_timeout: int = 600
+class WPUpdateWaveRequest(BaseModel):
+    targets: List[WPUpdateAllRequest]
+    max_per_host: int = 1                  # concurrent updates per resolved host/IP
+    max_in_flight: int = 20                # global cap across the wave
+    canary: int = 1                        # targets (one per host) updated first; wave waits for them
+    failure_threshold: float = 0.2         # pause when failed/finished exceeds this…
+    min_samples: int = 5                   # …after at least this many finished targets
+
+class WaveEnqueueResponse(BaseModel):
+    wave_id: str
+    task_id: str
+    status: str = "queued"
+
+class MonitorSiteRequest(BaseModel):
+    url: str                               # site root, e.g. https://example.com
+    domain: Optional[str] = None           # defaults to the URL host
+    keyword: Optional[str] = None          # healthcheck keyword
+    headers: Optional[Dict[str, str]] = None
+    basic_auth: Optional[str] = None       # "user:pass" for the status route
+    checks: List[str] = Field(default_factory=lambda: ["healthcheck", "outdated", "domain_ssl"])
+
+class VisualRegressionRequest(BaseModel):
+    urls: List[str] = Field(default_factory=list)   # empty = every monitored site
+    set_baseline: bool = False                       # accept these captures as the new baseline
+    threshold: Optional[int] = None                  # whole-page bits; defaults to VISUAL_DIFF_THRESHOLD
+    region_threshold: Optional[int] = None
+
+class ContentScanRequest(BaseModel):
+    urls: List[str] = Field(default_factory=list)   # empty = every monitored site
+    allowed_domains: Optional[List[str]] = None      # extra domains links may point to
+    concurrency: int = 20
+
+class IntegrityScanRequest(BaseModel):
+    full: bool = False                     # drop the remote hash cache and rehash everything
+    verify_checksums: bool = True          # wp core/plugin verify-checksums for changed parts
+    excludes: Optional[List[str]] = None   # extra docroot-relative prefixes to skip
+    max_items: int = 200                   # cap on listed paths per category
+
+class RepoBackupRequest(BaseModel):
+    kind: str = "site"                     # "db", "content" or "site" (both)
+    name: Optional[str] = None             # catalog site name; default "<host>:<wp_path>"
+
+class RepoPruneRequest(BaseModel):
+    keep_last: Optional[int] = None        # None -> BACKUP_KEEP_* settings
+    keep_daily: Optional[int] = None
+    keep_weekly: Optional[int] = None
+    keep_monthly: Optional[int] = None
+    site: Optional[str] = None             # limit to one site
+    dry_run: bool = False
+    full_gc: bool = False                  # also sweep chunk files the catalog does not know
+
+class IncrementalDbBackupRequest(BaseModel):
+    out_dir: Optional[str] = "/tmp/backups"
+    full_every_hours: float = 24           # new base dump after this; binlog segments in between
+    force_full: bool = False
+    keep_chains: int = 2                   # base + segments sets kept on the host
+
+class PITRRestoreRequest(BaseModel):
+    target: str                            # "YYYY-MM-DD HH:MM:SS", server local time
+    out_dir: Optional[str] = "/tmp/backups"
+    dry_run: bool = False                  # only report which base/binlogs would be used
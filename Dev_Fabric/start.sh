@@ -1,4 +1,17 @@
 #!/bin/bash
+# ROLE=api|worker|beat runs one process per container (scale API pods without
+# booting a worker + beat in each); ROLE=all (default) keeps the single-container mode.
+# Workers read the priority lanes in order; WORKER_QUEUES=interactive gives a
+# worker that only ever serves operator-triggered tasks.
+ROLE="${ROLE:-all}"
+QUEUES="${WORKER_QUEUES:-interactive,scheduled,background}"
+case "$ROLE" in
+  api)    exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-8001}" ;;
+  worker) exec celery -A celery_app worker --loglevel=info -Q "$QUEUES" ;;
+  beat)   exec celery -A celery_app beat --loglevel=info --schedule /tmp/celerybeat-schedule ;;
+esac
 uvicorn main:app --host 0.0.0.0 --port 8001 &
-celery -A celery_app worker --loglevel=info &
-wait
\ No newline at end of file
+celery -A celery_app worker --loglevel=info -Q "$QUEUES" -n "lanes@%h" &
+celery -A celery_app worker --loglevel=info -Q interactive --concurrency=2 -n "interactive@%h" &
+celery -A celery_app beat --loglevel=info --schedule /tmp/celerybeat-schedule &
+wait
@@ -1,4 +1,5 @@
-from fabric import Connection, Config
+# fabric/paramiko/invoke are imported inside the functions that open SSH
+# connections, so importing this module (the API and celery_app do) stays cheap.
 import tempfile, os, stat
 
 def _materialize_key(site: dict) -> str | None:
@@ -31,6 +32,7 @@ def _connect_kwargs(site: dict) -> dict:
     return kw
 
 def _conn_params(site: dict) -> dict:
+    from fabric import Config
     cfg = Config(overrides={"sudo": {"password": site.get("sudo_password") or site.get("password")}})
     params = {
         "host": site["host"],
@@ -49,6 +51,7 @@ def _normalize_site(site: dict) -> dict:
     return site
 
 def run_fabric_task(site, task_name, **kwargs):
+    from fabric import Connection
     import fabric_tasks as ft
     func = getattr(ft, task_name)
     site = _normalize_site(site)  # <— add this
@@ -64,6 +67,7 @@ def run_fabric_task(site, task_name, **kwargs):
             except Exception: pass
 
 def verify_ssh(site: dict) -> dict:
+    from fabric import Connection
     site = _normalize_site(site) 
     key_created = bool(site.get("private_key_pem"))
     key_path = _materialize_key(site)
@@ -79,47 +83,13 @@ def verify_ssh(site: dict) -> dict:
 
             
 def _tool_exists(c, cmd):
-    return c.local(f"command -v {cmd}", hide=True, warn=True).ok
+    from modules.screenshots import find_tool
+    return find_tool(cmd) is not None
 
 def _take_screenshot(c, url: str, out_path: str) -> dict:
     """
-    Try wkhtmltoimage first, then headless Chrome/Chromium.
+    Warm Playwright page pool when available, else wkhtmltoimage, then headless Chrome/Chromium.
     Returns {"ok": bool, "path": out_path, "tool": str, "error": Optional[str]}
     """
-    # Ensure parent dir
-    parent = os.path.dirname(out_path) or "/tmp"
-    c.local(f"mkdir -p {parent}", hide=True, warn=True)
-
-    # 1) wkhtmltoimage
-    if _tool_exists(c, "wkhtmltoimage"):
-        r = c.local(f"wkhtmltoimage --format png --width 1366 --height 0 {url} {out_path}", hide=True, warn=True)
-        if r.ok and _tool_exists(c, "file"):  # sanity check
-            return {"ok": True, "path": out_path, "tool": "wkhtmltoimage", "error": None}
-
-    # 2) Chrome/Chromium
-    for chrome in ("google-chrome", "google-chrome-stable", "chromium-browser"):
-        if _tool_exists(c, chrome):
-            # Many builds allow specifying the output path directly
-            cmd = (
-                f"{chrome} --headless --disable-gpu --hide-scrollbars "
-                f"--window-size=1366,768 --screenshot={out_path} {url}"
-            )
-            r = c.local(cmd, hide=True, warn=True)
-            if r.ok:
-                return {"ok": True, "path": out_path, "tool": chrome, "error": None}
-            # Some builds always write to screenshot.png in CWD; handle that
-            fallback = "screenshot.png"
-            if os.path.exists(fallback):
-                try:
-                    os.replace(fallback, out_path)
-                    return {"ok": True, "path": out_path, "tool": chrome, "error": None}
-                except Exception as mv_e:
-                    return {"ok": False, "path": out_path, "tool": chrome, "error": f"move_failed: {mv_e}"}
-
-    return {
-        "ok": False,
-        "path": out_path,
-        "tool": None,
-        "error": "No screenshot tool found (install wkhtmltoimage or Chrome/Chromium headless)."
-    }
-    
+    from modules.screenshots import take_screenshot
+    return take_screenshot(url, out_path)
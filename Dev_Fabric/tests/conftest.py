@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# modules are imported the way the app does it (`from modules import ...`), relative to Dev_Fabric/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis():
+    """In-memory Redis that runs the modules' Lua scripts (needs fakeredis[lua])."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis(decode_responses=True)
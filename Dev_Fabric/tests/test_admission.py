@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import redis_client
+from config import settings
+
+
+@pytest.fixture
+def api(redis, monkeypatch):
+    import main
+
+    monkeypatch.setattr(redis_client, "get_redis", lambda binary=False: redis)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_SITE_RATE", 0.01)
+    monkeypatch.setattr(settings, "RATE_LIMIT_SITE_BURST", 2)
+    monkeypatch.setattr(main, "AsyncResult", lambda tid, app=None: SimpleNamespace(state="PENDING"))
+    return main
+
+
+class _Task:
+    def __init__(self):
+        self.sent = 0
+
+    def apply_async(self, args=None, kwargs=None, task_id=None, **opts):
+        self.sent += 1
+        return SimpleNamespace(id=task_id or f"t{self.sent}")
+
+
+def test_coalesced_requests_do_not_spend_the_site_bucket(api):
+    task = _Task()
+    site = {"domain": "example.com"}
+    first = api._single_flight(task, "domain_ssl", "example.com", [], {"domain": "example.com"}, site=site)
+    for _ in range(10):     # ten operators open the same site
+        again = api._single_flight(task, "domain_ssl", "example.com", [], {"domain": "example.com"}, site=site)
+        assert again == {"task_id": first["task_id"], "status": "coalesced"}
+    assert task.sent == 1
+
+
+def test_site_bucket_still_limits_real_publishes(api, redis):
+    task = _Task()
+    site = {"domain": "example.com"}
+    for i in range(2):
+        api._single_flight(task, "domain_ssl", "example.com", [], {"n": i}, site=site)
+    with pytest.raises(HTTPException) as exc:
+        api._single_flight(task, "domain_ssl", "example.com", [], {"n": 9}, site=site)
+    assert exc.value.status_code == 429 and "Retry-After" in exc.value.headers
+    assert task.sent == 2
+    # the refused publish does not pin its single-flight key
+    assert len(redis.keys("singleflight:*")) == 2
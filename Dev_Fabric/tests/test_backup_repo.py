@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import io
+import tarfile
+
+import pytest
+
+from modules.backup_repo import BackupRepo, ingest_command
+
+
+def _sql(rows=20000, marker=b""):
+    lines = [b"-- dump\n", b"CREATE TABLE wp_posts (id int, body text);\n"]
+    lines += [b"INSERT INTO wp_posts VALUES (%d, 'post body %d %s');\n" % (i, i, marker) for i in range(rows)]
+    return b"".join(lines)
+
+
+def _targz(files):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        d = tarfile.TarInfo("wp-content")
+        d.type, d.mode, d.mtime = tarfile.DIRTYPE, 0o755, 1700000000
+        tf.addfile(d)
+        for name, body in files.items():
+            ti = tarfile.TarInfo(f"wp-content/{name}")
+            ti.size, ti.mode, ti.mtime = len(body), 0o644, 1700000000
+            tf.addfile(ti, io.BytesIO(body))
+        link = tarfile.TarInfo("wp-content/latest")
+        link.type, link.linkname = tarfile.SYMTYPE, "index.php"
+        tf.addfile(link)
+    return buf.getvalue()
+
+
+def _restored(repo, backup_id):
+    return gzip.decompress(b"".join(repo.restore_stream(backup_id)))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return BackupRepo(str(tmp_path / "repo"))
+
+
+def test_db_roundtrip_is_byte_identical(repo):
+    sql = _sql()
+    row = repo.ingest("example.com", "db", io.BytesIO(gzip.compress(sql)))
+    assert row["content_sha256"] == hashlib.sha256(sql).hexdigest()
+    assert row["size"] == len(sql) and row["chunks"] > 1
+
+    out = _restored(repo, row["id"])
+    assert out == sql
+    assert repo.get(row["id"])["site"] == "example.com"
+
+
+def test_db_dedup_across_backups(repo):
+    first = repo.ingest("a.example", "db", io.BytesIO(gzip.compress(_sql())))
+    again = repo.ingest("b.example", "db", io.BytesIO(gzip.compress(_sql())))
+    assert first["new_bytes"] > 0
+    assert again["new_bytes"] == 0
+    assert repo.stats()["dedup_ratio"] == 2.0
+
+
+def test_content_roundtrip_keeps_members(repo):
+    files = {"index.php": b"<?php // silence\n", "plugins/a/a.php": b"x" * 9_000_000, "empty.txt": b""}
+    row = repo.ingest("example.com", "content", io.BytesIO(_targz(files)))
+    assert row["files"] == 3
+
+    with tarfile.open(fileobj=io.BytesIO(_restored(repo, row["id"]))) as tf:
+        members = {m.name: m for m in tf.getmembers()}
+        assert set(members) == {"wp-content", "wp-content/latest", *(f"wp-content/{n}" for n in files)}
+        assert members["wp-content"].isdir()
+        assert members["wp-content/latest"].issym() and members["wp-content/latest"].linkname == "index.php"
+        for name, body in files.items():
+            m = members[f"wp-content/{name}"]
+            assert tf.extractfile(m).read() == body
+            assert (m.mode, m.mtime) == (0o644, 1700000000)
+
+
+def test_failed_verify_discards_and_gc_reclaims(repo):
+    def verify():
+        raise RuntimeError("remote exited 2")
+
+    with pytest.raises(RuntimeError):
+        repo.ingest("example.com", "db", io.BytesIO(gzip.compress(_sql())), verify=verify)
+    assert repo.list() == []
+    assert repo.gc()["chunks_removed"] > 0
+    assert repo.stats()["chunks"] == 0
+
+
+def test_forget_then_gc_keeps_shared_chunks(repo):
+    old = repo.ingest("example.com", "db", io.BytesIO(gzip.compress(_sql())))
+    new = repo.ingest("example.com", "db", io.BytesIO(gzip.compress(_sql(marker=b"v2"))))
+    assert repo.forget([old["id"]]) == 1
+    repo.gc()
+    assert _restored(repo, new["id"]) == _sql(marker=b"v2")
+
+
+def test_corrupt_gzip_is_rejected(repo):
+    data = gzip.compress(_sql(rows=100))
+    with pytest.raises(Exception):
+        repo.ingest("example.com", "db", io.BytesIO(data[:-4] + b"\0\0\0\0"))
+    assert repo.list() == []
+
+
+class _Channel:
+    def __init__(self, code):
+        self.code = code
+
+    def recv_exit_status(self):
+        return self.code
+
+
+class _Conn:
+    host = "example.com"
+
+    def __init__(self, stdout, stderr, code):
+        self.out, self.err, self.code = stdout, stderr, code
+        self.client = self
+
+    def open(self):
+        pass
+
+    def exec_command(self, command):
+        stdout = io.BytesIO(self.out)
+        stdout.channel = _Channel(self.code)
+        return io.BytesIO(), stdout, io.BytesIO(self.err)
+
+
+def test_ingest_command_with_chatty_stderr(repo):
+    sql = _sql(rows=500)
+    row = ingest_command(_Conn(gzip.compress(sql), b"warning\n" * 60000, 0), repo, "example.com", "db", "dump")
+    assert _restored(repo, row["id"]) == sql
+    assert row["source"] == "example.com"
+
+
+def test_ingest_command_failure_reports_stderr_tail(repo):
+    conn = _Conn(gzip.compress(_sql(rows=500)), b"noise\n" * 60000 + b"mysqldump: Access denied", 2)
+    with pytest.raises(RuntimeError, match=r"exited 2: (?s:.*)Access denied$"):
+        ingest_command(conn, repo, "example.com", "db", "dump")
+    assert repo.list() == []
+
+
+def test_abandoned_tar_restore_stops_its_producer(repo):
+    import os
+    import threading
+    import time
+
+    files = {f"f{i}.bin": os.urandom(200_000) for i in range(40)}
+    row = repo.ingest("example.com", "content", io.BytesIO(_targz(files)))
+    stream = repo.restore_stream(row["id"])
+    next(stream)
+    stream.close()              # client disconnected after the first chunk
+    deadline = time.monotonic() + 5
+    while any(t.name == "repo-restore" for t in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert not any(t.name == "repo-restore" for t in threading.enumerate())
@@ -0,0 +1,104 @@
+import datetime
+import gzip
+import json
+import re
+import shlex
+import subprocess
+
+import pytest
+
+import fabric_tasks as ft
+
+
+class _Clock(datetime.datetime):
+    ticks = 0
+
+    @classmethod
+    def utcnow(cls):
+        cls.ticks += 1
+        return datetime.datetime(2026, 1, 1, 0, 0, cls.ticks)
+
+
+class _Server:
+    """A local shell standing in for the host; mysql/mysqldump are simulated over a binlog directory."""
+
+    def __init__(self, tmp_path):
+        self.binlogs = tmp_path / "mysql"
+        self.binlogs.mkdir()
+        self.write(1)
+        self.minutes = 0
+
+    def write(self, index, data=b"events"):
+        with open(self.binlogs / f"mysql-bin.{index:06d}", "ab") as fh:
+            fh.write(data)
+
+    def files(self):
+        return sorted(p.name for p in self.binlogs.iterdir())
+
+    def flush(self):
+        self.write(ft._binlog_index(self.files()[-1]) + 1, b"")
+
+    def run(self, cmd, hide=None, warn=False, **kw):
+        out = None
+        if cmd.startswith("mysql -N -B -e "):
+            sql = shlex.split(cmd)[-1]
+            if sql == "FLUSH BINARY LOGS":
+                self.flush()
+            out = {"SELECT @@log_bin": "1\n",
+                   "SELECT @@log_bin_basename": f"{self.binlogs}/mysql-bin\n",
+                   "SHOW BINARY LOGS": "".join(f"{n}\t4\n" for n in self.files())}.get(sql, "")
+        elif cmd.startswith("date "):
+            self.minutes += 1
+            out = f"2026-01-01 00:{self.minutes:02d}:00\n"
+        elif "mysqldump --single-transaction" in cmd:
+            self.flush()
+            dest = shlex.split(re.search(r"> (.+)$", cmd).group(1))[0]
+            with gzip.open(dest, "wt") as fh:
+                fh.write(f"-- CHANGE MASTER TO MASTER_LOG_FILE='{self.files()[-1]}', MASTER_LOG_POS=4;\n")
+            out = ""
+        if out is not None:
+            return subprocess.CompletedProcess(cmd, 0, out, "")
+        r = subprocess.run(["bash", "-c", cmd], capture_output=True, text=True)
+        r.ok, r.exited = r.returncode == 0, r.returncode
+        if r.returncode and not warn:
+            raise RuntimeError(f"{cmd!r} exited {r.returncode}: {r.stderr}")
+        return r
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(ft.datetime, "datetime", _Clock)
+    return _Server(tmp_path)
+
+
+def _backup(server, tmp_path, **kw):
+    return ft.backup_db_incremental.body(server, "wp", "u", "p", out_dir=str(tmp_path / "backups"), **kw)
+
+
+def test_new_base_closes_the_old_chain_where_it_starts(server, tmp_path):
+    first = _backup(server, tmp_path)
+    server.write(3, b"written after the base")
+    second = _backup(server, tmp_path, force_full=True)
+    assert (first["mode"], second["mode"]) == ("full", "full")
+
+    old, new = json.loads((tmp_path / "backups/binlog/wp/state.json").read_text())["chains"]
+    assert ft._last_shipped(old) + 1 == ft._binlog_index(new["start_file"])
+    # the file still open when the run started is shipped too, not just the ones FLUSH closed
+    assert "mysql-bin.000004" in [seg["file"] for seg in second["segments"]]
+
+
+def test_restore_refuses_an_old_chain_that_stops_short(server, tmp_path):
+    _backup(server, tmp_path)
+    _backup(server, tmp_path, force_full=True)
+    state_file = tmp_path / "backups/binlog/wp/state.json"
+    state = json.loads(state_file.read_text())
+    old = state["chains"][0]
+    plan = ft.restore_db_pitr.body(server, "wp", "u", "p", old["base_time"], out_dir=str(tmp_path / "backups"),
+                                   dry_run=True)
+    assert plan["ok"] and plan["chain"] == old["id"]
+
+    old["segments"].pop()                    # as written before the tail was shipped
+    state_file.write_text(json.dumps(state))
+    res = ft.restore_db_pitr.body(server, "wp", "u", "p", old["base_time"], out_dir=str(tmp_path / "backups"),
+                                  dry_run=True)
+    assert not res["ok"] and "gap" in res["error"]
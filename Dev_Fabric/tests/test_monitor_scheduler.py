@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import redis_client
+from config import settings
+from modules.monitor_scheduler import MonitorRegistry, window_slices
+
+PERIOD, TICK = 600, 60
+
+
+@pytest.fixture
+def reg(redis):
+    r = MonitorRegistry(redis)
+    for i in range(300):
+        r.register({"url": f"https://s{i}.example", "checks": ["healthcheck"]}, site_id=f"s{i}")
+    return r
+
+
+def test_window_slices_cover_each_phase_once():
+    for start, length in [(0, 60), (570, 60), (590, 600), (1234, 1200)]:
+        slices = window_slices(start, length, PERIOD)
+        covered = sum(hi - lo for lo, hi, _ in slices)
+        assert covered == pytest.approx(min(1.0, length / PERIOD))
+
+
+def test_consecutive_windows_dispatch_every_site_once_per_period(reg):
+    seen = []
+    for w in range(0, PERIOD, TICK):
+        seen += [s for s, _ in reg.due("healthcheck", PERIOD, 10_000 * PERIOD + w, TICK)]
+    assert sorted(seen) == sorted(f"s{i}" for i in range(300))
+
+
+def test_claim_windows_catches_up_after_a_gap(reg):
+    assert reg.claim_windows("healthcheck", upto=1200, first=1140, oldest=600) == 1140
+    assert reg.claim_windows("healthcheck", upto=1200, first=1140, oldest=600) is None    # second beat
+    # beat down for 5 minutes: the next tick starts where the last one stopped
+    assert reg.claim_windows("healthcheck", upto=1560, first=1500, oldest=960) == 1200
+    # down longer than a period: at most one period back
+    assert reg.claim_windows("healthcheck", upto=5000, first=4940, oldest=4400) == 4400
+
+
+def test_tick_dispatches_missed_sites(reg, monkeypatch):
+    import celery_app
+
+    sent = []
+    monkeypatch.setattr(redis_client, "get_redis", lambda binary=False: reg.r)
+    monkeypatch.setattr(settings, "MONITOR_TICK_SECONDS", TICK)
+    monkeypatch.setattr(settings, "MONITOR_HEALTHCHECK_PERIOD", PERIOD)
+    monkeypatch.setattr(settings, "MONITOR_OUTDATED_PERIOD", 0)
+    monkeypatch.setattr(settings, "MONITOR_DOMAIN_SSL_PERIOD", 0)
+    monkeypatch.setattr(celery_app.monitor_check_task, "apply_async",
+                        lambda args, countdown: sent.append((args[0], countdown)))
+
+    base = 1_000_000 * PERIOD
+    for t in [base + 5, base + 65, base + 365, base + 425]:     # ticks at 125..305 never ran
+        monkeypatch.setattr(celery_app.time, "time", lambda t=t: t)
+        celery_app.monitor_tick_task()
+
+    sites = [s for s, _ in sent]
+    assert len(sites) == len(set(sites))                        # nothing twice
+    # everything from base + 60 to base + 540 went out, including the missed windows
+    expected = {s for s, _ in reg.due("healthcheck", PERIOD, base + 60, 480)}
+    assert expected <= set(sites)
+    assert all(0 <= c <= TICK * 2 for _, c in sent)
+
+
+def test_registry_keeps_secrets_out_of_the_site_record(redis):
+    reg = MonitorRegistry(redis)
+    reg.register({"url": "https://a.example", "basic_auth": "admin:s3cret",
+                  "headers": {"Authorization": "Bearer t0ken"}}, site_id="a")
+    raw = redis.hget("mon:sites", "a")
+    assert "s3cret" not in raw and "t0ken" not in raw
+    cfg = reg.get("a")
+    assert reg.credentials(cfg) == {"headers": {"Authorization": "Bearer t0ken"}, "basic_auth": "admin:s3cret"}
+
+    reg.register({"url": "https://a.example"}, site_id="a")      # re-register without credentials
+    assert not redis.keys("cred:*")
+    assert reg.credentials(reg.get("a")) == {"headers": None, "basic_auth": None}
+
+
+def test_registry_reads_legacy_inline_credentials(redis):
+    redis.hset("mon:sites", "old", json.dumps({"url": "https://old.example", "basic_auth": "u:p"}))
+    reg = MonitorRegistry(redis)
+    assert reg.credentials(reg.get("old"))["basic_auth"] == "u:p"
+
+
+def test_credentials_are_encrypted_with_a_key(redis, monkeypatch):
+    fernet = pytest.importorskip("cryptography.fernet")
+    monkeypatch.setattr(settings, "CREDENTIALS_KEY", fernet.Fernet.generate_key().decode())
+    reg = MonitorRegistry(redis)
+    reg.register({"url": "https://a.example", "basic_auth": "admin:s3cret"}, site_id="a")
+    blob = redis.get(f"cred:{reg.get('a')['credentials_ref']}")
+    assert blob.startswith("f1:") and "s3cret" not in blob
+    assert reg.credentials(reg.get("a"))["basic_auth"] == "admin:s3cret"
+    reg.unregister("a")
+    assert not redis.keys("cred:*")
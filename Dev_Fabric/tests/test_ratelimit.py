@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from config import settings
+from modules import ratelimit
+from modules.ratelimit import RateLimiter
+
+
+def test_bucket_allows_burst_then_refuses(redis):
+    rl = RateLimiter(redis)
+    bucket = [("client:a", 0.01, 3)]
+    assert [rl.take(bucket)[0] for _ in range(3)] == [True, True, True]
+    allowed, wait = rl.take(bucket)
+    assert not allowed
+    assert 90 < wait <= 100          # one token at 0.01/s
+
+
+def test_bucket_refills_over_time(redis):
+    rl = RateLimiter(redis)
+    bucket = [("client:a", 20.0, 1)]
+    assert rl.take(bucket)[0]
+    assert not rl.take(bucket)[0]
+    time.sleep(0.1)
+    assert rl.take(bucket)[0]
+
+
+def test_all_or_nothing_across_buckets(redis):
+    rl = RateLimiter(redis)
+    client, site = ("client:a", 0.01, 5), ("site:example.com", 0.01, 1)
+    assert rl.take([client, site])[0]
+    assert not rl.take([client, site])[0]
+    # the refused request was not charged to the client bucket
+    assert float(redis.hget("ratelimit:client:a", "tokens")) == pytest.approx(4, abs=0.01)
+
+
+def test_cost_is_capped_at_smallest_burst(redis):
+    rl = RateLimiter(redis)
+    assert rl.take([("client:a", 0.01, 2)], cost=10)[0]
+    assert not rl.take([("client:a", 0.01, 2)])[0]
+
+
+def test_disabled_buckets_always_pass(redis):
+    rl = RateLimiter(redis)
+    assert rl.take([("client:a", 0, 0)]) == (True, 0.0)
+
+
+def test_site_keys_from_body():
+    body = {"site": {"host": "SSH.Example.com"}, "req": {"base_url": "https://WWW.example.com/x"}}
+    assert ratelimit.site_keys(body) == {"ssh.example.com", "www.example.com"}
+    assert ratelimit.site_keys({"domain": "Example.com"}) == {"example.com"}
+    assert ratelimit.site_keys(["not", "a", "dict"]) == set()
+
+
+def test_admit_backpressure_and_rate_limit(redis, monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_MAX_DEPTH", 10)
+    monkeypatch.setattr(settings, "QUEUE_RETRY_AFTER", 30)
+    monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_RATE", 0.01)
+    monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_BURST", 1)
+    monkeypatch.setattr(settings, "RATE_LIMIT_SITE_RATE", 0.01)
+    monkeypatch.setattr(settings, "RATE_LIMIT_SITE_BURST", 5)
+    depth = {"interactive": 0, "background": 10}
+    monkeypatch.setattr(ratelimit, "queue_depth", lambda keys: depth[keys[0]])
+    rl = RateLimiter(redis)
+
+    reason, retry = ratelimit.admit("c1", ["example.com"], lane="background", limiter=rl)
+    assert "background queue is full" in reason and retry == 30
+
+    assert ratelimit.admit("c1", ["example.com"], limiter=rl) is None
+    reason, retry = ratelimit.admit("c1", ["example.com"], limiter=rl)
+    assert reason == "rate limit exceeded" and retry >= 1
+    assert ratelimit.admit("c2", ["example.com"], limiter=rl) is None
+
+
+def test_queue_depth_sums_priority_lists(redis):
+    redis.rpush("interactive", "a", "b")
+    redis.rpush("interactive:3", "c")
+    assert ratelimit.queue_depth(ratelimit.lane_keys("interactive"), max_age=0, redis=redis) == 3
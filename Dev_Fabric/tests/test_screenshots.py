@@ -0,0 +1,31 @@
+import pytest
+
+from modules import screenshots
+
+
+@pytest.fixture
+def broken_pool(monkeypatch):
+    pool = screenshots.BrowserPool(size=1)
+
+    async def launch():
+        raise RuntimeError("Executable doesn't exist at /ms-playwright/chromium-1105/chrome")
+
+    monkeypatch.setattr(pool, "_launch", launch)
+    monkeypatch.setattr(screenshots, "get_pool", lambda: pool)
+    monkeypatch.setattr(screenshots, "capture_cli",
+                        lambda url, path, timeout=60: {"ok": True, "path": path, "tool": "cli", "error": None})
+    return pool
+
+
+def test_launch_failure_falls_back_to_cli(broken_pool, tmp_path):
+    for _ in range(2):      # the second call must not trip over a half-started pool
+        res = screenshots.take_screenshot("https://example.com", str(tmp_path / "a.png"))
+        assert res["tool"] == "cli" and res["ok"]
+    assert not broken_pool.usable
+    assert "Executable doesn't exist" in broken_pool.error
+
+
+def test_launch_failure_in_batch(broken_pool, tmp_path):
+    jobs = [("https://a.example", str(tmp_path / "a.png")), ("https://b.example", str(tmp_path / "b.png"))]
+    assert [r["tool"] for r in screenshots.take_screenshots(jobs)] == ["cli", "cli"]
+    assert all(not r["ok"] for r in broken_pool.capture_many(jobs))
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from modules.singleflight import SingleFlight, flight_key, normalize_target
+
+
+class _Broker:
+    """Records sent task ids; state_of() answers from `states`."""
+
+    def __init__(self):
+        self.sent = []
+        self.states = {}
+
+    def send(self, task_id):
+        self.sent.append(task_id)
+        self.states[task_id] = "PENDING"
+
+    def state_of(self, task_id):
+        return self.states.get(task_id, "PENDING")
+
+
+def test_key_ignores_target_spelling_and_hides_args():
+    a = flight_key("wp_status", "https://Example.com/", {"password": "s3cret", "x": 1})
+    b = flight_key("wp_status", "https://example.com", {"x": 1, "password": "s3cret"})
+    assert a == b
+    assert "s3cret" not in a
+    assert a != flight_key("wp_status", "https://example.com", {"x": 2})
+    assert normalize_target("Example.COM/") == "example.com"
+
+
+def test_identical_requests_coalesce(redis):
+    sf, broker = SingleFlight(redis), _Broker()
+    key = flight_key("wp_status", "example.com")
+    tid, status = sf.submit(key, broker.send, broker.state_of)
+    assert status == "queued"
+    assert sf.submit(key, broker.send, broker.state_of) == (tid, "coalesced")
+    assert broker.sent == [tid]
+
+
+def test_concurrent_submits_send_once(redis):
+    sf, broker = SingleFlight(redis), _Broker()
+    key = flight_key("wp_status", "example.com")
+    results, start = [], threading.Barrier(8)
+
+    def one():
+        start.wait()
+        results.append(sf.submit(key, broker.send, broker.state_of))
+
+    threads = [threading.Thread(target=one) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(broker.sent) == 1
+    assert {tid for tid, _ in results} == set(broker.sent)
+    assert [s for _, s in results].count("queued") == 1
+
+
+def test_success_is_cached_for_fresh_window(redis):
+    sf, broker = SingleFlight(redis), _Broker()
+    key = flight_key("wp_status", "example.com")
+    tid, _ = sf.submit(key, broker.send, broker.state_of)
+    broker.states[tid] = "SUCCESS"
+    assert sf.finish(key, tid, ok=True, fresh_seconds=60)
+    assert 0 < redis.ttl(key) <= 60
+    assert sf.submit(key, broker.send, broker.state_of) == (tid, "cached")
+
+
+def test_failure_releases_key(redis):
+    sf, broker = SingleFlight(redis), _Broker()
+    key = flight_key("wp_status", "example.com")
+    tid, _ = sf.submit(key, broker.send, broker.state_of)
+    broker.states[tid] = "FAILURE"
+    assert sf.finish(key, tid, ok=False)
+    assert redis.get(key) is None
+    new, status = sf.submit(key, broker.send, broker.state_of)
+    assert status == "queued" and new != tid
+
+
+def test_dead_task_is_replaced(redis):
+    sf, broker = SingleFlight(redis), _Broker()
+    key = flight_key("wp_status", "example.com")
+    tid, _ = sf.submit(key, broker.send, broker.state_of)
+    broker.states[tid] = "REVOKED"
+    new, status = sf.submit(key, broker.send, broker.state_of)
+    assert status == "queued" and new != tid
+    assert redis.get(key) == new
+
+
+def test_finish_of_stale_task_leaves_newer_claim(redis):
+    sf = SingleFlight(redis)
+    key = flight_key("wp_status", "example.com")
+    redis.set(key, "newer")
+    assert not sf.finish(key, "older", ok=False)
+    assert redis.get(key) == "newer"
+
+
+def test_send_failure_releases_key(redis):
+    sf = SingleFlight(redis)
+    key = flight_key("wp_status", "example.com")
+
+    def send(task_id):
+        raise ConnectionError("broker down")
+
+    with pytest.raises(ConnectionError):
+        sf.submit(key, send, lambda t: "PENDING")
+    assert redis.get(key) is None
@@ -0,0 +1,102 @@
+import time
+
+from modules.site_lock import SiteLock, site_key, waiting
+
+
+def _lock(redis, task_id, **kw):
+    return SiteLock("example.com", task_id, redis=redis, **kw)
+
+
+def test_waiters_run_in_arrival_order(redis):
+    a, b, c = _lock(redis, "a"), _lock(redis, "b"), _lock(redis, "c")
+    assert a.acquire() == (True, 0)
+    assert b.acquire() == (False, 0)
+    assert c.acquire() == (False, 1)
+    assert waiting("example.com", redis=redis) == {"site": "example.com", "owner": "a", "queue": ["b", "c"]}
+
+    a.release()
+    # the site is free, but c is not at the head of the queue
+    assert c.acquire() == (False, 1)
+    assert b.acquire() == (True, 0)
+    assert c.acquire() == (False, 0)
+    b.release()
+    assert c.acquire() == (True, 0)
+
+
+def test_reacquire_by_owner_is_idempotent(redis):
+    a = _lock(redis, "a")
+    assert a.acquire() == (True, 0)
+    assert a.acquire() == (True, 0)
+    assert waiting("example.com", redis=redis)["queue"] == []
+
+
+def test_stale_waiter_is_skipped(redis):
+    a, b = _lock(redis, "a", stale=0.05), _lock(redis, "b", stale=0.05)
+    c = _lock(redis, "c", stale=0.05)
+    a.acquire()
+    b.acquire()                     # b queues, then is revoked and never asks again
+    c.acquire()
+    a.release()
+    time.sleep(0.1)
+    assert c.acquire() == (True, 0)
+    assert waiting("example.com", redis=redis)["queue"] == []
+
+
+def test_expired_lease_frees_the_site(redis):
+    a, b = _lock(redis, "a", lease=0.05), _lock(redis, "b")
+    a.acquire()
+    assert b.acquire() == (False, 0)
+    time.sleep(0.1)                 # a's worker died: nobody renews
+    assert b.acquire() == (True, 0)
+
+
+def test_renewal_keeps_the_lease_and_detects_loss(redis):
+    a = _lock(redis, "a", lease=0.15)
+    a.acquire()
+    a.start_renewal()
+    time.sleep(0.4)
+    assert a.owner() == "a" and not a.lost
+
+    redis.delete(a.keys[0])         # lease lost behind our back (e.g. a long stall)
+    time.sleep(0.15)
+    assert a.lost
+    assert not a.release()
+
+
+def test_release_while_waiting_leaves_the_queue(redis):
+    a, b, c = _lock(redis, "a"), _lock(redis, "b"), _lock(redis, "c")
+    a.acquire()
+    b.acquire()
+    c.acquire()
+    with b:
+        pass
+    assert waiting("example.com", redis=redis)["queue"] == ["c"]
+    a.release()
+    assert c.acquire() == (True, 0)
+
+
+def test_site_key_is_shared_by_ssh_and_rest_paths():
+    rest = site_key(url="https://WWW.Example.com/wp-json/")
+    assert rest == "example.com"
+    assert site_key(url="example.com.") == rest                  # SiteConfig.domain
+    assert site_key(host="www.example.com") == rest               # bare SSH host
+    assert site_key(None, None, "203.0.113.7") == "203.0.113.7"
+    assert site_key("Shop-1", "https://example.com", "203.0.113.7") == "shop-1"
+    assert site_key() is None
+
+
+def test_waiting_normalizes_site(redis):
+    _lock(redis, "a").acquire()
+    assert waiting("WWW.Example.com", redis=redis)["owner"] == "a"
+
+
+def test_fabric_and_rest_tasks_lock_the_same_site():
+    import celery_app
+
+    ssh = {"host": "203.0.113.7", "user": "root", "domain": "www.example.com"}
+    assert celery_app._fabric_site({"task_name": "backup_site", "site_config": ssh}) == \
+        celery_app._rest_site({"base_url": "https://example.com/", "site_id": None})
+    assert celery_app._fabric_site({"task_name": "backup_site", "site_config": {**ssh, "site_id": "s1"}}) == \
+        celery_app._rest_site({"base_url": "https://other.example/", "site_id": "S1"})
+    # read-only Fabric tasks take no lock
+    assert celery_app._fabric_site({"task_name": "wp_status", "site_config": ssh}) is None
@@ -0,0 +1,63 @@
+import subprocess
+
+import pytest
+
+import fabric_tasks as ft
+
+
+class _Local:
+    """Runs commands in a local shell, raising like invoke unless warn=True."""
+
+    def run(self, cmd, hide=None, warn=False, **kw):
+        r = subprocess.run(["bash", "-c", cmd], capture_output=True, text=True)
+        if r.returncode and not warn:
+            raise RuntimeError(f"{cmd!r} exited {r.returncode}: {r.stderr}")
+        return r
+
+
+@pytest.fixture
+def site(tmp_path):
+    live, snap = tmp_path / "wp-content", tmp_path / "snap"
+    (live / "plugins").mkdir(parents=True)
+    (live / "plugins" / "new.php").write_text("updated")
+    (snap / "plugins").mkdir(parents=True)
+    (snap / "plugins" / "old.php").write_text("original")
+    return live, snap
+
+
+def _copy(c, snap):
+    return lambda tmp: c.run(f"cp -a {ft.Q(str(snap))} {ft.Q(tmp)}")
+
+
+def test_swap_in_replaces_live_with_complete_copy(site):
+    live, snap = site
+    c = _Local()
+    ft._ReflinkSnapshot().swap_in(c, str(live), _copy(c, snap))
+    assert [p.name for p in (live / "plugins").iterdir()] == ["old.php"]
+    assert not (live.parent / "wp-content.failed").exists()
+    assert not (live.parent / "wp-content.restoring").exists()
+
+
+def test_failed_copy_leaves_live_untouched(site):
+    live, snap = site
+    c = _Local()
+
+    def partial(tmp):
+        c.run(f"mkdir {ft.Q(tmp)} && touch {ft.Q(tmp)}/half")
+        raise RuntimeError("cp: No space left on device")
+
+    with pytest.raises(RuntimeError):
+        ft._ReflinkSnapshot().swap_in(c, str(live), partial)
+    assert (live / "plugins" / "new.php").read_text() == "updated"
+    assert not (live.parent / "wp-content.restoring").exists()
+
+
+def test_original_left_in_failed_by_a_crash_is_recovered_first(site):
+    live, snap = site
+    failed = live.parent / "wp-content.failed"
+    live.rename(failed)                       # crashed between the two renames
+    c = _Local()
+    with pytest.raises(RuntimeError):
+        ft._ReflinkSnapshot().swap_in(c, str(live), lambda tmp: c.run("false"))
+    assert (live / "plugins" / "new.php").read_text() == "updated"
+    assert not failed.exists()
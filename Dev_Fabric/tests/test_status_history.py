@@ -0,0 +1,50 @@
+import pytest
+
+from modules.status_history import StatusHistory
+
+
+def _status(akismet, latest="6.5"):
+    return {
+        "core": {"installed": "6.5", "updates": [] if latest == "6.5" else [{"response": "upgrade", "version": latest}]},
+        "plugins": {"list": [{"plugin_file": "akismet/akismet.php", "slug": "akismet", "name": "Akismet",
+                              "version": akismet, "active": True}]},
+        "themes": {"list": []},
+    }
+
+
+@pytest.fixture
+def hist():
+    fakeredis = pytest.importorskip("fakeredis")
+    return StatusHistory(fakeredis.FakeRedis())
+
+
+def test_latest_state_comes_from_last_without_reading_columns(hist, monkeypatch):
+    hist.ingest("a.com", _status("5.3"), ts=100.0)
+    hist.ingest("a.com", _status("5.3"), ts=200.0)            # unchanged: no event
+    hist.ingest("a.com", _status("5.4", latest="6.6"), ts=300.0)
+
+    replayed = hist.state_at("a.com", 10_000.0)
+    monkeypatch.setattr(hist, "events", lambda *a, **k: pytest.fail("latest state replayed the columns"))
+    current = hist.state_at("a.com")
+    assert current == replayed
+    assert current["plugin:akismet"]["installed"] == "5.4"
+    assert current["plugin:akismet"]["since"] == 300.0
+    assert current["core"]["update_available"] is True
+
+
+def test_historical_state_replays_up_to_ts(hist):
+    hist.ingest("a.com", _status("5.3"), ts=100.0)
+    hist.ingest("a.com", {"core": {"installed": "6.5"}, "plugins": {"list": []}, "themes": {"list": []}}, ts=200.0)
+    assert hist.state_at("a.com", 150.0)["plugin:akismet"]["installed"] == "5.3"
+    assert "plugin:akismet" not in hist.state_at("a.com", 250.0)
+    assert "plugin:akismet" not in hist.state_at("a.com")
+
+
+def test_records_without_since_fall_back_to_replay(hist):
+    hist.ingest("a.com", _status("5.3"), ts=100.0)
+    k = hist._k("a.com", "last")
+    for item, enc in hist.r.hgetall(k).items():           # layout written before `since` existed
+        hist.r.hset(k, item, b",".join(enc.split(b",")[:3]))
+    assert hist.state_at("a.com")["plugin:akismet"]["since"] == 100.0
+    hist.ingest("a.com", _status("5.3"), ts=200.0)         # same state: still no new event
+    assert len(hist.events("a.com")) == 2
@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from modules import transfer
+
+UNIT = 1024
+
+
+class _RemoteFile:
+    def __init__(self, data, fail_at=None, jitter=False):
+        self.data, self.fail_at, self.jitter = data, fail_at, jitter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def readv(self, ranges):
+        for off, n in ranges:
+            if self.fail_at is not None and off // UNIT == self.fail_at:
+                raise IOError("connection reset")
+            if self.jitter:
+                time.sleep(random.random() / 500)
+            # hand it back in pieces, like paramiko does per SFTP request
+            for i in range(off, off + n, 300):
+                yield self.data[i:min(i + 300, off + n)]
+
+
+class _SFTP:
+    def __init__(self, remote):
+        self.remote = remote
+
+    def stat(self, path):
+        return SimpleNamespace(st_size=len(self.remote.data), st_mtime=1700000000)
+
+    def open(self, path, mode):
+        return self.remote
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    monkeypatch.setattr(transfer, "UNIT", UNIT)
+    r = _RemoteFile(b"")
+    monkeypatch.setattr(transfer, "open_sftp", lambda transport, **kw: _SFTP(r))
+    return r
+
+
+def test_download_single_stream(remote, tmp_path):
+    remote.data = os.urandom(10 * UNIT + 17)
+    local = str(tmp_path / "site" / "db.sql")
+    stats = transfer.download(object(), "/remote/db.sql", local)
+
+    with open(local, "rb") as fh:
+        assert fh.read() == remote.data
+    assert stats["sha256"] == hashlib.sha256(remote.data).hexdigest()
+    assert stats["workers"] == 1 and stats["resumed_bytes"] == 0
+    assert not os.path.exists(local + ".part") and not os.path.exists(local + ".part.json")
+
+
+def test_download_resumes_after_failure(remote, tmp_path):
+    remote.data = os.urandom(10 * UNIT + 17)
+    local = str(tmp_path / "db.sql")
+    remote.fail_at = 4
+    with pytest.raises(IOError):
+        transfer.download(object(), "/remote/db.sql", local)
+    assert os.path.exists(local + ".part.json")
+
+    remote.fail_at = None
+    stats = transfer.download(object(), "/remote/db.sql", local)
+    assert stats["resumed_bytes"] == 4 * UNIT
+    assert stats["bytes"] == len(remote.data) - 4 * UNIT
+    assert stats["sha256"] == hashlib.sha256(remote.data).hexdigest()
+    with open(local, "rb") as fh:
+        assert fh.read() == remote.data
+
+
+def test_resume_ignores_sidecar_of_changed_remote(remote, tmp_path):
+    remote.data = os.urandom(6 * UNIT)
+    local = str(tmp_path / "db.sql")
+    remote.fail_at = 3
+    with pytest.raises(IOError):
+        transfer.download(object(), "/remote/db.sql", local)
+
+    remote.data, remote.fail_at = os.urandom(6 * UNIT + 1), None
+    stats = transfer.download(object(), "/remote/db.sql", local)
+    assert stats["resumed_bytes"] == 0
+    assert stats["sha256"] == hashlib.sha256(remote.data).hexdigest()
+
+
+def test_parallel_out_of_order_digest_and_gzip(remote, tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "PARALLEL_MIN_SIZE", 0)
+    remote.data = gzip.compress(os.urandom(40 * UNIT))
+    remote.jitter = True
+    local = str(tmp_path / "wp-content.tar.gz")
+    stats = transfer.download(object(), "/remote/wp-content.tar.gz", local, parallel=4)
+
+    assert stats["workers"] == 4 and stats["mode"] == "parallel"
+    assert stats["sha256"] == hashlib.sha256(remote.data).hexdigest()
+    assert stats["gzip"]["ok"] is True
+    assert transfer.verify(stats, hashlib.sha256(remote.data).hexdigest()) is None
+
+
+def test_digest_is_fed_off_the_worker_threads(remote, tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "PARALLEL_MIN_SIZE", 0)
+    remote.data = os.urandom(12 * UNIT)
+    feeders = set()
+    add = transfer._OrderedDigest.add
+
+    def spy(self, i, data):
+        if data is not None:
+            feeders.add(threading.current_thread().name)
+        add(self, i, data)
+
+    monkeypatch.setattr(transfer._OrderedDigest, "add", spy)
+    stats = transfer.download(object(), "/remote/db.sql", str(tmp_path / "db.sql"), parallel=3)
+    assert feeders == {"transfer-digest"}
+    assert stats["sha256"] == hashlib.sha256(remote.data).hexdigest()
+
+
+def test_digest_failure_stops_the_download(remote, tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "PARALLEL_MIN_SIZE", 0)
+    remote.data = os.urandom(40 * UNIT)
+
+    def broken(self, i, data):
+        raise OSError("pread failed")
+
+    monkeypatch.setattr(transfer._OrderedDigest, "add", broken)
+    with pytest.raises(OSError, match="pread"):
+        transfer.download(object(), "/remote/db.sql", str(tmp_path / "db.sql"), parallel=4, resume=False)
+
+
+def test_truncated_gzip_is_reported(remote, tmp_path):
+    remote.data = gzip.compress(os.urandom(5 * UNIT))[:-9]
+    stats = transfer.download(object(), "/remote/db.sql.gz", str(tmp_path / "db.sql.gz"))
+    assert stats["gzip"]["ok"] is False
+    assert "gzip" in transfer.verify(stats)
+
+
+def test_ordered_digest_rereads_past_buffer_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "UNIT", UNIT)
+    data = os.urandom(8 * UNIT + 100)
+    path = tmp_path / "f"
+    path.write_bytes(data)
+    units = [data[i * UNIT:(i + 1) * UNIT] for i in range(9)]
+
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        digest = transfer._OrderedDigest(fd, len(data), gzip_check=False, max_buffer=2 * UNIT)
+        for i in [3, 1, 2, 8, 5, 4, 7, 6]:
+            digest.add(i, units[i])
+        assert digest.next == 0
+        digest.add(0, units[0])
+    finally:
+        os.close(fd)
+    assert digest.next == 9
+    assert digest.sha256.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert digest.reread > 0 and digest.buffered == 0 and not digest.pending
+
+
+def test_path_lock_excludes_second_download(tmp_path):
+    local = transfer.stable_local_path(str(tmp_path), "host", "/remote/db.sql")
+    first = transfer.PathLock(local).acquire()
+    with pytest.raises(TimeoutError):
+        transfer.PathLock(local).acquire(timeout=0.3)
+    first.release()
+    transfer.PathLock(local).acquire(timeout=0.3).release()
@@ -0,0 +1,28 @@
+import json
+from types import SimpleNamespace
+
+import fabric_tasks as ft
+
+
+class _Conn:
+    """Answers wp-cli like a host where root is refused without --allow-root."""
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, cmd, hide=None, warn=False, **kw):
+        self.commands.append(cmd)
+        ok = " wp " not in f" {cmd}" or "--allow-root" in cmd
+        out = json.dumps([{"name": "akismet", "status": "Updated"}]) if ok else ""
+        err = "" if ok else "Error: YIKES! It looks like you're running this as root."
+        return SimpleNamespace(exited=0 if ok else 1, stdout=out, stderr=err, ok=ok, command=cmd,
+                               hide=(), pty=False, tail=lambda *a, **k: err)
+
+
+def test_update_runs_as_root_without_rolling_back():
+    c = _Conn()
+    res = ft._update_or_rollback(c, "/var/www/html", "db", "u", "p", {"db_dump": "/tmp/x.sql"},
+                                 None, {}, None)
+    assert res["updated"] is True
+    assert res["details"]["plugins"][0]["name"] == "akismet"
+    assert any("plugin update --all" in cmd and "--allow-root" in cmd for cmd in c.commands)
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+import redis_client
+from modules import update_waves as uw
+from modules.credentials import CredentialStore
+
+
+@pytest.fixture
+def wave(redis, monkeypatch):
+    import celery_app
+
+    monkeypatch.setattr(redis_client, "get_redis", lambda binary=False: redis)
+    monkeypatch.setattr(uw, "resolve_host", lambda url: url.split("//")[1].split(".")[0])
+    ref = CredentialStore(redis).put({"auth": {"username": "u", "password": "s3cret"}})
+    targets = [{"base_url": f"https://h{i}.example", "credentials_ref": ref} for i in range(4)]
+    state = uw.plan_wave(targets, max_in_flight=4, canary=0, wave_id="w1")
+    uw.save(redis, state)
+    return SimpleNamespace(app=celery_app, redis=redis, ref=ref)
+
+
+def _broker(monkeypatch, app, fail_on=None):
+    sent = []
+
+    def apply_async(kwargs, link=None, link_error=None, **opts):
+        if len(sent) == fail_on:
+            raise ConnectionError("broker down")
+        sent.append(kwargs)
+        return SimpleNamespace(id=f"task-{len(sent)}")
+
+    monkeypatch.setattr(app.wp_update_all_task, "apply_async", apply_async)
+    return sent
+
+
+def test_publish_failure_keeps_state_consistent(wave, monkeypatch):
+    sent = _broker(monkeypatch, wave.app, fail_on=2)
+    with pytest.raises(ConnectionError):
+        wave.app._wave_pump("w1")
+
+    state = uw.load(wave.redis, "w1")
+    assert len(sent) == 2
+    # the two published targets are in flight with their task ids; the rest is pending again
+    assert set(state["in_flight"]) == set(state["task_ids"]) and len(state["task_ids"]) == 2
+    assert sum(len(q) for q in state["pending"].values()) == 2
+
+    sent = _broker(monkeypatch, wave.app)
+    state = wave.app._wave_pump("w1")
+    assert len(sent) == 2 and len(state["task_ids"]) == 4 and not state["pending"]
+
+
+def test_secrets_only_reach_the_task_and_are_dropped_when_done(wave, monkeypatch):
+    sent = _broker(monkeypatch, wave.app)
+    wave.app._wave_pump("w1")
+    assert "s3cret" not in wave.redis.get("wave:w1")
+    assert all(kw["auth"] == {"username": "u", "password": "s3cret"} and "credentials_ref" not in kw for kw in sent)
+
+    for tid in ["t0", "t1", "t2", "t3"]:
+        wave.app._wave_record("w1", tid, ok=True)
+    assert uw.load(wave.redis, "w1")["status"] == "done"
+    assert CredentialStore(wave.redis).get(wave.ref) == {}
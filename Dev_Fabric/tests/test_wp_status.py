@@ -0,0 +1,64 @@
+import json
+
+from modules.wp_status import WPStatus, coerce_status_dict
+
+NEW = {
+    "core": {"installed": "6.4.3", "updates": [{"response": "upgrade", "version": "6.5.2"}]},
+    "plugins": {"list": [
+        {"plugin_file": "akismet/akismet.php", "name": "Akismet Anti-Spam", "version": "5.3",
+         "latest_version": "5.3.1", "update_available": True, "active": True},
+        {"plugin_file": "hello.php", "name": "Hello Dolly", "version": "1.7.2", "active": False},
+        {"plugin_file": "woocommerce/woocommerce.php", "slug": "woocommerce", "name": "WooCommerce",
+         "version": "8.0", "latest_version": "8.0"},
+    ]},
+    "themes": {"list": [{"stylesheet": "twentytwentyfour", "installed": "1.0", "available": "1.1"}]},
+}
+
+LEGACY = {
+    "core": {"current_version": "6.4.3", "latest_version": "6.4.3"},
+    "plugins": [{"file": "akismet/akismet.php", "name": "Akismet Anti-Spam", "installed": "5.3", "available": "5.3.1"}],
+    "themes": [],
+    "php_mysql": {"php_version": "8.2", "mysql_version": "8.0"},
+}
+
+
+def test_resolve_by_name_slug_dir_and_file():
+    st = WPStatus(NEW)
+    tokens = ["akismet anti-spam", "WooCommerce", "akismet", "hello.php", " ", None]
+    assert st.resolve(tokens) == ["akismet/akismet.php", "woocommerce/woocommerce.php",
+                                  "akismet/akismet.php", "hello.php"]
+
+
+def test_resolve_keeps_explicit_files_and_unknown_tokens():
+    st = WPStatus(NEW)
+    assert st.resolve(["not-installed/x.php", "mystery-plugin"]) == ["not-installed/x.php", "mystery-plugin"]
+    # a directory-looking token with a slash is not matched against plugin dirs
+    assert st.resolve(["akismet/"]) == ["akismet/"]
+    assert st.resolve(None) == []
+
+
+def test_outdated_and_versions_from_new_schema():
+    st = WPStatus.of({"result": {"raw": NEW}})
+    assert st.schema == "new"
+    assert st.outdated_plugins() == ["akismet/akismet.php"]
+    assert st.outdated_plugins(blocklist=["akismet/akismet.php"]) == []
+    assert st.versions_map()["woocommerce/woocommerce.php"] == {"current": "8.0", "latest": "8.0"}
+    assert st.core_view() == {"current": "6.4.3", "latest": "6.5.2", "update_available": True}
+    assert [t.update_available for t in st.themes] == [True]
+
+
+def test_legacy_schema_and_json_body():
+    st = WPStatus.of(json.dumps(LEGACY))
+    assert st.schema == "legacy"
+    assert st.resolve(["akismet"]) == ["akismet/akismet.php"]
+    summary = st.outdated_summary()
+    assert [p["name"] for p in summary["plugins_outdated"]] == ["Akismet Anti-Spam"]
+    assert summary["core_update_available"] is False
+    assert (summary["php_version"], summary["mysql_version"]) == ("8.2", "8.0")
+
+
+def test_of_reuses_parsed_status():
+    st = WPStatus(NEW)
+    assert WPStatus.of(st) is st
+    assert coerce_status_dict(st) is NEW
+    assert WPStatus.of("not json").schema == "unknown"
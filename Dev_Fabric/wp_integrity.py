@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# wp_integrity.py — uploaded to the droplet by fabric_tasks.integrity_scan.
+# Stdlib only (runs on the stock python3 of Ubuntu/Debian images).
+#
+# Keeps a SQLite cache of path -> (size, mtime_ns, sha256) per docroot and only
+# rehashes files whose size or mtime changed, so a repeat scan of an unchanged
+# 50k-file site is one directory walk + one SELECT. `wp core verify-checksums`
+# / `wp plugin verify-checksums` only run when core files / that plugin changed
+# (or on the first scan / --full); their last results are cached as well.
+# Prints one compact JSON report on stdout.
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_EXCLUDES = ("wp-content/cache/", "wp-content/upgrade/", "wp-content/backups/",
+                    "wp-content/uploads/cache/", ".git/")
+CORE_PREFIXES = ("wp-admin/", "wp-includes/")
+READ_SIZE = 1 << 20
+
+
+def walk(root, excludes):
+    """Yield (relpath, size, mtime_ns) for regular files under root."""
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel_dir) if rel_dir else root)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                rel = f"{rel_dir}{e.name}"
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        if not (rel + "/").startswith(excludes):
+                            stack.append(rel + "/")
+                    elif e.is_file(follow_symlinks=False):
+                        if not rel.startswith(excludes):
+                            st = e.stat(follow_symlinks=False)
+                            yield rel, st.st_size, st.st_mtime_ns
+                except OSError:
+                    continue
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(READ_SIZE), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def open_cache(path):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)")
+    db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+    return db
+
+
+def meta_get(db, key, default=None):
+    row = db.execute("SELECT v FROM meta WHERE k=?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+def meta_set(db, key, value):
+    db.execute("INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)", (key, json.dumps(value)))
+
+
+def run_wp(wp_cmd, wp_path, args):
+    cmd = f"{wp_cmd} --path={shlex.quote(wp_path)} {args}"
+    r = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    return r.returncode, r.stdout, r.stderr
+
+
+def verify_core(wp_cmd, wp_path):
+    code, out, err = run_wp(wp_cmd, wp_path, "core verify-checksums")
+    failures = []
+    for line in (out + "\n" + err).splitlines():
+        if line.startswith("Warning:") and ":" in line[8:]:
+            msg, _, path = line[8:].rpartition(":")
+            failures.append({"file": path.strip(), "message": msg.strip()})
+    return {"ok": code == 0, "failures": failures,
+            "error": None if code == 0 or failures else (err.strip() or out.strip())[:500]}
+
+
+def verify_plugins(wp_cmd, wp_path, slugs):
+    if not slugs:
+        return {}
+    code, out, err = run_wp(wp_cmd, wp_path, "plugin verify-checksums " + " ".join(shlex.quote(s) for s in slugs)
+                            + " --format=json")
+    per = {s: {"ok": True, "failures": []} for s in slugs}
+    try:
+        rows = json.loads(out or "[]")
+    except ValueError:
+        rows = []
+    for row in rows:
+        slug = row.get("plugin_name")
+        if slug in per:
+            per[slug]["ok"] = False
+            per[slug]["failures"].append({"file": row.get("file"), "message": row.get("message")})
+    # plugins outside wordpress.org have no checksums: mark them unverifiable, not failed
+    for line in err.splitlines():
+        if "Could not retrieve the checksums" in line:
+            for s in slugs:
+                if f"'{s}'" in line or f" {s} " in line or line.rstrip().endswith(s):
+                    per[s] = {"ok": None, "failures": [], "skipped": "no checksums published"}
+    return per
+
+
+def scan(args):
+    started = time.time()
+    root = os.path.realpath(args.path)
+    excludes = tuple(DEFAULT_EXCLUDES) + tuple(args.exclude or ())
+    # the cache decides what is rehashed: keep it private to the scanning user
+    os.makedirs(args.cache_dir, mode=0o700, exist_ok=True)
+    os.chmod(args.cache_dir, 0o700)
+    cache_file = os.path.join(args.cache_dir, hashlib.sha1(root.encode()).hexdigest()[:16] + ".sqlite")
+    db = open_cache(cache_file)
+    if args.full:
+        db.execute("DELETE FROM files")
+
+    known = {p: (s, m, h) for p, s, m, h in db.execute("SELECT path, size, mtime_ns, sha256 FROM files")}
+    baseline = not known
+
+    seen = set()
+    to_hash = []          # (rel, size, mtime, old_hash or None)
+    for rel, size, mtime in walk(root, excludes):
+        seen.add(rel)
+        old = known.get(rel)
+        if old is None or old[0] != size or old[1] != mtime:
+            to_hash.append((rel, size, mtime, old[2] if old else None))
+
+    with ThreadPoolExecutor(max_workers=args.workers) as ex:
+        hashes = list(ex.map(lambda t: sha256_file(os.path.join(root, t[0])), to_hash))
+
+    added, modified, touched = [], [], []
+    upserts = []
+    for (rel, size, mtime, old_hash), new_hash in zip(to_hash, hashes):
+        if new_hash is None:
+            continue
+        upserts.append((rel, size, mtime, new_hash))
+        if old_hash is None:
+            added.append(rel)
+        elif old_hash != new_hash:
+            modified.append(rel)
+        else:
+            touched.append(rel)      # mtime changed, content identical
+    removed = [p for p in known if p not in seen]
+
+    with db:
+        db.executemany("INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)", upserts)
+        db.executemany("DELETE FROM files WHERE path=?", ((p,) for p in removed))
+
+    changed = added + modified + removed
+    core_changed = baseline or any(p.startswith(CORE_PREFIXES) or "/" not in p for p in changed)
+    plugins_changed = sorted({p.split("/")[2] for p in changed
+                              if p.startswith("wp-content/plugins/") and p.count("/") >= 3})
+
+    report = {
+        "ok": True, "path": root, "baseline": baseline,
+        "files": len(seen), "hashed": len(to_hash),
+        "counts": {"added": len(added), "modified": len(modified), "removed": len(removed),
+                   "touched": len(touched)},
+    }
+    if not baseline:
+        cap = args.max_items
+        report["added"] = sorted(added)[:cap]
+        report["modified"] = sorted(modified)[:cap]
+        report["removed"] = sorted(removed)[:cap]
+    # PHP dropped into uploads is the classic webshell location
+    report["uploads_php"] = sorted(p for p in (added if not baseline else seen)
+                                   if p.startswith("wp-content/uploads/") and p.endswith((".php", ".phtml", ".phar")))[:args.max_items]
+
+    if args.wp:
+        core = meta_get(db, "core_checksums")
+        if core is None or core_changed or args.full:
+            core = verify_core(args.wp, root)
+            meta_set(db, "core_checksums", core)
+            report["core_verified"] = True
+        else:
+            report["core_verified"] = False
+        plugin_results = meta_get(db, "plugin_checksums", {})
+        if baseline or args.full:
+            plugins_dir = os.path.join(root, "wp-content", "plugins")
+            try:
+                plugins_changed = sorted(e.name for e in os.scandir(plugins_dir) if e.is_dir())
+            except OSError:
+                plugins_changed = []
+        for slug in plugins_changed:
+            plugin_results.pop(slug, None)
+        present = [s for s in plugins_changed if os.path.isdir(os.path.join(root, "wp-content", "plugins", s))]
+        plugin_results.update(verify_plugins(args.wp, root, present))
+        meta_set(db, "plugin_checksums", plugin_results)
+        db.commit()
+        report["plugins_verified"] = present
+        report["core_checksums"] = core
+        report["plugin_checksums"] = {s: r for s, r in plugin_results.items() if r.get("ok") is False}
+        report["ok"] = core.get("ok", True) and not report["plugin_checksums"]
+
+    if not baseline and (modified or report["uploads_php"]):
+        report["ok"] = False
+    report["elapsed_s"] = round(time.time() - started, 3)
+    db.close()
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Incremental WordPress file-integrity scan")
+    ap.add_argument("--path", required=True, help="WordPress docroot")
+    ap.add_argument("--cache-dir", default="/var/lib/nh-amc/integrity")
+    ap.add_argument("--wp", default="", help="wp-cli command, e.g. 'wp --allow-root' (empty = skip checksums)")
+    ap.add_argument("--exclude", action="append", help="extra relative path prefix to skip")
+    ap.add_argument("--full", action="store_true", help="drop the cache and rehash everything")
+    ap.add_argument("--max-items", type=int, default=200)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+    try:
+        report = scan(args)
+    except Exception as e:
+        report = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    json.dump(report, sys.stdout, separators=(",", ":"))
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
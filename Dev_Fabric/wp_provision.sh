@@ -740,6 +740,37 @@ else
   mark_warn "MySQL unavailable after install/start (see /tmp/.mysql_install.log and journalctl -u mysql)"
 fi
 
+# -------------------- Binary log (incremental / point-in-time DB backups) --------------------
+S_BINLOG="off"
+if [ "$S_DB" = "ok" ]; then
+  BINLOG_CNF=/etc/mysql/mysql.conf.d/zz-binlog.cnf
+  if [ ! -f "$BINLOG_CNF" ]; then
+    cat >"$BINLOG_CNF" <<'CNF'
+[mysqld]
+server-id=1
+log_bin=binlog
+binlog_format=ROW
+sync_binlog=1
+# small segments: each incremental backup ships only the files closed since the last one
+max_binlog_size=64M
+binlog_expire_logs_seconds=604800
+CNF
+  fi
+  if [ "$(mysql -N -B -e 'SELECT @@log_bin' 2>/dev/null)" != "1" ]; then
+    log "Enabling MySQL binary log (restart)…"
+    safe systemctl restart mysql
+    for i in {1..30}; do mysqladmin ping --silent >/dev/null 2>&1 && break; sleep 1; done
+  else
+    # already on (MySQL 8 default): apply the dynamic settings without a restart
+    safe mysql -e "SET GLOBAL max_binlog_size=67108864; SET GLOBAL binlog_expire_logs_seconds=604800"
+  fi
+  if [ "$(mysql -N -B -e 'SELECT @@log_bin' 2>/dev/null)" = "1" ]; then
+    S_BINLOG="on"
+  else
+    mark_warn "MySQL binary log could not be enabled (incremental DB backups unavailable)"
+  fi
+fi
+
 # -------------------- PHP --------------------
 detect_php_version
 if [ -n "$PHP_EFF_VER" ] && (service_active "php${PHP_EFF_VER}-fpm" || ls /run/php/php*-fpm.sock >/dev/null 2>&1); then
@@ -1182,6 +1213,7 @@ mkdir -p "$(dirname "$REPORT_PATH")" 2>/dev/null || true
   echo "  \"db_mode\": \"${DB_MODE}\","
   echo "  \"nginx\": \"${S_NGINX}\","
   echo "  \"mysql\": \"${S_DB}\","
+  echo "  \"binlog\": \"${S_BINLOG}\","
   echo "  \"wordpress\": \"${S_WP}\","
   echo "  \"wordpress_version_installed\": \"${WP_EFF_VER}\","
   echo "  \"ufw\": \"${S_UFW}\","